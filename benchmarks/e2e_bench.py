@@ -0,0 +1,275 @@
+"""
+Сквозной бенчмарк обработки ссылок без сети: handle_links вызывается
+на синтетических сообщениях, внешние сервисы заменены локальными стендами
+(benchmarks.stand_ins), Telegram Bot API - локальной заглушкой
+(benchmarks.fake_telegram). Скачивание, ffprobe/ffmpeg, склейка и загрузка
+выполняются по-настоящему.
+
+Запуск: python -m benchmarks.e2e_bench [--concurrency 8] [--requests 100]
+        [--mix video=3,vk_video=2,vk_post=2,twitter=2,instagram=1]
+        [--upstream-latency 50] [--json result.json] [--compare baseline.json]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import re
+import resource
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Формы ссылок по платформам; {id}/{n} уникальны, чтобы не попадать в кэш file_id
+URL_TEMPLATES: Dict[str, str] = {
+    'video': "https://www.youtube.com/watch?v={id}",
+    'vk_video': "https://vk.com/video-{n}_{n}",
+    'vk_post': "https://vk.com/wall-{n}_{n}",
+    'twitter': "https://x.com/bench/status/{n}",
+    'instagram': "https://www.instagram.com/p/{id}/",
+}
+
+DEFAULT_MIX = "video=3,vk_video=2,vk_post=2,twitter=2,instagram=1"
+
+
+def parse_mix(text: str) -> Dict[str, int]:
+    """'video=3,twitter=1' -> {'video': 3, 'twitter': 1}"""
+    mix = {}
+    for item in filter(None, text.split(',')):
+        name, _, weight = item.partition('=')
+        if name not in URL_TEMPLATES:
+            raise SystemExit(f"Unknown platform {name!r}, expected one of {', '.join(URL_TEMPLATES)}")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+def build_plan(size: int, mix: Dict[str, int], rnd: random.Random, counter: itertools.count) -> List[Tuple[str, str]]:
+    platforms = list(mix)
+    weights = [mix[p] for p in platforms]
+    plan = []
+    for platform in rnd.choices(platforms, weights, k=size):
+        n = next(counter)
+        plan.append((platform, URL_TEMPLATES[platform].format(id=f"bench{n:08d}", n=n)))
+    return plan
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def usage() -> Tuple[float, float]:
+    """CPU секунды (процесс + дочерние ffmpeg/ffprobe) и пиковый RSS (МБ)"""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+    # ru_maxrss: килобайты в Linux, байты в macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return cpu, (own.ru_maxrss + children.ru_maxrss) / scale
+
+
+def prepare_environment(workdir: str):
+    """
+    Рабочая папка бота (downloads/, логи) и кэш file_id - во временной папке,
+    чтобы не трогать данные настоящего бота. Вызывается до импорта модулей бота
+    """
+    os.environ['FILE_CACHE_PATH'] = os.path.join(workdir, 'file_cache.sqlite3')
+    os.environ.setdefault('BOT_TOKEN', '123456:BENCH')
+    os.chdir(workdir)
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+
+
+def patch_bot_modules(stand_in):
+    """Перенаправляет сетевые обращения бота на стенд"""
+    import services.downloader as downloader
+    from benchmarks.stand_ins import NitterParser
+    from handlers.twitter import twitter_handler
+    from services.http_client import http_client
+
+    http_client.request_class = stand_in.request_class()
+
+    # yt-dlp ходит в сеть сам, мимо http_client - отдаем ему прямую ссылку на файл стенда
+    original = downloader._run_download
+
+    async def run_download(func, url: str) -> str:
+        name = re.sub(r'\W+', '_', url).strip('_')[-48:] + '.mp4'
+        return await original(func, stand_in.media_url(name))
+
+    downloader._run_download = run_download
+    # Selenium парсер требует Chrome и сеть
+    twitter_handler.parser = NitterParser()
+
+
+def make_message(bot, user_id: int, message_id: int, text: str):
+    from aiogram.types import Message
+
+    return Message.model_validate({
+        'message_id': message_id,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': f"user{user_id}"},
+        'text': text,
+    }, context={'bot': bot})
+
+
+async def run_plan(bot, plan: List[Tuple[str, str]], concurrency: int) -> Dict[str, List[float]]:
+    """
+    concurrency пользователей; каждый отправляет следующую ссылку из плана,
+    только когда бот закончил с предыдущей (как живой пользователь)
+    """
+    from handlers.base import handle_links
+
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    queue = iter(enumerate(plan))
+
+    async def user(user_id: int):
+        for index, (platform, url) in queue:
+            message = make_message(bot, user_id, index + 1, url)
+            started = time.perf_counter()
+            await handle_links(message)
+            latencies[platform].append(time.perf_counter() - started)
+
+    await asyncio.gather(*(user(10_000 + i) for i in range(concurrency)))
+    return latencies
+
+
+async def run_benchmark(args) -> Dict:
+    workdir = tempfile.mkdtemp(prefix='e2e_bench_')
+    prepare_environment(workdir)
+
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+
+    from benchmarks.fake_telegram import FakeTelegramApi
+    from benchmarks.stand_ins import StandInServer, generate_fixtures
+    from services.disk_quota import disk_manager
+    from services.file_cache import file_id_cache
+    from services.http_client import http_client
+    from services.jobs import download_engine
+
+    fixtures = generate_fixtures(args.fixtures or os.path.join(workdir, 'fixtures'))
+    stand_in = StandInServer(fixtures, latency=args.upstream_latency / 1000)
+    await stand_in.start()
+    telegram = FakeTelegramApi()
+    api_base = await telegram.start()
+
+    patch_bot_modules(stand_in)
+    bot = Bot(token='123456:BENCH', session=AiohttpSession(api=TelegramAPIServer.from_base(api_base)))
+    await http_client.start()
+    disk_manager.start()
+
+    mix = parse_mix(args.mix)
+    rnd = random.Random(args.seed)
+    counter = itertools.count(1)
+    try:
+        if args.warmup:
+            # Импорт модулей платформ, прогрев пулов и соединений - не в замер
+            await run_plan(bot, build_plan(args.warmup, mix, rnd, counter), args.concurrency)
+        errors_before = telegram.error_replies
+        uploaded_before = telegram.uploaded_bytes
+        cpu_before, _ = usage()
+        started = time.perf_counter()
+        latencies = await run_plan(bot, build_plan(args.requests, mix, rnd, counter), args.concurrency)
+        elapsed = time.perf_counter() - started
+        cpu_after, peak_rss = usage()
+    finally:
+        await bot.session.close()
+        await disk_manager.close()
+        await http_client.close()
+        download_engine.shutdown()
+        file_id_cache.close()
+        await telegram.close()
+        await stand_in.close()
+
+    total = sum(len(values) for values in latencies.values())
+    return {
+        'config': {
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'mix': mix,
+            'upstream_latency_ms': args.upstream_latency,
+            'seed': args.seed,
+        },
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(total / elapsed, 3) if elapsed else 0.0,
+        'cpu_s_per_job': round((cpu_after - cpu_before) / total, 4) if total else 0.0,
+        'peak_rss_mb': round(peak_rss, 1),
+        'error_replies': telegram.error_replies - errors_before,
+        'uploaded_mb': round((telegram.uploaded_bytes - uploaded_before) / 1024 / 1024, 1),
+        'telegram_calls': dict(telegram.calls),
+        'platforms': {
+            platform: {
+                'count': len(values),
+                'p50_ms': round(percentile(values, 0.50) * 1000, 1),
+                'p95_ms': round(percentile(values, 0.95) * 1000, 1),
+                'p99_ms': round(percentile(values, 0.99) * 1000, 1),
+            }
+            for platform, values in sorted(latencies.items())
+        },
+    }
+
+
+def _delta(new: float, old: Optional[float]) -> str:
+    if not old:
+        return ''
+    return f" ({(new - old) * 100 / old:+.1f}%)"
+
+
+def print_report(report: Dict, baseline: Optional[Dict] = None):
+    base_platforms = (baseline or {}).get('platforms', {})
+    print(f"{'platform':<12}{'count':>7}{'p50 ms':>12}{'p95 ms':>22}{'p99 ms':>12}")
+    for platform, row in report['platforms'].items():
+        old = base_platforms.get(platform, {})
+        p95 = f"{row['p95_ms']:.1f}{_delta(row['p95_ms'], old.get('p95_ms'))}"
+        print(f"{platform:<12}{row['count']:>7}{row['p50_ms']:>12.1f}{p95:>22}{row['p99_ms']:>12.1f}")
+
+    baseline = baseline or {}
+    print()
+    print(f"throughput:   {report['throughput_rps']:.2f} req/s{_delta(report['throughput_rps'], baseline.get('throughput_rps'))}")
+    print(f"cpu per job:  {report['cpu_s_per_job']:.3f}s{_delta(report['cpu_s_per_job'], baseline.get('cpu_s_per_job'))}")
+    print(f"peak RSS:     {report['peak_rss_mb']:.1f}MB{_delta(report['peak_rss_mb'], baseline.get('peak_rss_mb'))}")
+    print(f"uploaded:     {report['uploaded_mb']:.1f}MB")
+    print(f"error replies: {report['error_replies']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=8, help='одновременных пользователей')
+    parser.add_argument('--requests', type=int, default=100, help='ссылок в замере')
+    parser.add_argument('--warmup', type=int, default=10, help='ссылок до замера')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='веса платформ')
+    parser.add_argument('--upstream-latency', type=float, default=0.0, help='задержка стендов, мс')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--fixtures', help='папка для тестовых медиафайлов (переиспользуется)')
+    parser.add_argument('--json', help='сохранить результат в файл')
+    parser.add_argument('--compare', help='результат прошлого запуска для сравнения')
+    args = parser.parse_args()
+
+    # Пути из аргументов - относительно папки запуска (бенчмарк меняет cwd)
+    for name in ('fixtures', 'json', 'compare'):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    report = asyncio.run(run_benchmark(args))
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
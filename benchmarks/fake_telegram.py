@@ -0,0 +1,380 @@
+"""
+Локальная замена Telegram Bot API для бенчмарков и нагрузочных тестов:
+принимает запросы aiogram (JSON и multipart с файлами), отвечает
+правдоподобными объектами и считает вызовы, байты загрузок и время обработки.
+
+Для нагрузки на настоящий диспетчер сервер отдает через getUpdates
+синтетические сообщения с заданной частотой, ограничивает скорость загрузки
+файлов и отвечает 429 retry_after, как Telegram при превышении лимитов.
+
+Запуск: python -m benchmarks.fake_telegram [--port 8081] [--rate 20] [--users 1000]
+        [--duration 60] [--upload-mbps 20] [--chat-rate 1] [--flood 0.01]
+        [--texts links.txt] [--json result.json]
+Бот: TELEGRAM_API_BASE=http://127.0.0.1:8081 BOT_TOKEN=123456:TEST python main.py
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import random
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence
+
+from aiohttp import web
+
+# Начала ответов бота об ошибке (handlers отвечают текстом, а не исключением)
+ERROR_PREFIXES = ('❌', '⚠️', '💥')
+
+# Методы, ответом на которые является сообщение с медиа данного типа
+MEDIA_FIELDS = {
+    'sendVideo': 'video',
+    'sendPhoto': 'photo',
+    'sendDocument': 'document',
+    'sendAnimation': 'animation',
+    'sendAudio': 'audio',
+}
+
+# Методы, на которые распространяются лимиты Telegram (сообщения в чат)
+LIMITED_METHODS = {*MEDIA_FIELDS, 'sendMediaGroup', 'sendMessage', 'editMessageText'}
+
+# Сообщения пользователей по умолчанию: без сети обрабатываются целиком
+DEFAULT_TEXTS = ('/start', 'https://example.com/unsupported')
+
+
+class FakeTelegramApi:
+    """
+    aiohttp приложение с маршрутом /bot{token}/{method}.
+    upload_bandwidth - общая скорость приема файлов (байт/с, 0 - без ограничения),
+    chat_interval - минимальный интервал между сообщениями в один чат,
+    flood_probability - доля вызовов, получающих 429 без причины
+    """
+
+    def __init__(
+        self,
+        upload_bandwidth: float = 0,
+        chat_interval: float = 0,
+        flood_probability: float = 0,
+        seed: Optional[int] = None
+    ):
+        self.upload_bandwidth = upload_bandwidth
+        self.chat_interval = chat_interval
+        self.flood_probability = flood_probability
+        self._rnd = random.Random(seed)
+        self._message_ids = itertools.count(1000)
+        self._file_ids = itertools.count(1)
+        self._update_ids = itertools.count(1)
+        self._link_free_at = 0.0
+        self._chat_next: Dict[int, float] = {}
+        self._updates: List[Dict[str, Any]] = []
+        self._new_updates = asyncio.Event()
+        self._chat_ids = itertools.count(1)
+        # Чат синтетического сообщения -> время отправки (пока бот не ответил)
+        self._awaiting: Dict[int, float] = {}
+        self.polling = asyncio.Event()
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.rejected: Dict[str, int] = defaultdict(int)
+        self.response_times: List[float] = []
+        self.injected = 0
+        self.delivered = 0
+        self.uploaded_bytes = 0
+        self.error_replies = 0
+        self.runner: Optional[web.AppRunner] = None
+        self.base_url = ''
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=1024 ** 3)
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        return app
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """Запускает сервер; возвращает базовый URL для TelegramAPIServer.from_base"""
+        self.runner = web.AppRunner(self.app())
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def close(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    async def _throttle_upload(self, size: int):
+        """Общий канал загрузки: куски всех файлов передаются по очереди"""
+        if not self.upload_bandwidth:
+            return
+        now = time.monotonic()
+        self._link_free_at = max(now, self._link_free_at) + size / self.upload_bandwidth
+        await asyncio.sleep(self._link_free_at - now)
+
+    async def read_params(self, request: web.Request) -> Dict[str, Any]:
+        """Параметры вызова; содержимое файлов только считается"""
+        params: Dict[str, Any] = {}
+        if request.content_type == 'multipart/form-data':
+            reader = await request.multipart()
+            async for part in reader:
+                if part.filename:
+                    size = 0
+                    while True:
+                        chunk = await part.read_chunk(256 * 1024)
+                        if not chunk:
+                            break
+                        size += len(chunk)
+                        await self._throttle_upload(len(chunk))
+                    self.uploaded_bytes += size
+                    params[part.name] = f"attach://{part.name}"
+                else:
+                    params[part.name] = await part.text()
+        elif request.can_read_body:
+            if request.content_type == 'application/json':
+                params = await request.json()
+            else:
+                params = dict(await request.post())
+        return params
+
+    def _retry_after(self, method: str, chat_id: int) -> Optional[int]:
+        """Секунды ожидания, если вызов превышает лимит (None - вызов проходит)"""
+        if method not in LIMITED_METHODS:
+            return None
+        if self.flood_probability and self._rnd.random() < self.flood_probability:
+            return self._rnd.randint(1, 5)
+        if self.chat_interval:
+            now = time.monotonic()
+            allowed = self._chat_next.get(chat_id, 0.0)
+            if now < allowed:
+                return math.ceil(allowed - now)
+            self._chat_next[chat_id] = now + self.chat_interval
+        return None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        started = time.perf_counter()
+        method = request.match_info['method']
+        params = await self.read_params(request)
+        self.calls[method] += 1
+        if method == 'getUpdates':
+            return web.json_response({'ok': True, 'result': await self.get_updates(params)})
+
+        chat_id = int(params.get('chat_id') or 0)
+        retry_after = self._retry_after(method, chat_id)
+        self.latencies[method].append(time.perf_counter() - started)
+        if retry_after is not None:
+            self.rejected[method] += 1
+            return web.json_response({
+                'ok': False,
+                'error_code': 429,
+                'description': f"Too Many Requests: retry after {retry_after}",
+                'parameters': {'retry_after': retry_after},
+            }, status=429)
+        if method in LIMITED_METHODS and method != 'editMessageText':
+            self._record_response(chat_id)
+        return web.json_response({'ok': True, 'result': self.result_for(method, params)})
+
+    def _record_response(self, chat_id: int):
+        """
+        Время от сообщения пользователя до первого ответа бота на него;
+        следующие отправки в тот же чат (медиа после статуса) не считаются
+        """
+        injected_at = self._awaiting.pop(chat_id, None)
+        if injected_at is not None:
+            self.response_times.append(time.monotonic() - injected_at)
+
+    def inject_text(self, user_id: int, text: str) -> Dict[str, Any]:
+        """
+        Ставит в очередь getUpdates сообщение пользователя user_id.
+        Каждое сообщение приходит из своей группы: ответы бота не ссылаются
+        на исходное сообщение, а так любая отправка в чат относится ровно к нему.
+        Очереди и лимиты бота по пользователю работают как обычно (по from.id)
+        """
+        chat_id = -next(self._chat_ids)
+        update = {
+            'update_id': next(self._update_ids),
+            'message': {
+                'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'group', 'title': f"load {-chat_id}"},
+                'from': {'id': user_id, 'is_bot': False, 'first_name': f"user{user_id}"},
+                'text': text,
+            },
+        }
+        self._updates.append(update)
+        self._awaiting[chat_id] = time.monotonic()
+        self.injected += 1
+        self._new_updates.set()
+        return update
+
+    async def get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Long polling: подтверждение по offset, ожидание новых до timeout секунд"""
+        self.polling.set()
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        if offset:
+            self._updates = [u for u in self._updates if u['update_id'] >= offset]
+        if not self._updates:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), float(params.get('timeout') or 0))
+            except asyncio.TimeoutError:
+                pass
+        batch = self._updates[:limit]
+        if batch:
+            # update_id идут подряд с 1 - выдано столько, каков наибольший из них
+            self.delivered = max(self.delivered, batch[-1]['update_id'])
+        return batch
+
+    async def generate_load(
+        self,
+        rate: float,
+        duration: float,
+        users: int,
+        texts: Sequence[str],
+        first_user: int = 10_000
+    ):
+        """
+        Пуассоновский поток сообщений: в среднем rate в секунду от users
+        пользователей в течение duration секунд. Начинается, когда бот
+        впервые вызвал getUpdates
+        """
+        await self.polling.wait()
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            user_id = first_user + self._rnd.randrange(users)
+            self.inject_text(user_id, self._rnd.choice(texts).format(n=self.injected))
+            await asyncio.sleep(self._rnd.expovariate(rate))
+
+    def _file(self, **extra) -> Dict[str, Any]:
+        file_id = f"fake_{next(self._file_ids)}"
+        return {'file_id': file_id, 'file_unique_id': file_id, **extra}
+
+    def _message(self, chat_id: Any, message_id: Optional[int] = None, **fields) -> Dict[str, Any]:
+        return {
+            'message_id': message_id or next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': int(chat_id), 'type': 'group' if int(chat_id) < 0 else 'private'},
+            **fields,
+        }
+
+    def _media_message(self, chat_id: Any, kind: str, caption: Optional[str] = None) -> Dict[str, Any]:
+        fields: Dict[str, Any] = {'caption': caption} if caption else {}
+        if kind == 'video':
+            fields['video'] = self._file(width=640, height=360, duration=8)
+        elif kind == 'photo':
+            fields['photo'] = [self._file(width=1280, height=720)]
+        elif kind == 'animation':
+            fields['animation'] = self._file(width=640, height=360, duration=8)
+        elif kind == 'audio':
+            fields['audio'] = self._file(duration=8)
+        else:
+            fields['document'] = self._file()
+        return self._message(chat_id, **fields)
+
+    def result_for(self, method: str, params: Dict[str, Any]) -> Any:
+        chat_id = params.get('chat_id', 0)
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'FakeBot', 'username': 'fake_bot'}
+        if method in MEDIA_FIELDS:
+            return self._media_message(chat_id, MEDIA_FIELDS[method], params.get('caption'))
+        if method == 'sendMediaGroup':
+            media = params.get('media', [])
+            if isinstance(media, str):
+                media = json.loads(media)
+            return [self._media_message(chat_id, item.get('type', 'photo')) for item in media]
+        if method in ('sendMessage', 'editMessageText'):
+            text = str(params.get('text', ''))
+            if text.startswith(ERROR_PREFIXES):
+                self.error_replies += 1
+            message_id = int(params.get('message_id') or 0) if method == 'editMessageText' else None
+            return self._message(chat_id, message_id, text=text)
+        # deleteMessage, setWebhook, deleteWebhook и прочие служебные методы
+        return True
+
+    def report(self) -> Dict[str, Any]:
+        from benchmarks.e2e_bench import percentile
+
+        def summary(values: List[float]) -> Dict[str, float]:
+            return {
+                'count': len(values),
+                'p50_ms': round(percentile(values, 0.50) * 1000, 1),
+                'p95_ms': round(percentile(values, 0.95) * 1000, 1),
+                'p99_ms': round(percentile(values, 0.99) * 1000, 1),
+            }
+
+        return {
+            'injected': self.injected,
+            'delivered': self.delivered,
+            'response': summary(self.response_times),
+            'error_replies': self.error_replies,
+            'uploaded_mb': round(self.uploaded_bytes / 1024 / 1024, 1),
+            'rejected_429': dict(self.rejected),
+            'methods': {method: summary(values) for method, values in sorted(self.latencies.items())},
+        }
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"{'method':<18}{'calls':>8}{'429':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for method, row in report['methods'].items():
+        rejected = report['rejected_429'].get(method, 0)
+        print(f"{method:<18}{row['count']:>8}{rejected:>6}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+    response = report['response']
+    print()
+    print(f"updates:       {report['injected']} injected, {report['delivered']} delivered, {response['count']} answered")
+    print(f"response time: p50 {response['p50_ms']:.0f}ms, p95 {response['p95_ms']:.0f}ms, p99 {response['p99_ms']:.0f}ms")
+    print(f"uploaded:      {report['uploaded_mb']:.1f}MB")
+    print(f"error replies: {report['error_replies']}")
+
+
+async def serve(api: FakeTelegramApi, args):
+    texts = DEFAULT_TEXTS
+    if args.texts:
+        with open(args.texts, encoding='utf-8') as f:
+            texts = [line.strip() for line in f if line.strip()]
+
+    base_url = await api.start(args.host, args.port)
+    print(f"Fake Bot API: {base_url} (waiting for getUpdates)")
+    try:
+        await api.generate_load(args.rate, args.duration, args.users, texts)
+        # Ответы на последние сообщения
+        await asyncio.sleep(args.drain)
+    finally:
+        await api.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--rate', type=float, default=20, help='сообщений в секунду')
+    parser.add_argument('--users', type=int, default=1000, help='разных пользователей')
+    parser.add_argument('--duration', type=float, default=60, help='секунд нагрузки')
+    parser.add_argument('--drain', type=float, default=10, help='секунд ожидания ответов после нагрузки')
+    parser.add_argument('--upload-mbps', type=float, default=0, help='скорость загрузки файлов, Мбит/с (0 - без ограничения)')
+    parser.add_argument('--chat-rate', type=float, default=0, help='сообщений в секунду в один чат до 429 (0 - без лимита)')
+    parser.add_argument('--flood', type=float, default=0, help='доля вызовов со случайным 429')
+    parser.add_argument('--texts', help='файл с текстами сообщений, по одному в строке ({n} - номер)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='сохранить результат в файл')
+    args = parser.parse_args()
+
+    api = FakeTelegramApi(
+        upload_bandwidth=args.upload_mbps * 1024 * 1024 / 8,
+        chat_interval=1 / args.chat_rate if args.chat_rate else 0,
+        flood_probability=args.flood,
+        seed=args.seed
+    )
+    try:
+        asyncio.run(serve(api, args))
+    except KeyboardInterrupt:
+        # Остановка вручную - отчет по тому, что успели
+        pass
+    report = api.report()
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""
+Микро-бенчмарк классификации ссылок: скорость и точность services.router
+в сравнении с прежней цепочкой проверок из handle_links.
+
+Запуск: python -m benchmarks.router_bench [--size 200000]
+"""
+import argparse
+import random
+import re
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+from services.router import classify_url, handler_for
+
+# (шаблон, платформа, тип): ожидаемый результат размечен вручную по тому, на что
+# ведет ссылка, а не выведен из KIND_RULES; {id}/{n}/{user} - случайные значения
+URL_SHAPES: List[Tuple[str, Optional[str], str]] = [
+    ("https://www.youtube.com/watch?v={id}", 'youtube', 'video'),
+    ("https://youtube.com/watch?v={id}&t=42s&si={id}", 'youtube', 'video'),
+    ("https://m.youtube.com/watch?v={id}&feature=share", 'youtube', 'video'),
+    ("https://youtu.be/{id}?si={id}", 'youtube', 'video'),
+    ("https://www.youtube.com/shorts/{id}", 'youtube', 'clip'),
+    ("https://www.youtube.com/playlist?list=PL{id}", 'youtube', 'playlist'),
+    ("https://music.youtube.com/watch?v={id}&list=RD{id}", 'youtube', 'video'),
+    ("https://www.youtube.com/embed/{id}", 'youtube', 'video'),
+    ("https://www.instagram.com/p/{id}/", 'instagram', 'post'),
+    ("https://www.instagram.com/p/{id}/?igsh={id}", 'instagram', 'post'),
+    ("https://www.instagram.com/reel/{id}/?utm_source=ig_web_copy_link", 'instagram', 'reel'),
+    ("https://instagram.com/reels/{id}/", 'instagram', 'reel'),
+    ("https://www.instagram.com/stories/{user}/{n}/", 'instagram', 'story'),
+    ("https://www.instagram.com/tv/{id}/", 'instagram', 'video'),
+    ("https://www.tiktok.com/@{user}/video/{n}", 'tiktok', 'video'),
+    ("https://vm.tiktok.com/{id}/", 'tiktok', 'video'),
+    ("https://vt.tiktok.com/{id}/", 'tiktok', 'video'),
+    ("https://twitter.com/{user}/status/{n}", 'twitter', 'tweet'),
+    ("https://x.com/{user}/status/{n}?s=20", 'twitter', 'tweet'),
+    ("https://mobile.twitter.com/{user}/status/{n}/photo/1", 'twitter', 'tweet'),
+    ("https://x.com/{user}", 'twitter', 'unknown'),
+    ("https://vk.com/video-{n}_{n}", 'vk', 'video'),
+    ("https://vk.com/video{n}_{n}?list={id}", 'vk', 'video'),
+    ("https://vkvideo.ru/video-{n}_{n}", 'vk', 'video'),
+    ("https://vk.com/clip-{n}_{n}", 'vk', 'clip'),
+    ("https://vkvideo.ru/clip-{n}_{n}", 'vk', 'clip'),
+    ("https://vk.com/video_ext.php?oid=-{n}&id={n}&hash={id}", 'vk', 'video'),
+    ("https://vk.com/wall-{n}_{n}", 'vk', 'wall'),
+    ("https://m.vk.com/wall{n}_{n}", 'vk', 'wall'),
+    ("https://vk.com/{user}?w=wall-{n}_{n}", 'vk', 'wall'),
+    ("https://vk.com/feed?z=video-{n}_{n}%2Fpl_cat_trends", 'vk', 'video'),
+    ("https://vk.com/{user}", 'vk', 'unknown'),
+    ("https://www.reddit.com/r/{user}/comments/{id}/some_title/", 'reddit', 'video'),
+    ("https://packaged-media.redd.it/{id}/pb/m2-res_720p.mp4", 'reddit', 'video'),
+    ("https://dzen.ru/video/watch/{id}", 'yandex_zen', 'video'),
+    ("https://example.com/watch?v={id}", None, 'unknown'),
+    ("https://news.example.org/article/{n}?ref=x.com", None, 'unknown'),
+    ("https://google.com/search?q=youtube.com", None, 'unknown'),
+]
+
+# Прежние проверки из handle_links (для сравнения)
+LEGACY_PLATFORMS = {
+    "yandex_zen": r"zen\.yandex\.ru|dzen\.ru",
+    "youtube": r"(youtube\.com|youtu\.be)",
+    "instagram": r"instagram\.com",
+    "tiktok": r"tiktok\.com|vm\.tiktok\.com",
+    "twitter": r"(x\.com|twitter\.com)",
+    "vk": r"(vk\.com|vkvideo\.ru)",
+    "reddit": r"(reddit\.com|packaged-media\.redd\.it)",
+}
+LEGACY_TWITTER_PATTERNS = ['/status/', 'x.com/', 'twitter.com/']
+
+
+def legacy_handler(url: str) -> str:
+    """Какой обработчик выбрала бы прежняя цепочка if/re.search"""
+    if re.search(LEGACY_PLATFORMS["instagram"], url, re.IGNORECASE):
+        return 'instagram'
+    if 'vk.com' in url or 'vkvideo.ru' in url:
+        if any(p in url for p in ['/video', '/clip', 'video_ext.php', 'vkvideo.ru/video-', 'vkvideo.ru/clip-']):
+            return 'vk_video'
+        if any(p in url for p in ['wall-', '?w=wall', '?z=wall']):
+            return 'vk_post'
+        return 'vk_hint'
+    if re.search(LEGACY_PLATFORMS["twitter"], url, re.IGNORECASE) and any(p in url for p in LEGACY_TWITTER_PATTERNS):
+        return 'twitter'
+    for platform, pattern in LEGACY_PLATFORMS.items():
+        if platform in ["vk", "twitter"]:
+            continue
+        if re.search(pattern, url, re.IGNORECASE):
+            return 'video'
+    return 'unsupported'
+
+
+def build_corpus(size: int, seed: int = 1) -> List[Tuple[str, Optional[str], str]]:
+    """(ссылка, ожидаемая платформа, ожидаемый тип)"""
+    rnd = random.Random(seed)
+    alphabet = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_-'
+    corpus = []
+    for _ in range(size):
+        template, platform, kind = rnd.choice(URL_SHAPES)
+        url = template.format(
+            id=''.join(rnd.choice(alphabet) for _ in range(11)),
+            n=rnd.randint(1, 10 ** 9),
+            user=''.join(rnd.choice(alphabet[:26]) for _ in range(rnd.randint(3, 12))),
+        )
+        corpus.append((url, platform, kind))
+    return corpus
+
+
+def measure(name: str, func: Callable[[str], object], urls: List[str]):
+    started = time.perf_counter()
+    for url in urls:
+        func(url)
+    elapsed = time.perf_counter() - started
+    print(f"{name:<8} {elapsed * 1e9 / len(urls):8.0f} ns/url  ({elapsed:.3f}s total)")
+
+
+def report_mismatches(title: str, mismatches: Counter, examples: Dict[Tuple, str], total: int):
+    print(f"{title}: {1 - sum(mismatches.values()) / total:.2%}")
+    for (expected, got), count in mismatches.most_common(10):
+        print(f"  x{count}: expected {expected}, got {got}, e.g. {examples[(expected, got)]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=200000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.size, args.seed)
+    urls = [url for url, _, _ in corpus]
+    print(f"{len(urls)} urls, {len(URL_SHAPES)} shapes")
+    measure('router', classify_url, urls)
+    measure('legacy', legacy_handler, urls)
+
+    # Расхождения с ручной разметкой: (ожидалось, получено) -> количество и пример
+    route_misses: Counter = Counter()
+    router_misses: Counter = Counter()
+    legacy_misses: Counter = Counter()
+    examples: Dict[Tuple, str] = {}
+    for url, platform, kind in corpus:
+        route = classify_url(url)
+        expected_handler = handler_for(platform, kind)
+        checks = (
+            (route_misses, (platform, kind), (route['platform'], route['kind'])),
+            (router_misses, expected_handler, handler_for(route['platform'], route['kind'])),
+            (legacy_misses, expected_handler, legacy_handler(url)),
+        )
+        for misses, expected, got in checks:
+            if expected != got:
+                misses[(expected, got)] += 1
+                examples.setdefault((expected, got), url)
+
+    print()
+    report_mismatches('router platform+kind accuracy', route_misses, examples, len(corpus))
+    report_mismatches('router handler accuracy', router_misses, examples, len(corpus))
+    report_mismatches('legacy handler accuracy', legacy_misses, examples, len(corpus))
+
+
+if __name__ == '__main__':
+    main()
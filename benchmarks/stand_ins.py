@@ -0,0 +1,203 @@
+"""
+Локальные стенды внешних сервисов для сквозного бенчмарка: медиафайлы,
+VK API, Instagram API и Nitter отдаются одним aiohttp сервером.
+Запросы бота к этим хостам перенаправляются сюда подменой класса запроса
+в services.http_client (см. StandInRequest).
+"""
+import asyncio
+import os
+import re
+import subprocess
+from typing import Dict, Optional
+
+from aiohttp import ClientRequest, web
+from yarl import URL
+
+# Хосты, запросы к которым обслуживает стенд
+STUBBED_HOSTS = (
+    'api.vk.com',
+    'vk.com',
+    'apihut.in',
+    'nitter.net',
+    'pbs.twimg.com',
+    'sun9-1.userapi.com',
+    'scontent.cdninstagram.com',
+)
+
+FIXTURES = {
+    'video.mp4': [
+        '-f', 'lavfi', '-i', 'testsrc=size=1280x720:rate=30',
+        '-f', 'lavfi', '-i', 'sine=frequency=440',
+        '-t', '8', '-c:v', 'libx264', '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac', '-movflags', '+faststart',
+    ],
+    'image.jpg': ['-f', 'lavfi', '-i', 'testsrc=size=1280x720', '-frames:v', '1'],
+}
+
+
+def generate_fixtures(directory: str, ffmpeg: str = 'ffmpeg') -> Dict[str, str]:
+    """Создает тестовые видео и изображение (один раз, дальше берутся из папки)"""
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for name, args in FIXTURES.items():
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            subprocess.run(
+                [ffmpeg, '-v', 'error', *args, '-y', path],
+                check=True
+            )
+        paths[name] = path
+    return paths
+
+
+class StandInServer:
+    """
+    Один сервер на все внешние сервисы: путь начинается с исходного хоста
+    (/api.vk.com/method/wall.getById, /nitter.net/user/status/1, ...)
+    """
+
+    def __init__(self, fixtures: Dict[str, str], latency: float = 0.0):
+        self.fixtures = fixtures
+        self.latency = latency
+        self.requests = 0
+        self.served_bytes = 0
+        self.base_url = ''
+        self.runner: Optional[web.AppRunner] = None
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/media/{name}', self.media)
+        app.router.add_get('/api.vk.com/method/wall.getById', self.vk_wall)
+        app.router.add_get('/api.vk.com/method/video.get', self.vk_video)
+        app.router.add_post('/apihut.in/api/download/videos', self.instagram_api)
+        app.router.add_get('/nitter.net/{user}/status/{id}', self.nitter_status)
+        # Изображения с CDN платформ - это тот же файл фикстуры
+        app.router.add_get('/{host}/{path:.*}', self.cdn)
+        return app
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        self.runner = web.AppRunner(self.app())
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}"
+        return self.base_url
+
+    async def close(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    async def _delay(self):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def _file_response(self, name: str) -> web.StreamResponse:
+        path = self.fixtures['video.mp4' if name.endswith('.mp4') else 'image.jpg']
+        self.served_bytes += os.path.getsize(path)
+        return web.FileResponse(path)
+
+    async def media(self, request: web.Request) -> web.StreamResponse:
+        await self._delay()
+        return self._file_response(request.match_info['name'])
+
+    async def cdn(self, request: web.Request) -> web.StreamResponse:
+        await self._delay()
+        return self._file_response(request.match_info['path'])
+
+    async def vk_wall(self, request: web.Request) -> web.Response:
+        await self._delay()
+        post_id = request.query.get('posts', '1_1')
+        photos = [
+            {'type': 'photo', 'photo': {'sizes': [
+                {'width': 1280, 'url': f"https://sun9-1.userapi.com/{post_id}_{i}.jpg"}
+            ]}}
+            for i in range(3)
+        ]
+        return web.json_response({'response': {'items': [{
+            'text': f"Тестовый пост {post_id}",
+            'attachments': photos,
+        }]}})
+
+    async def vk_video(self, request: web.Request) -> web.Response:
+        await self._delay()
+        video_id = request.query.get('videos', '1_1')
+        return web.json_response({'response': {'items': [{
+            'player': f"https://vk.com/video_ext.php?oid={video_id}",
+            'title': f"Видео {video_id}",
+            'duration': 8,
+            'image': [{'width': 1280, 'url': f"https://sun9-1.userapi.com/{video_id}.jpg"}],
+        }]}})
+
+    async def instagram_api(self, request: web.Request) -> web.Response:
+        await self._delay()
+        payload = await request.json()
+        key = re.sub(r'\W+', '_', payload.get('video_url', ''))[-24:]
+        return web.json_response({'success': True, 'data': [
+            {'url': f"https://scontent.cdninstagram.com/{key}_0.jpg"},
+            {'url': f"https://scontent.cdninstagram.com/{key}_1.mp4"},
+        ]})
+
+    async def nitter_status(self, request: web.Request) -> web.Response:
+        await self._delay()
+        tweet_id = request.match_info['id']
+        images = ''.join(
+            f'<img src="https://pbs.twimg.com/media/{tweet_id}_{i}.jpg">' for i in range(2)
+        )
+        html = (
+            f'<div class="tweet-content">Тестовый твит {tweet_id}</div>'
+            f'<div class="attachments">{images}</div>'
+        )
+        return web.Response(text=html, content_type='text/html')
+
+    def rewrite(self, url: URL) -> URL:
+        """https://host/path -> http://стенд/host/path для хостов из STUBBED_HOSTS"""
+        host = url.host or ''
+        if not any(host == h or host.endswith('.' + h) for h in STUBBED_HOSTS):
+            return url
+        base = URL(self.base_url)
+        return URL.build(
+            scheme=base.scheme,
+            host=base.host,
+            port=base.port,
+            path=f"/{host}{url.raw_path}",
+            query_string=url.raw_query_string,
+            encoded=True
+        )
+
+    def request_class(self) -> type:
+        """Класс запроса aiohttp, перенаправляющий внешние хосты на стенд"""
+        server = self
+
+        class StandInRequest(ClientRequest):
+            def __init__(self, method: str, url: URL, *args, **kwargs):
+                super().__init__(method, server.rewrite(url), *args, **kwargs)
+
+        return StandInRequest
+
+    def media_url(self, name: str) -> str:
+        """Прямая ссылка на видео для yt-dlp (generic extractor)"""
+        return f"{self.base_url}/media/{name}"
+
+
+class NitterParser:
+    """
+    Замена Selenium парсера Twitter в бенчмарке: разбирает заготовленную
+    страницу Nitter (Chrome в офлайн-стенде не запускается)
+    """
+
+    TEXT_RE = re.compile(r'<div class="tweet-content">(.*?)</div>', re.S)
+    IMAGE_RE = re.compile(r'<img src="([^"]+)"')
+
+    async def get_twitter_content(self, url: str) -> Optional[Dict]:
+        from services.http_client import http_client
+
+        nitter_url = re.sub(r'https?://(?:www\.|mobile\.)?(?:twitter|x)\.com', 'https://nitter.net', url)
+        async with http_client.session.get(nitter_url) as resp:
+            html = await resp.text()
+        text = self.TEXT_RE.search(html)
+        return {
+            'text': text.group(1) if text else '',
+            'media': {'images': self.IMAGE_RE.findall(html), 'videos': []},
+        }
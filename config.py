@@ -19,6 +19,8 @@ load_dotenv('token.env')
 
 # Основные настройки
 BOT_TOKEN: str = os.getenv('BOT_TOKEN', '')
+# Свой сервер Bot API (telegram-bot-api или benchmarks.fake_telegram); пусто - api.telegram.org
+TELEGRAM_API_BASE: str = os.getenv('TELEGRAM_API_BASE', '')
 VK_ACCESS_TOKEN: str = os.getenv('VK_ACCESS_TOKEN', '')
 VK_API_VERSION: str = '5.199'
 DOWNLOAD_DIR: str = "downloads"
@@ -27,6 +29,89 @@ SELENIUM_REMOTE_URL: str = os.getenv('SELENIUM_REMOTE_URL', '')
 TWITTER_USERNAME: str = os.getenv('TWITTER_USERNAME', '')
 TWITTER_PASSWORD: str = os.getenv('TWITTER_PASSWORD', '')
 
+# Получение обновлений: polling или webhook
+BOT_MODE: str = os.getenv('BOT_MODE', 'polling')  # polling | webhook
+WEBHOOK_BASE_URL: str = os.getenv('WEBHOOK_BASE_URL', '')  # публичный https адрес бота
+WEBHOOK_PATH: str = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET: str = os.getenv('WEBHOOK_SECRET', '')  # X-Telegram-Bot-Api-Secret-Token
+WEBAPP_HOST: str = os.getenv('WEBAPP_HOST', '0.0.0.0')
+WEBAPP_PORT: int = int(os.getenv('WEBAPP_PORT', '8080'))
+UPDATE_CONCURRENCY: int = int(os.getenv('UPDATE_CONCURRENCY', '200'))  # обновлений одновременно (включая ждущие в очереди)
+
+# Пул воркеров для загрузок (yt-dlp)
+DOWNLOAD_WORKERS: int = int(os.getenv('DOWNLOAD_WORKERS', '4'))
+DOWNLOAD_POOL_TYPE: str = os.getenv('DOWNLOAD_POOL_TYPE', 'thread')  # thread | process
+# Выбор формата, который поместится в лимит без сжатия
+FORMAT_SIZE_MARGIN: float = 0.9  # запас на неточность filesize_approx/tbr
+FORMAT_TARGET_SIZE: int = int(MAX_FILE_SIZE * FORMAT_SIZE_MARGIN)  # предсказанный размер с запасом до лимита отправки
+
+# Кэш file_id уже отправленных в Telegram файлов
+FILE_CACHE_PATH: str = os.getenv('FILE_CACHE_PATH', 'file_cache.sqlite3')
+FILE_CACHE_TTL: int = int(os.getenv('FILE_CACHE_TTL', str(30 * 24 * 3600)))  # сек
+FILE_CACHE_MAX_ENTRIES: int = int(os.getenv('FILE_CACHE_MAX_ENTRIES', '10000'))
+
+# Потоковая отправка файлов в Telegram
+UPLOAD_CHUNK_SIZE: int = int(os.getenv('UPLOAD_CHUNK_SIZE', str(256 * 1024)))
+UPLOAD_USE_MMAP: bool = os.getenv('UPLOAD_USE_MMAP', '0') == '1'
+
+# Маленькие изображения держатся в памяти от скачивания до отправки (без записи на диск)
+INMEMORY_MEDIA_MAX_BYTES: int = int(os.getenv('INMEMORY_MEDIA_MAX_BYTES', str(5 * 1024 * 1024)))
+INMEMORY_BUDGET_MB: int = int(os.getenv('INMEMORY_BUDGET_MB', '64'))  # всего на все задачи
+MEDIA_READ_CHUNK_SIZE: int = int(os.getenv('MEDIA_READ_CHUNK_SIZE', str(64 * 1024)))
+
+# Пул браузеров Chrome для Selenium
+CHROME_BINARY: str = os.getenv('CHROME_BINARY', '/usr/bin/google-chrome')
+CHROMEDRIVER_PATH: str = os.getenv('CHROMEDRIVER_PATH', '/usr/bin/chromedriver')
+BROWSER_POOL_SIZE: int = int(os.getenv('BROWSER_POOL_SIZE', '2'))
+BROWSER_MAX_PAGES: int = int(os.getenv('BROWSER_MAX_PAGES', '50'))  # перезапуск после N страниц
+BROWSER_MAX_RSS_MB: int = int(os.getenv('BROWSER_MAX_RSS_MB', '1024'))
+BROWSER_WATCHDOG_INTERVAL: int = int(os.getenv('BROWSER_WATCHDOG_INTERVAL', '60'))  # сек
+
+# Общий HTTP клиент (aiohttp)
+HTTP_LIMIT: int = int(os.getenv('HTTP_LIMIT', '100'))  # всего соединений
+HTTP_LIMIT_PER_HOST: int = int(os.getenv('HTTP_LIMIT_PER_HOST', '10'))
+HTTP_DNS_TTL: int = int(os.getenv('HTTP_DNS_TTL', '300'))  # сек
+HTTP_TIMEOUT: int = int(os.getenv('HTTP_TIMEOUT', '30'))  # сек
+HTTP_CONNECT_TIMEOUT: int = int(os.getenv('HTTP_CONNECT_TIMEOUT', '10'))  # сек на подключение при скачивании медиа
+HTTP_READ_TIMEOUT: int = int(os.getenv('HTTP_READ_TIMEOUT', '30'))  # сек без новых данных при скачивании медиа
+
+# Бюджет диска для папки загрузок
+DISK_BUDGET_MB: int = int(os.getenv('DISK_BUDGET_MB', '4096'))  # всего под DOWNLOAD_DIR
+DISK_MIN_FREE_MB: int = int(os.getenv('DISK_MIN_FREE_MB', '500'))  # свободного места на диске
+DISK_VIDEO_JOB_MB: int = int(os.getenv('DISK_VIDEO_JOB_MB', '200'))  # резерв на видео (исходник + сжатие)
+DISK_POST_JOB_MB: int = int(os.getenv('DISK_POST_JOB_MB', '50'))  # резерв на пост/карусель
+DISK_ADMIT_TIMEOUT: int = int(os.getenv('DISK_ADMIT_TIMEOUT', '120'))  # сек ожидания места
+DISK_STALE_AGE: int = int(os.getenv('DISK_STALE_AGE', '3600'))  # сек, после которых файл считается брошенным
+DISK_JANITOR_INTERVAL: int = int(os.getenv('DISK_JANITOR_INTERVAL', '600'))  # сек
+DISK_USAGE_TTL: float = float(os.getenv('DISK_USAGE_TTL', '2'))  # сек, на которые запоминается обход DOWNLOAD_DIR
+DISK_CACHE_GRACE: int = int(os.getenv('DISK_CACHE_GRACE', '300'))  # сек, в течение которых недавно использованный кэш не вытесняется
+
+# Параллельная загрузка медиа для альбомов
+MEDIA_FETCH_CONCURRENCY: int = int(os.getenv('MEDIA_FETCH_CONCURRENCY', '5'))
+
+# Планировщик задач (очередь ссылок от пользователей)
+SCHEDULER_MAX_ACTIVE: int = int(os.getenv('SCHEDULER_MAX_ACTIVE', '10'))  # задач одновременно
+SCHEDULER_MAX_PER_USER: int = int(os.getenv('SCHEDULER_MAX_PER_USER', '5'))  # ссылки одного сообщения идут параллельно
+SCHEDULER_MAX_BACKLOG: int = int(os.getenv('SCHEDULER_MAX_BACKLOG', '100'))  # всего в очереди
+SCHEDULER_MAX_QUEUED_PER_USER: int = int(os.getenv('SCHEDULER_MAX_QUEUED_PER_USER', '10'))
+MAX_LINKS_PER_MESSAGE: int = int(os.getenv('MAX_LINKS_PER_MESSAGE', '10'))
+# Сколько секунд результат разбора поста отдается повторным запросам той же ссылки
+SINGLEFLIGHT_RESULT_TTL: int = int(os.getenv('SINGLEFLIGHT_RESULT_TTL', '60'))
+
+# Живой прогресс в статусном сообщении
+PROGRESS_EDIT_INTERVAL: float = float(os.getenv('PROGRESS_EDIT_INTERVAL', '3'))  # сек между правками в одном чате
+PROGRESS_HOOK_INTERVAL: float = float(os.getenv('PROGRESS_HOOK_INTERVAL', '0.5'))  # сек между событиями из yt-dlp/ffmpeg
+
+# Метрики в формате Prometheus (GET /metrics); 0 - выключено
+METRICS_PORT: int = int(os.getenv('METRICS_PORT', '0'))
+METRICS_HOST: str = os.getenv('METRICS_HOST', '127.0.0.1')
+
+# Трассировка запросов и формат логов
+LOG_FORMAT: str = os.getenv('LOG_FORMAT', 'text')  # text | json
+TRACE_SLOW_REQUEST: float = float(os.getenv('TRACE_SLOW_REQUEST', '30'))  # сек, после которых в лог пишется дерево участков
+TRACE_MAX_SPANS: int = int(os.getenv('TRACE_MAX_SPANS', '500'))  # на один запрос
+TRACE_EXPORT_URL: str = os.getenv('TRACE_EXPORT_URL', '')  # локальный коллектор (POST JSON), пусто - не отправлять
+
 # Поддерживаемые платформы
 PLATFORMS = {
     "yandex_zen": r"zen\.yandex\.ru|dzen\.ru",
@@ -55,6 +140,8 @@ VK_PATTERNS = [
     'vkvideo.ru/clip-'    # для ссылок вида clip-XXXXX_YYYYY
 ]
 FFMPEG_PATH = "ffmpeg"
+FFPROBE_PATH = "ffprobe"
+PROBE_CACHE_SIZE: int = 256  # записей в кэше ffprobe
 # Instagram Settings
 INSTAGRAM_API_ENDPOINT = "https://apihut.in/api/download/videos"
 USE_INSTAGRAM_API = True  # Set to True to use API instead of Instaloader
@@ -63,6 +150,19 @@ INSTAGRAM_API_KEY = os.getenv('INSTAGRAM_API_KEY')  # If required by your AP
 MAX_TELEGRAM_VIDEO_SIZE = 45  # MB (Telegram limit)
 MAX_RETRIES = 2  # Максимальное количество попыток
 PHOTO_DURATION = 3  # Длительность фото в объединенном видео (сек)
+PHOTO_SEGMENT_FPS = 5  # Частота кадров сегментов из фото (статичная картинка)
+SEGMENT_WORKERS = os.cpu_count() or 2  # Параллельных ffmpeg при объединении
+SEGMENT_CACHE_DIR = os.path.join(DOWNLOAD_DIR, "segment_cache")
+
+# Сжатие видео под лимит размера
+ENCODER_PRESET: str = os.getenv('ENCODER_PRESET', 'fast')
+ENCODER_TWO_PASS: bool = os.getenv('ENCODER_TWO_PASS', '1') == '1'
+ENCODER_AUDIO_BITRATE: int = 128  # кбит/с
+ENCODER_MIN_AUDIO_BITRATE: int = 64  # кбит/с, если видео не хватает бюджета
+ENCODER_MIN_VIDEO_BITRATE: int = 150  # кбит/с
+ENCODER_CONTAINER_OVERHEAD: float = 0.03  # доля размера на контейнер mp4
+ENCODER_MAX_ATTEMPTS: int = 2  # основное кодирование + проверочное перекодирование
+ENCODER_TARGET_HEIGHT: int = int(os.getenv('ENCODER_TARGET_HEIGHT', '720'))  # уменьшаем только выше
 # Настройки прокси
 PROXY_SETTINGS = {
     'test_urls': [
@@ -1,10 +1,22 @@
+from importlib import import_module
+
 from .base import start, handle_links
-from .twitter import handle_twitter_post
-from .vk import handle_vk_post
-from .video import handle_video_download
 from .media import send_media_group
-from .vk_video import handle_vk_video_download
-from .instagram import handle_instagram
+
+# Обработчики платформ тянут тяжелые зависимости - импортируем при первом обращении
+_PLATFORM_HANDLERS = {
+    'handle_twitter_post': '.twitter',
+    'handle_vk_post': '.vk',
+    'handle_video_download': '.video',
+    'handle_vk_video_download': '.vk_video',
+    'handle_instagram': '.instagram',
+}
+
+
+def __getattr__(name):
+    if name in _PLATFORM_HANDLERS:
+        return getattr(import_module(_PLATFORM_HANDLERS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 __all__ = [
@@ -15,4 +27,4 @@ __all__ = [
     'handle_video_download',
     'handle_vk_video_download',
     'handle_instagram'
-]
\ No newline at end of file
+]
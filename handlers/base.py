@@ -1,21 +1,48 @@
-import os
-import re
+import asyncio
 from aiogram import F
 from aiogram.filters import Command
-from aiogram.types import Message, BufferedInputFile
-from config import MAX_FILE_SIZE, PLATFORMS, TWITTER_PATTERNS, VK_PATTERNS
-from handlers.instagram import handle_instagram
-from handlers.twitter import handle_twitter_post
-from handlers.vk import handle_vk_post
-from handlers.video import handle_video_download
+from aiogram.types import Message
 import logging
-from typing import Optional
+from typing import Awaitable, Callable, Dict, Optional
 
-from handlers.vk_video import handle_vk_video_download
-from services.downloader import download_vk_video
+from config import DISK_POST_JOB_MB, DISK_VIDEO_JOB_MB, MAX_LINKS_PER_MESSAGE
+from handlers.media.delivery import DeliveryBatch, bind_delivery
+from services.disk_quota import DiskQuotaExceeded, disk_manager
+from services.file_cache import normalize_source_url
+from services.lazy_import import lazy_callable
+from services.metrics import stage, track_request
+from services.tracing import request_trace, span
+from services.router import classify_url, extract_urls, handler_for
+from services.scheduler import QueueFull, job_scheduler
+from services.singleflight import inflight
+from services.workdir import job_workdir
 
 logger = logging.getLogger(__name__)
 
+# Обработчики платформ (selenium, yt_dlp, instaloader) загружаются при первом
+# использовании или фоновым прогревом после старта (см. main.on_startup)
+PLATFORM_MODULES = (
+    'handlers.video',
+    'handlers.vk_video',
+    'handlers.vk',
+    'handlers.twitter',
+    'handlers.instagram',
+)
+handle_instagram = lazy_callable('handlers.instagram', 'handle_instagram')
+handle_twitter_post = lazy_callable('handlers.twitter', 'handle_twitter_post')
+handle_vk_post = lazy_callable('handlers.vk', 'handle_vk_post')
+handle_video_download = lazy_callable('handlers.video', 'handle_video_download')
+handle_vk_video_download = lazy_callable('handlers.vk_video', 'handle_vk_video_download')
+
+# Обработчики по именам из services.router.ROUTE_HANDLERS
+LINK_HANDLERS: Dict[str, Callable[..., Awaitable[None]]] = {
+    'instagram': handle_instagram,
+    'vk_video': handle_vk_video_download,
+    'vk_post': handle_vk_post,
+    'twitter': handle_twitter_post,
+    'video': handle_video_download,
+}
+
 async def start(message: Message):
     """Обработчик команды /start"""
     await message.answer(
@@ -28,61 +55,98 @@ async def start(message: Message):
     )
 
 async def handle_links(message: Message):
-    url = message.text.strip()
-    try:
-        # if re.search(PLATFORMS["dzen"], url, re.IGNORECASE):
-        #     await handle_video_download_dzen(message, url)
-        #     return
-        # if re.search(PLATFORMS["yandex_zen"], url, re.IGNORECASE):
-        #     await handle_zen_content(message, url)
-        #     return
-        # Обработка Instagram
-        if re.search(PLATFORMS["instagram"], url, re.IGNORECASE):
-            await handle_instagram(message, url)
-            return
-        # Обработка VK
-        if 'vk.com' in url or 'vkvideo.ru' in url:  # Проверяем оба домена
-            if any(
-                p in url for p in [
-                    '/video', 
-                    '/clip', 
-                    'video_ext.php', 
-                    'vkvideo.ru/video-',  # video-XXXXX_YYYYY
-                    'vkvideo.ru/clip-'   # clip-XXXXX_YYYYY
-                ]
-            ):
-                await handle_vk_video_download(message, url)
-            elif any(p in url for p in ['wall-', '?w=wall', '?z=wall']):
-                await handle_vk_post(message, url)
-            else:
-                await message.answer("ℹ️ Укажите прямую ссылку на видео или пост VK")
-            return
+    """
+    Обрабатывает все ссылки сообщения параллельно (каждая - отдельная задача в очереди);
+    результаты приходят в порядке ссылок в сообщении
+    """
+    text = message.text or message.caption
+    if not text:
+        return
+    urls = extract_urls(text, message.entities or message.caption_entities, MAX_LINKS_PER_MESSAGE)
+    if not urls:
+        # Ссылка без схемы (youtube.com/...) или просто текст - как раньше, целиком
+        urls = [text.strip()]
 
-        # Проверка Twitter/X
-        if re.search(PLATFORMS["twitter"], url, re.IGNORECASE) and any(p in url for p in TWITTER_PATTERNS):
-            await handle_twitter_post(message, url)
-            return
+    if len(urls) == 1:
+        await run_link(message, urls[0])
+        return
+
+    batch = DeliveryBatch(len(urls))
+    await asyncio.gather(*(run_link(message, url, batch, index) for index, url in enumerate(urls)))
+
+async def run_link(
+    message: Message,
+    url: str,
+    batch: Optional[DeliveryBatch] = None,
+    index: int = 0
+):
+    """Ставит одну ссылку в общую очередь задач и обрабатывает ее, когда освободится слот"""
+    user_id = message.from_user.id if message.from_user else message.chat.id
+    if batch is not None:
+        bind_delivery(batch, index)
+
+    async def notify_queued(position: int):
+        await message.answer(f"🕐 Вы №{position} в очереди, начну как только освободится место")
 
-        # Проверка других платформ
-        platform_detected = False
-        for platform, pattern in PLATFORMS.items():
-            if platform in ["vk", "twitter"]:
-                continue  # Уже обработаны выше
-                
-            if re.search(pattern, url, re.IGNORECASE):
-                platform_detected = True
-                await handle_video_download(message, url)
-                break
-
-        if not platform_detected:
+    async def notify_in_flight():
+        await message.answer("⏳ Эта ссылка уже обрабатывается, отправлю результат как только он будет готов")
+
+    async def run_job():
+        with span('scheduler'):
+            return await job_scheduler.run(user_id, lambda: process_link(message, url), on_queued=notify_queued)
+
+    try:
+        with request_trace('link', url=url, chat_id=message.chat.id, user_id=user_id):
+            # Одинаковые ссылки из разных чатов ждут первую и получают результат из кэша file_id
+            await inflight.follow(normalize_source_url(url), run_job, on_wait=notify_in_flight)
+    except QueueFull:
+        await message.answer("🚦 Сейчас слишком много запросов, попробуйте позже")
+    finally:
+        if batch is not None:
+            batch.finish(index)
+
+async def process_link(message: Message, url: str):
+    """Определяет платформу и передает ссылку нужному обработчику"""
+    try:
+        with stage('classify'):
+            route = classify_url(url)
+        platform, kind = route['platform'], route['kind']
+        if platform is None:
             await message.answer("❌ Платформа не поддерживается. Отправьте ссылку на:\n"
                                "- Видео (YouTube, Instagram, TikTok, VK)\n"
                                "- Пост (Twitter/X, VK)")
+            return
 
+        # Посты VK отправляются ссылками на медиа и почти не занимают диск
+        estimate_mb = DISK_POST_JOB_MB if platform == 'vk' and kind not in ('video', 'clip') else DISK_VIDEO_JOB_MB
+        async with disk_manager.reserve(estimate_mb * 1024 * 1024) as reservation:
+            # Все файлы задачи живут в ее папке и удаляются вместе с ней
+            async with job_workdir(reservation):
+                with span('process_link', platform=platform, kind=kind):
+                    await dispatch_link(message, url, platform, kind)
+
+    except DiskQuotaExceeded as e:
+        logger.error(f"Disk quota: {str(e)}")
+        await message.answer("💾 На сервере сейчас нет места для загрузки, попробуйте позже")
     except Exception as e:
         logger.error(f"Ошибка обработки ссылки: {str(e)}", exc_info=True)
         await message.answer(f"⚠️ Произошла ошибка: {str(e)}")
 
+async def dispatch_link(message: Message, url: str, platform: str, kind: str):
+    """Передает ссылку обработчику из таблицы маршрутов (метрики помечаются именем обработчика)"""
+    name = handler_for(platform, kind)
+    handler = LINK_HANDLERS.get(name)
+    if handler is None:
+        # vk_hint: ссылка VK не на видео и не на пост
+        await message.answer("ℹ️ Укажите прямую ссылку на видео или пост VK")
+        return
+    with track_request(handler.__name__):
+        if name == 'vk_post':
+            # Тип уже определен роутером, парсер VK не разбирает ссылку повторно
+            await handler(message, url, kind=kind)
+        else:
+            await handler(message, url)
+
 def register_base_handlers(dp):
     """Регистрация обработчиков"""
     dp.message.register(start, Command("start"))
@@ -1,18 +1,37 @@
-from aiogram.types import Message, BufferedInputFile
+from aiogram.types import Message
 from services.instagram import InstagramDownloader
-from config import DOWNLOAD_DIR, MAX_FILE_SIZE, MAX_TELEGRAM_VIDEO_SIZE
+from config import MAX_TELEGRAM_VIDEO_SIZE
+from handlers.media.cached import send_cached, remember_sent, sent_item
+from handlers.media.upload import upload_file
+from handlers.media.delivery import delivery_turn
+from handlers.media.progress import delete_status
 import os
 import logging
-import asyncio
+from typing import Optional
 
 logger = logging.getLogger(__name__)
 
-downloader = InstagramDownloader()
+_downloader: Optional[InstagramDownloader] = None
+
+
+def get_downloader() -> InstagramDownloader:
+    """Создает загрузчик при первом запросе, а не при импорте модуля"""
+    global _downloader
+    if _downloader is None:
+        _downloader = InstagramDownloader()
+    return _downloader
+
+CACHE_PROFILE = 'instagram_merged'
 
 async def handle_instagram(message: Message, url: str):
     """Обработчик для Instagram с объединением медиа"""
+    status_msg: Optional[Message] = None
     try:
+        if await send_cached(message, url, CACHE_PROFILE):
+            return
+
         status_msg = await message.answer("🔄 Обрабатываю контент...")
+        downloader = get_downloader()
         
         # Загружаем с объединением фото и видео
         result, status = await downloader.download_content(url, merge_all=True)
@@ -21,49 +40,57 @@ async def handle_instagram(message: Message, url: str):
             await message.answer(f"❌ Ошибка: {status}")
             return
         
-        # Отправляем текст если есть
-        if result['text']:
-            with open(result['text'][0], 'r', encoding='utf-8') as f:
-                text = f.read()
-                # Разбиваем длинный текст на части
-                for i in range(0, len(text), 4000):
-                    await message.answer(f"📝 Текст {'(продолжение)' if i > 0 else ''}:\n{text[i:i+4000]}")
+        async with delivery_turn():
+            sent_items = []
+
+            # Отправляем текст если есть
+            if result['text']:
+                with open(result['text'][0], 'r', encoding='utf-8') as f:
+                    text = f.read()
+                    # Разбиваем длинный текст на части
+                    for i in range(0, len(text), 4000):
+                        chunk = f"📝 Текст {'(продолжение)' if i > 0 else ''}:\n{text[i:i+4000]}"
+                        await message.answer(chunk)
+                        sent_items.append({'type': 'text', 'text': chunk})
         
-        # Отправляем медиафайлы
-        for file in result['media']:
-            try:
-                await _send_media_file(message, file)
-            except Exception as e:
-                logger.error(f"Failed to send file {file}: {str(e)}")
-            finally:
-                await downloader._safe_remove_file(file)
+            # Отправляем медиафайлы
+            media_sent = False
+            for file in result['media']:
+                try:
+                    sent = await _send_media_file(message, file)
+                    if sent:
+                        media_sent = True
+                        sent_items.append(sent_item(sent))
+                except Exception as e:
+                    logger.error(f"Failed to send file {file}: {str(e)}")
+                finally:
+                    await downloader._safe_remove_file(file)
         
+        if media_sent:
+            remember_sent(url, sent_items, CACHE_PROFILE)
+
         # Удаляем текстовый файл
         if result['text']:
             await downloader._safe_remove_file(result['text'][0])
         
-        await message.bot.delete_message(message.chat.id, status_msg.message_id)
-        
     except Exception as e:
         logger.critical(f"Fatal error: {str(e)}", exc_info=True)
         await message.answer("💥 Произошла критическая ошибка")
+    finally:
+        if status_msg is not None:
+            await delete_status(status_msg)
 
-async def _send_media_file(message: Message, file_path: str):
+async def _send_media_file(message: Message, file_path: str) -> Optional[Message]:
     """Отправка медиафайла с проверкой размера"""
     file_size = os.path.getsize(file_path) / (1024 * 1024)  # MB
     
     if file_size > MAX_TELEGRAM_VIDEO_SIZE:
         await message.answer(f"📦 Файл слишком большой ({file_size:.1f}MB)")
-        return
-        
-    with open(file_path, 'rb') as f:
-        file_data = f.read()
-        filename = os.path.basename(file_path)
+        return None
         
-        if filename.lower().endswith(('.mp4', '.mov')):
-            await message.answer_video(BufferedInputFile(file_data, filename))
-        else:
-            await message.answer_photo(BufferedInputFile(file_data, filename))
+    if file_path.lower().endswith(('.mp4', '.mov')):
+        return await message.answer_video(upload_file(file_path))
+    return await message.answer_photo(upload_file(file_path))
 
 async def _safe_remove_file(path: str):
     """Безопасное удаление файла"""
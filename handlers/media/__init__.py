@@ -1,9 +1,24 @@
 from .media_group import send_media_group
 from .image_utils import download_and_send_image
 from .video_utils import send_video_file
+from .cached import send_cached, send_cached_items, remember_sent, sent_item
+from .upload import upload_file, upload_media
+from .delivery import DeliveryBatch, bind_delivery, delivery_turn
+from .progress import delete_status, track_progress
 
 __all__ = [
     'send_media_group',
     'download_and_send_image',
-    'send_video_file'
+    'send_video_file',
+    'send_cached',
+    'send_cached_items',
+    'remember_sent',
+    'sent_item',
+    'upload_file',
+    'upload_media',
+    'DeliveryBatch',
+    'bind_delivery',
+    'delivery_turn',
+    'track_progress',
+    'delete_status'
 ]
\ No newline at end of file
@@ -0,0 +1,77 @@
+from typing import Dict, List, Optional
+from aiogram.types import Message
+from services.file_cache import file_id_cache
+from .delivery import delivery_turn
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def sent_item(sent: Optional[Message], caption: Optional[str] = None) -> Optional[Dict]:
+    """
+    Извлекает file_id из отправленного сообщения для сохранения в кэш
+    :param sent: Сообщение, которое вернул answer_video/answer_photo
+    :param caption: Подпись, с которой файл был отправлен
+    :return: Элемент кэша или None
+    """
+    if sent is None:
+        return None
+    if sent.video:
+        return {'type': 'video', 'file_id': sent.video.file_id, 'caption': caption}
+    if sent.photo:
+        return {'type': 'photo', 'file_id': sent.photo[-1].file_id, 'caption': caption}
+    if sent.document:
+        return {'type': 'document', 'file_id': sent.document.file_id, 'caption': caption}
+    return None
+
+
+def remember_sent(url: str, items: List[Optional[Dict]], profile: str = 'default'):
+    """Сохраняет отправленные элементы в кэш file_id"""
+    items = [item for item in items if item]
+    if items:
+        file_id_cache.put(url, items, profile)
+
+
+async def send_cached(message: Message, url: str, profile: str = 'default') -> bool:
+    """
+    Повторно отправляет контент по file_id, если он уже есть в кэше
+    :param message: Объект сообщения aiogram
+    :param url: Исходная ссылка
+    :param profile: Профиль качества/обработки
+    :return: True, если контент отправлен из кэша
+    """
+    return await send_cached_items(message, url, file_id_cache.get(url, profile), profile)
+
+
+async def send_cached_items(
+    message: Message,
+    url: str,
+    items: Optional[List[Dict]],
+    profile: str = 'default'
+) -> bool:
+    """
+    Отправляет заранее прочитанную из кэша запись (проверка кэша до очереди
+    отправки, сама отправка - в свою очередь)
+    :return: True, если контент отправлен из кэша
+    """
+    if not items:
+        return False
+
+    try:
+        async with delivery_turn():
+            for item in items:
+                if item['type'] == 'video':
+                    await message.answer_video(item['file_id'], caption=item.get('caption'))
+                elif item['type'] == 'photo':
+                    await message.answer_photo(item['file_id'], caption=item.get('caption'))
+                elif item['type'] == 'document':
+                    await message.answer_document(item['file_id'], caption=item.get('caption'))
+                elif item['type'] == 'text':
+                    await message.answer(item['text'])
+        logger.info(f"Sent from file_id cache: {url}")
+        return True
+    except Exception as e:
+        # file_id мог устареть - удаляем запись и идем обычным путем
+        logger.warning(f"Cached file_id rejected for {url}: {str(e)}")
+        file_id_cache.invalidate(url, profile)
+        return False
@@ -0,0 +1,50 @@
+import asyncio
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+from services.scheduler import job_scheduler
+
+
+class DeliveryBatch:
+    """Очередность отправки результатов для ссылок из одного сообщения"""
+
+    def __init__(self, size: int):
+        self._finished: List[asyncio.Event] = [asyncio.Event() for _ in range(size)]
+
+    def is_turn(self, index: int) -> bool:
+        return all(event.is_set() for event in self._finished[:index])
+
+    async def wait_turn(self, index: int):
+        """Ждет, пока все предыдущие ссылки закончат отправку"""
+        for event in self._finished[:index]:
+            await event.wait()
+
+    def finish(self, index: int):
+        self._finished[index].set()
+
+
+# (пакет, номер ссылки) для текущей задачи; None - ссылка в сообщении одна
+_current: ContextVar[Optional[Tuple[DeliveryBatch, int]]] = ContextVar('delivery_slot', default=None)
+
+
+def bind_delivery(batch: DeliveryBatch, index: int):
+    """Привязывает текущую задачу к месту в пакете (вызывается внутри задачи)"""
+    _current.set((batch, index))
+
+
+@asynccontextmanager
+async def delivery_turn():
+    """
+    Оборачивает отправку результата: ссылки из одного сообщения обрабатываются
+    параллельно, но их результаты приходят в порядке ссылок в сообщении
+    """
+    slot = _current.get()
+    if slot is not None:
+        batch, index = slot
+        if not batch.is_turn(index):
+            # Предыдущая ссылка может еще ждать слот в очереди задач (например,
+            # как повтор той же ссылки) - держать слот во время ожидания нельзя
+            job_scheduler.release_current()
+            await batch.wait_turn(index)
+    yield
@@ -1,7 +1,7 @@
-from aiogram.types import Message,BufferedInputFile
-from services.utils import download_image
+from aiogram.types import Message
+from services.utils import fetch_image
+from .upload import upload_media
 import time
-import os
 import logging
 
 logger = logging.getLogger(__name__)
@@ -26,14 +26,15 @@ async def download_and_send_image(
         if not filename:
             filename = f"image_{int(time.time())}.jpg"
         
-        filepath = await download_image(url, filename)
+        media = await fetch_image(url, filename)
         
-        with open(filepath, 'rb') as f:
+        try:
             await message.answer_photo(
-                photo=BufferedInputFile(f.read(), filename=filename),
+                photo=upload_media(media),
                 caption=caption
             )
-        os.remove(filepath)
+        finally:
+            media.release()
         return True
     except Exception as e:
         logger.error(f"Ошибка отправки изображения: {str(e)}")
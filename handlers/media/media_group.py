@@ -1,71 +1,111 @@
-import os
-from typing import List
-from aiogram.types import Message, InputMediaPhoto, BufferedInputFile
-from services.utils import download_image
+import asyncio
+import uuid
+from typing import List, Optional, Tuple
+from aiogram.types import Message, InputMediaPhoto
+from config import MEDIA_FETCH_CONCURRENCY
+from services.media_buffer import FetchedMedia
+from services.utils import fetch_image
+from .upload import upload_media
 import logging
 import time
 
 logger = logging.getLogger(__name__)
 
+# Ограничение Telegram на число файлов в одном альбоме (sendMediaGroup: 2-10)
+MEDIA_GROUP_LIMIT = 10
+
+
+async def _fetch_item(
+    semaphore: asyncio.Semaphore,
+    url: str,
+    filename: str
+) -> Tuple[Optional[FetchedMedia], float]:
+    """Скачивает один файл альбома, возвращает его (или None) и время загрузки"""
+    async with semaphore:
+        started = time.monotonic()
+        try:
+            fetched = await fetch_image(url, filename)
+        except Exception as e:
+            logger.warning(f"Не удалось скачать {url}: {str(e)}")
+            fetched = None
+        return fetched, time.monotonic() - started
+
 
 async def send_media_group(
     message: Message,
     image_urls: List[str],
     video_preview_urls: List[str] = None,
-    max_items: int = 10
+    max_items: Optional[int] = None
 ) -> bool:
     """
-    Отправляет группу медиафайлов в одном сообщении
+    Отправляет медиафайлы альбомами по MEDIA_GROUP_LIMIT, одиночный файл - обычным фото
     :param message: Объект сообщения aiogram
     :param image_urls: Список URL изображений
     :param video_preview_urls: Список URL превью видео
-    :param max_items: Максимальное количество медиафайлов
+    :param max_items: Максимальное количество медиафайлов (None - все)
     :return: Статус отправки (True/False)
     """
     if not video_preview_urls:
         video_preview_urls = []
 
-    media = []
-    total_items = min(len(image_urls) + len(video_preview_urls), max_items)
-    
+    # Изображения идут первыми, превью видео - на оставшиеся места
+    urls = (image_urls + video_preview_urls)[:max_items]
+    batch = uuid.uuid4().hex[:8]
+    filenames = [
+        f"media_{i}_{batch}.jpg" if i < len(image_urls) else f"video_preview_{i}_{batch}.jpg"
+        for i in range(len(urls))
+    ]
+
+    downloaded: List[FetchedMedia] = []  # освобождаются только после отправки
     try:
-        # Обработка изображений
-        for i, url in enumerate(image_urls[:total_items]):
-            try:
-                filename = f"media_{i}_{int(time.time())}.jpg"
-                filepath = await download_image(url, filename)
-                
-                with open(filepath, 'rb') as f:
-                    media.append(InputMediaPhoto(
-                        media=BufferedInputFile(f.read(), filename=filename)
-                    ))
-                os.remove(filepath)
-            except Exception as e:
-                continue
+        # Скачиваем параллельно; gather сохраняет исходный порядок
+        semaphore = asyncio.Semaphore(MEDIA_FETCH_CONCURRENCY)
+        started = time.monotonic()
+        tasks = [
+            asyncio.ensure_future(_fetch_item(semaphore, url, name))
+            for url, name in zip(urls, filenames)
+        ]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            # Отмена: уже скачанное возвращаем в бюджет памяти, остальное останавливаем
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled() and task.exception() is None and task.result()[0]:
+                    task.result()[0].release()
+            raise
 
-        # Обработка видео-превью (если осталось место)
-        if len(media) < total_items:
-            for url in video_preview_urls[:total_items - len(media)]:
-                try:
-                    filename = f"video_preview_{int(time.time())}.jpg"
-                    filepath = await download_image(url, filename)
-                    
-                    with open(filepath, 'rb') as f:
-                        media.append(InputMediaPhoto(
-                            media=BufferedInputFile(f.read(), filename=filename)
-                        ))
-                    os.remove(filepath)
-                except Exception:
-                    continue
+        media = []
+        for url, (fetched, elapsed) in zip(urls, results):
+            logger.debug(f"Fetched {url} in {elapsed:.2f}s")
+            if fetched:
+                downloaded.append(fetched)
+                media.append(InputMediaPhoto(media=upload_media(fetched)))
 
-        if media:
-            await message.bot.send_media_group(
-                chat_id=message.chat.id,
-                media=media
-            )
-            return True
-        return False
+        logger.info(
+            f"Media group fetched {len(media)}/{len(urls)} items in {time.monotonic() - started:.2f}s "
+            f"(slowest {max((r[1] for r in results), default=0):.2f}s, "
+            f"{sum(1 for item in downloaded if item.in_memory)} in memory)"
+        )
+
+        if not media:
+            return False
+        for offset in range(0, len(media), MEDIA_GROUP_LIMIT):
+            chunk = media[offset:offset + MEDIA_GROUP_LIMIT]
+            if len(chunk) == 1:
+                # Альбом из одного файла Telegram отклоняет
+                await message.answer_photo(photo=chunk[0].media)
+            else:
+                await message.bot.send_media_group(
+                    chat_id=message.chat.id,
+                    media=chunk
+                )
+        return True
         
     except Exception as e:
         logger.error(f"Ошибка отправки медиагруппы: {str(e)}")
-        return False
\ No newline at end of file
+        return False
+    finally:
+        for fetched in downloaded:
+            fetched.release()
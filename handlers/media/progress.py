@@ -0,0 +1,30 @@
+import logging
+from contextlib import contextmanager
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import Message
+from services.progress import ProgressReporter, bind_progress
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def track_progress(status: Message):
+    """
+    Показывает ход загрузки и сжатия правками статусного сообщения
+    (не чаще PROGRESS_EDIT_INTERVAL на чат)
+    :param status: Сообщение бота, которое будет редактироваться
+    """
+    reporter = ProgressReporter(status.edit_text, status.chat.id)
+    with bind_progress(reporter):
+        yield reporter
+
+
+async def delete_status(status: Message):
+    """
+    Удаляет статусное сообщение; ошибка (сообщение уже удалено, 429) не должна
+    превращать успешно отправленный результат в ответ об ошибке
+    """
+    try:
+        await status.delete()
+    except TelegramAPIError as e:
+        logger.warning(f"Status message not deleted: {str(e)}")
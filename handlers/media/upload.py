@@ -0,0 +1,46 @@
+import mmap
+import os
+from typing import AsyncGenerator, Optional
+from aiogram.types import BufferedInputFile, FSInputFile, InputFile
+from config import UPLOAD_CHUNK_SIZE, UPLOAD_USE_MMAP
+from services.media_buffer import FetchedMedia
+
+
+class MmapInputFile(InputFile):
+    """Файл для отправки, читаемый частями через mmap (без копирования в память целиком)"""
+
+    def __init__(self, path: str, filename: Optional[str] = None, chunk_size: int = UPLOAD_CHUNK_SIZE):
+        if filename is None:
+            filename = os.path.basename(path)
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.path = path
+
+    async def read(self, bot) -> AsyncGenerator[bytes, None]:
+        with open(self.path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for offset in range(0, len(mm), self.chunk_size):
+                    yield mm[offset:offset + self.chunk_size]
+
+
+def upload_file(path: str, filename: Optional[str] = None) -> InputFile:
+    """
+    Единая точка подготовки файла к отправке: данные читаются с диска частями
+    во время загрузки, а не целиком в память
+    :param path: Путь к файлу
+    :param filename: Имя файла для Telegram (по умолчанию - имя на диске)
+    :return: InputFile для answer_video/answer_photo/InputMedia*
+    """
+    if filename is None:
+        filename = os.path.basename(path)
+    if UPLOAD_USE_MMAP:
+        return MmapInputFile(path, filename=filename)
+    return FSInputFile(path, filename=filename, chunk_size=UPLOAD_CHUNK_SIZE)
+
+
+def upload_media(media: FetchedMedia) -> InputFile:
+    """InputFile для FetchedMedia: байты из памяти или файл с диска"""
+    if media.in_memory:
+        return BufferedInputFile(media.data, filename=media.filename)
+    return upload_file(media.path, filename=media.filename)
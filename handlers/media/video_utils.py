@@ -1,7 +1,7 @@
 import os
-from aiogram.types import Message, BufferedInputFile
-from config import MAX_FILE_SIZE
-from services.utils import compress_video
+from aiogram.types import Message
+from services.utils import prepare_video
+from .upload import upload_file
 import logging
 
 logger = logging.getLogger(__name__)
@@ -22,21 +22,19 @@ async def send_video_file(
     :return: Статус отправки
     """
     try:
-        # Проверка размера и сжатие при необходимости
-        if os.path.getsize(filepath) > MAX_FILE_SIZE:
-            compressed_path = f"{filepath}_compressed.mp4"
-            if await compress_video(filepath, compressed_path):
-                if remove_after:
-                    os.remove(filepath)
-                filepath = compressed_path
-        
-        with open(filepath, 'rb') as f:
-            await message.answer_video(
-                video=BufferedInputFile(f.read(), filename=os.path.basename(filepath)),
-                caption=caption
-            )
-        
-        if remove_after:
+        # Перепаковка/сжатие только при необходимости
+        original_path = filepath
+        prepared = await prepare_video(filepath, keep_original=not remove_after)
+        if prepared:
+            filepath = prepared
+
+        await message.answer_video(
+            video=upload_file(filepath),
+            caption=caption
+        )
+
+        # Созданный нами файл удаляем всегда, исходный - только если просили
+        if remove_after or filepath != original_path:
             os.remove(filepath)
         return True
         
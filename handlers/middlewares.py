@@ -0,0 +1,71 @@
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.types import InputFile, TelegramObject
+
+from services.metrics import api_calls_total, bytes_uploaded_total, current_handler, stage
+
+# Методы, которые загружают медиа (их время - стадия upload)
+UPLOAD_METHODS = ('SendVideo', 'SendPhoto', 'SendDocument', 'SendMediaGroup', 'SendAnimation', 'SendAudio')
+
+
+class ConcurrencyLimitMiddleware(BaseMiddleware):
+    """Ограничивает число одновременно обрабатываемых обновлений"""
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        # Семафор создается внутри работающего loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        async with self._semaphore:
+            return await handler(event, data)
+
+
+def _upload_size(method: TelegramMethod) -> int:
+    """Сколько байт файлов уходит в запросе (file_id и URL не считаются)"""
+    files = [getattr(method, field, None) for field in ('video', 'photo', 'document', 'animation', 'audio')]
+    files.extend(getattr(item, 'media', None) for item in getattr(method, 'media', None) or [])
+    total = 0
+    for file in files:
+        if not isinstance(file, InputFile):
+            continue
+        data = getattr(file, 'data', None)
+        path = getattr(file, 'path', None)
+        if data is not None:
+            total += len(data)
+        elif path and os.path.exists(path):
+            total += os.path.getsize(path)
+    return total
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Считает вызовы Bot API и время/объем загрузки медиа в Telegram"""
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot, method: TelegramMethod):
+        name = type(method).__name__
+        try:
+            if name in UPLOAD_METHODS:
+                size = _upload_size(method)
+                with stage('upload'):
+                    result = await make_request(bot, method)
+                if size:
+                    bytes_uploaded_total.inc(size, handler=current_handler())
+            else:
+                result = await make_request(bot, method)
+        except Exception as e:
+            api_calls_total.inc(method=name, status=type(e).__name__)
+            raise
+        api_calls_total.inc(method=name, status='ok')
+        return result
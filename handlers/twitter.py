@@ -1,16 +1,24 @@
 from aiogram import types
-from aiogram.types import BufferedInputFile
 from services.twitter_parser import TwitterParser
 from services.downloader import download_twitter_video
-from handlers.media import send_media_group
+from handlers.media import send_media_group, upload_file, send_cached_items, remember_sent, sent_item, track_progress, delete_status
+from handlers.media.delivery import delivery_turn
 import logging
-import html
 import os
+from typing import Dict, List, Optional, Tuple
 from config import MAX_FILE_SIZE
-from services.utils import compress_video
+from services.utils import prepare_video
+from services.file_cache import file_id_cache, normalize_source_url
+from services.singleflight import inflight
+from services.metrics import stage
 
 logger = logging.getLogger(__name__)
 
+VIDEO_CACHE_PROFILE = 'twitter_video'
+
+# (запись кэша file_id, путь к готовому файлу, ошибка подготовки)
+PreparedVideo = Tuple[Optional[List[Dict]], Optional[str], Optional[Exception]]
+
 class TwitterHandler:
     def __init__(self):
         self.parser = TwitterParser()
@@ -21,17 +29,33 @@ class TwitterHandler:
             await message.answer("⏳ Получаю контент из Twitter...")
             
             # Получаем данные через Selenium
-            content = await self.parser.get_twitter_content(url)
+            with stage('extract'):
+                content = await inflight.share(
+                    f"twitter_parse|{normalize_source_url(url)}",
+                    lambda: self.parser.get_twitter_content(url)
+                )
             
             if not content:
                 raise ValueError("Не удалось получить контент")
 
-            # Отправка текста
-            if content.get('text'):
-                await self._send_text(message, content['text'])
-            
-            # Обработка медиа
-            await self._handle_media(message, content.get('media', {}))
+            media = content.get('media') or {}
+            video_url = media['videos'][0] if media.get('videos') else None
+            # Загрузка и сжатие - до очереди отправки, параллельно с другими ссылками сообщения
+            video = await self._prepare_video(message, video_url) if video_url else None
+            try:
+                async with delivery_turn():
+                    # Отправка текста
+                    if content.get('text'):
+                        await self._send_text(message, content['text'])
+
+                    # Видео имеет приоритет, затем изображения
+                    if video is not None:
+                        await self._send_video(message, video_url, video)
+                    if media.get('images'):
+                        await send_media_group(message, media['images'], [])
+            finally:
+                if video is not None and video[1] and os.path.exists(video[1]):
+                    os.remove(video[1])
             
         except Exception as e:
             logger.error(f"Twitter error: {str(e)}", exc_info=True)
@@ -45,63 +69,74 @@ class TwitterHandler:
             parse_mode="HTML"
         )
 
-    async def _handle_media(self, message: types.Message, media: dict):
-        """Обработка медиа контента"""
-        if not media:
-            return
-
-        # Видео имеет приоритет
-        if media.get('videos'):
-            await self._handle_video(message, media['videos'][0])
-        
-        # Затем изображения
-        if media.get('images'):
-            await send_media_group(message, media['images'], [])
-    async def _handle_video(self, message: types.Message, video_url: str):
-        """Улучшенная обработка Twitter видео"""
+    async def _prepare_video(self, message: types.Message, video_url: str) -> PreparedVideo:
+        """
+        Запись кэша file_id или скачанное и сжатое видео.
+        Ошибка не выбрасывается, а возвращается, чтобы сообщить о ней в порядке отправки
+        """
+        cached = file_id_cache.get(video_url, VIDEO_CACHE_PROFILE)
+        if cached:
+            return cached, None, None
+
+        video_path = None
+        status = await message.answer("⏳ Скачиваю видео... Это может занять до минуты")
         try:
-            await message.answer("⏳ Скачиваю видео... Это может занять до минуты")
-            
-            # Пробуем скачать видео
-            video_path = await download_twitter_video(video_url)
-            
-            # Проверяем размер файла
-            file_size = os.path.getsize(video_path)
-            if file_size > MAX_FILE_SIZE:
-                compressed_path = f"{video_path}_compressed.mp4"
-                await message.answer("⚠️ Видео слишком большое, пробую сжать...")
-                
-                if await compress_video(video_path, compressed_path):
-                    if os.path.getsize(compressed_path) <= MAX_FILE_SIZE:
-                        os.remove(video_path)
-                        video_path = compressed_path
-                    else:
-                        os.remove(compressed_path)
-                        raise ValueError("Не удалось сжать видео до допустимого размера")
-            
+            with track_progress(status) as reporter:
+                # Пробуем скачать видео
+                video_path = await download_twitter_video(video_url)
+
+                # Проверяем размер файла и формат
+                oversized = os.path.getsize(video_path) > MAX_FILE_SIZE
+                if oversized:
+                    reporter.update("⚠️ Видео слишком большое, пробую сжать...")
+
+                prepared = await prepare_video(video_path)
+                if prepared:
+                    video_path = prepared
+                elif oversized:
+                    raise ValueError("Не удалось сжать видео до допустимого размера")
+            return None, video_path, None
+        except Exception as e:
+            if video_path and os.path.exists(video_path):
+                os.remove(video_path)
+            return None, None, e
+        finally:
+            await delete_status(status)
+
+    async def _send_video(self, message: types.Message, video_url: str, video: PreparedVideo):
+        """Отправка подготовленного видео (вызывается в очереди отправки)"""
+        cached, video_path, error = video
+        if cached:
+            if await send_cached_items(message, video_url, cached, VIDEO_CACHE_PROFILE):
+                return
+            # file_id устарел (запись уже удалена из кэша) - скачиваем заново
+            _, video_path, error = await self._prepare_video(message, video_url)
+
+        try:
+            if error is not None:
+                raise error
+
             # Отправляем видео
-            with open(video_path, 'rb') as f:
-                await message.answer_video(
-                    video=BufferedInputFile(
-                        f.read(),
-                        filename="twitter_video.mp4"
-                    ),
-                    caption="🎥 Видео из Twitter"
-                )
-                
+            caption = "🎥 Видео из Twitter"
+            sent = await message.answer_video(
+                video=upload_file(video_path, filename="twitter_video.mp4"),
+                caption=caption
+            )
+            remember_sent(video_url, [sent_item(sent, caption)], VIDEO_CACHE_PROFILE)
+
         except Exception as e:
             logger.error(f"Video handling error: {str(e)}")
             await message.answer(f"❌ Не удалось обработать видео: {str(e)}")
-            
-            # Пробуем отправить хотя бы превью
+
+            # Пробуем отправить хотя бы ссылку на видео
             try:
-                if 'video_url' in locals():
-                    await message.answer(f"Ссылка на видео: {video_url}")
+                await message.answer(f"Ссылка на видео: {video_url}")
             except:
                 pass
         finally:
-            if 'video_path' in locals() and os.path.exists(video_path):
+            if video_path and os.path.exists(video_path):
                 os.remove(video_path)
+
     # Глобальный экземпляр обработчика
 twitter_handler = TwitterHandler()
 
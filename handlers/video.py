@@ -1,33 +1,45 @@
 from aiogram import types
 import os
-from config import MAX_FILE_SIZE
 from services.downloader import download_video
-from services.utils import compress_video
+from services.utils import prepare_video
+from handlers.media.cached import send_cached, remember_sent, sent_item
+from handlers.media.upload import upload_file
+from handlers.media.delivery import delivery_turn
+from handlers.media.progress import delete_status, track_progress
 import logging
 
 
 logger = logging.getLogger(__name__)
 
+CACHE_PROFILE = 'video'
+
 async def handle_video_download(message: types.Message, url: str):
     """Обрабатывает запрос на скачивание видео"""
     try:
-        await message.answer("⏳ Скачиваю видео...")
-        filename = await download_video(url)
-        
-        if os.path.getsize(filename) > MAX_FILE_SIZE:
-            compressed = f"{filename}_compressed.mp4"
-            if await compress_video(filename, compressed):
-                os.remove(filename)
-                filename = compressed
+        if await send_cached(message, url, CACHE_PROFILE):
+            return
+
+        status = await message.answer("⏳ Скачиваю видео...")
+        with track_progress(status):
+            filename = await download_video(url)
+
+            prepared = await prepare_video(filename)
+            if prepared:
+                filename = prepared
         
-        with open(filename, 'rb') as f:
-            await message.answer_video(
-                video=types.BufferedInputFile(f.read(), filename=os.path.basename(filename)),
-                caption="Ваше видео готово!"
+        async with delivery_turn():
+            caption = "Ваше видео готово!"
+            sent = await message.answer_video(
+                video=upload_file(filename),
+                caption=caption
             )
+        remember_sent(url, [sent_item(sent, caption)], CACHE_PROFILE)
         os.remove(filename)
         
     except Exception as e:
         await message.answer(f"❌ Ошибка: {str(e)}")
         if 'filename' in locals() and os.path.exists(filename):
             os.remove(filename)
+    finally:
+        if 'status' in locals():
+            await delete_status(status)
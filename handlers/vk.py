@@ -1,24 +1,34 @@
+from services.file_cache import normalize_source_url
+from services.metrics import stage
+from services.singleflight import inflight
 from services.vk_parser import vk_parser
 from aiogram import types
+from handlers.media.delivery import delivery_turn
 import logging
+from typing import Optional
 
 logger = logging.getLogger(__name__)
 
-async def handle_vk_post(message: types.Message, url: str):
+async def handle_vk_post(message: types.Message, url: str, kind: Optional[str] = None):
     """Улучшенный обработчик VK контента"""
     try:
         await message.answer("⏳ Получаю данные из VK...")
-        data = await vk_parser.parse_vk_url(url)
+        with stage('extract'):
+            data = await inflight.share(
+                f"vk_parse|{normalize_source_url(url)}",
+                lambda: vk_parser.parse_vk_url(url, kind)
+            )
         
         if not data:
             raise ValueError("Не удалось получить данные. Попробуйте позже или проверьте ссылку.")
 
-        if data['type'] == 'video':
-            await _handle_vk_media(message, data, is_video=True)
-        elif data['type'] == 'post':
-            await _handle_vk_wall_post(message, data)
-        else:
-            raise ValueError("Неизвестный тип контента")
+        async with delivery_turn():
+            if data['type'] == 'video':
+                await _handle_vk_media(message, data, is_video=True)
+            elif data['type'] == 'post':
+                await _handle_vk_wall_post(message, data)
+            else:
+                raise ValueError("Неизвестный тип контента")
             
     except Exception as e:
         logger.error(f"VK error: {str(e)}", exc_info=True)
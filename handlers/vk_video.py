@@ -1,43 +1,52 @@
-from config import MAX_FILE_SIZE
-from services.utils import compress_video
-from services.vk_parser import vk_parser
+from services.utils import prepare_video
 from services.downloader import download_vk_video
 from aiogram import types
+from handlers.media.cached import send_cached, remember_sent, sent_item
+from handlers.media.upload import upload_file
+from handlers.media.delivery import delivery_turn
+from handlers.media.progress import delete_status, track_progress
 import logging
 import os
+from config import MAX_FILE_SIZE
 
 logger = logging.getLogger(__name__)
 
-MAX_TELEGRAM_SIZE = 50 * 1024 * 1024  # 50MB в байтах
+CACHE_PROFILE = 'vk_video'
 
 async def handle_vk_video_download(message: types.Message, url: str):
     try:
+        if await send_cached(message, url, CACHE_PROFILE):
+            return
+
         progress = await message.answer("⏳ Начинаю загрузку...")
         
-        # 1. Загрузка
-        video_path = await download_vk_video(url)
-        file_size = os.path.getsize(video_path)
-        
-        # 2. Проверка размера
-        if file_size > 50 * 1024 * 1024:  # 50MB
-            await progress.edit_text("⚠️ Видео слишком большое, сжимаю...")
-            compressed_path = f"{video_path}_compressed.mp4"
-            
-            if not await compress_video(video_path, compressed_path, 45):
-                await progress.edit_text("❌ Не удалось сжать видео. Отправляю ссылку...")
-                await message.answer(f"Скачайте оригинал: {url}")
-                return
-                
-            os.remove(video_path)
-            video_path = compressed_path
+        with track_progress(progress) as reporter:
+            # 1. Загрузка
+            video_path = await download_vk_video(url)
+            file_size = os.path.getsize(video_path)
+
+            # 2. Подготовка (перепаковка/сжатие только при необходимости)
+            oversized = file_size > MAX_FILE_SIZE
+            if oversized:
+                reporter.update("⚠️ Видео слишком большое, сжимаю...")
+
+            prepared = await prepare_video(video_path)
+        if prepared:
+            video_path = prepared
+        elif oversized:
+            await progress.edit_text("❌ Не удалось сжать видео. Отправляю ссылку...")
+            await message.answer(f"Скачайте оригинал: {url}")
+            return
         
         # 3. Отправка
-        await progress.edit_text("📤 Отправляю видео...")
-        with open(video_path, 'rb') as f:
-            await message.answer_video(
-                video=types.BufferedInputFile(f.read(), filename="video.mp4"),
-                caption="Ваше видео готово!"
+        async with delivery_turn():
+            await progress.edit_text("📤 Отправляю видео...")
+            caption = "Ваше видео готово!"
+            sent = await message.answer_video(
+                video=upload_file(video_path, filename="video.mp4"),
+                caption=caption
             )
+        remember_sent(url, [sent_item(sent, caption)], CACHE_PROFILE)
             
     except Exception as e:
         await message.answer(f"❌ Ошибка: {str(e)}")
@@ -46,4 +55,4 @@ async def handle_vk_video_download(message: types.Message, url: str):
         if 'video_path' in locals() and os.path.exists(video_path):
             os.remove(video_path)
         if 'progress' in locals():
-            await progress.delete()
\ No newline at end of file
+            await delete_status(progress)
\ No newline at end of file
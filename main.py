@@ -1,15 +1,47 @@
+import time
+
+BOOT_STARTED = time.perf_counter()
+
 import asyncio
 import io
 import locale
 import logging
 import sys
+from typing import Optional
+from aiohttp import web
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.filters import Command
 from aiogram.enums import ParseMode
-from config import BOT_TOKEN
-from handlers.base import handle_links, start
-from services.selenium import twitter_parser
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from config import (
+    BOT_MODE,
+    BOT_TOKEN,
+    METRICS_HOST,
+    METRICS_PORT,
+    TELEGRAM_API_BASE,
+    UPDATE_CONCURRENCY,
+    WEBAPP_HOST,
+    WEBAPP_PORT,
+    WEBHOOK_BASE_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+)
+from handlers.base import PLATFORM_MODULES, handle_links, start
+from handlers.middlewares import ApiMetricsMiddleware, ConcurrencyLimitMiddleware
+from services.browser_pool import browser_pool
+from services.disk_quota import disk_manager
+from services.jobs import download_engine
+from services.scheduler import job_scheduler
+from services.singleflight import inflight
+from services.file_cache import file_id_cache
+from services.http_client import http_client
+from services.lazy_import import warm_up
+from services.media_buffer import image_memory
+from services.metrics import register_runtime_gauges, start_metrics_server
+from services.tracing import configure_logging, exporter
 
 # Настройка кодировки UTF-8 для всей системы
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
@@ -26,27 +58,71 @@ logging.basicConfig(
     ],
     encoding='utf-8'
 )
+# Request id во всех записях (и JSON при LOG_FORMAT=json)
+configure_logging()
 logger = logging.getLogger(__name__)
 
+metrics_runner: Optional[web.AppRunner] = None
+
 async def on_startup():
     """Действия при запуске бота"""
+    global metrics_runner
     logger.info("Starting bot...")
+    await http_client.start()
+    disk_manager.start()
+    if METRICS_PORT:
+        register_runtime_gauges()
+        metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+    logger.info(f"Bot ready in {time.perf_counter() - BOOT_STARTED:.2f}s")
+    # Прогрев модулей платформ и браузеров в фоне, чтобы не задерживать запуск polling
+    asyncio.create_task(warm_up(PLATFORM_MODULES))
+    asyncio.create_task(browser_pool.start())
+
+async def on_webhook_startup(bot: Bot):
+    """Регистрирует webhook в Telegram (повторный вызов с теми же параметрами безопасен)"""
+    url = f"{WEBHOOK_BASE_URL.rstrip('/')}{WEBHOOK_PATH}"
+    await bot.set_webhook(
+        url,
+        secret_token=WEBHOOK_SECRET or None,
+        max_connections=min(UPDATE_CONCURRENCY, 100)
+    )
+    logger.info(f"Webhook set: {url}")
 
 async def on_shutdown():
     """Действия при остановке бота"""
     logger.info("Shutting down...")
-    await twitter_parser._close_driver()
+    logger.info(f"Job scheduler stats: {job_scheduler.stats()}")
+    logger.info(f"Single-flight stats: {inflight.stats()}")
+    await browser_pool.close()
+    logger.info(f"Disk stats: {disk_manager.stats()}")
+    await disk_manager.close()
+    logger.info(f"In-memory media stats: {image_memory.stats()}")
+    logger.info(f"HTTP stats by host: {http_client.stats()}")
+    await http_client.close()
+    download_engine.shutdown()
+    logger.info(f"File cache stats: {file_id_cache.stats()}")
+    file_id_cache.close()
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+    await exporter.flush()
     logger.info("Bot stopped")
 
 async def main():
     # Инициализация бота с настройками по умолчанию
+    session = None
+    if TELEGRAM_API_BASE:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_BASE))
+        logger.info(f"Bot API server: {TELEGRAM_API_BASE}")
     bot = Bot(
         token=BOT_TOKEN,
+        session=session,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
+    if METRICS_PORT:
+        bot.session.middleware(ApiMetricsMiddleware())
     dp = Dispatcher()
+    dp.update.outer_middleware(ConcurrencyLimitMiddleware(UPDATE_CONCURRENCY))
 
-   
     # Регистрация обработчиков
     dp.message.register(start, Command("start"))
     dp.message.register(handle_links)
@@ -56,13 +132,46 @@ async def main():
     dp.shutdown.register(on_shutdown)
 
     try:
-        logger.info("Bot is running...")
-        await dp.start_polling(bot)
+        if BOT_MODE == 'webhook':
+            await run_webhook(bot, dp)
+        else:
+            # Polling не работает, пока в Telegram зарегистрирован webhook
+            await bot.delete_webhook(drop_pending_updates=False)
+            logger.info("Bot is running (polling)...")
+            await dp.start_polling(bot)
     except Exception as e:
         logger.critical(f"Fatal error: {str(e)}", exc_info=True)
     finally:
         await bot.session.close()
 
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    """Прием обновлений через встроенный aiohttp сервер"""
+    if not WEBHOOK_BASE_URL:
+        raise RuntimeError("WEBHOOK_BASE_URL is required for webhook mode")
+    if not WEBHOOK_SECRET:
+        logger.warning("WEBHOOK_SECRET is not set: webhook requests are not authenticated")
+
+    dp.startup.register(on_webhook_startup)
+
+    app = web.Application()
+    # Неверный X-Telegram-Bot-Api-Secret-Token отклоняется с 401
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=WEBHOOK_SECRET or None
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        site = web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT)
+        await site.start()
+        logger.info(f"Bot is running (webhook on {WEBAPP_HOST}:{WEBAPP_PORT}{WEBHOOK_PATH})...")
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
 if __name__ == "__main__":
     try:
         asyncio.run(main())
@@ -1,8 +1,21 @@
-from .selenium import get_twitter_content
-from .downloader import download_video, download_twitter_video
-from .vk_api import get_vk_post
-from .utils import clean_downloads, compress_video
-from .vk_parser import vk_parser
+from importlib import import_module
+
+# Модули платформ тяжелые (selenium, yt_dlp, bs4) - импортируем при первом обращении
+_EXPORTS = {
+    'get_twitter_content': '.selenium',
+    'download_video': '.downloader',
+    'download_twitter_video': '.downloader',
+    'get_vk_post': '.vk_api',
+    'clean_downloads': '.utils',
+    'compress_video': '.utils',
+    'vk_parser': '.vk_parser',
+}
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        return getattr(import_module(_EXPORTS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 __all__ = [
@@ -13,4 +26,4 @@ __all__ = [
     'clean_downloads',
     'vk_parser',
     'compress_video',
-]
\ No newline at end of file
+]
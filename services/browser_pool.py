@@ -0,0 +1,319 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, List, Optional, Set
+
+from config import (
+    BROWSER_MAX_PAGES,
+    BROWSER_MAX_RSS_MB,
+    BROWSER_POOL_SIZE,
+    BROWSER_WATCHDOG_INTERVAL,
+    CHROME_BINARY,
+    CHROMEDRIVER_PATH,
+    SELENIUM_REMOTE_URL,
+)
+
+try:
+    import psutil
+except ImportError:  # без psutil не работают контроль памяти и watchdog
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+CHROME_PROCESS_NAMES = ('chrome', 'chromedriver', 'google-chrome', 'chrome_crashpad')
+
+
+class PooledDriver:
+    """WebDriver из пула и его счетчики"""
+
+    def __init__(self, driver: Any):
+        self.driver = driver
+        self.pages = 0
+        self.created_at = time.monotonic()
+
+    @property
+    def pid(self) -> Optional[int]:
+        """PID процесса chromedriver (для локального драйвера)"""
+        try:
+            return self.driver.service.process.pid
+        except AttributeError:
+            return None
+
+    def process_pids(self) -> Set[int]:
+        """PID chromedriver и всех дочерних процессов Chrome"""
+        pid = self.pid
+        if pid is None or psutil is None:
+            return set()
+        try:
+            proc = psutil.Process(pid)
+            return {pid} | {child.pid for child in proc.children(recursive=True)}
+        except psutil.Error:
+            return set()
+
+    def rss_mb(self) -> float:
+        """Суммарная память процессов браузера в MB"""
+        if psutil is None:
+            return 0.0
+        total = 0
+        for pid in self.process_pids():
+            try:
+                total += psutil.Process(pid).memory_info().rss
+            except psutil.Error:
+                continue
+        return total / (1024 * 1024)
+
+
+class BrowserPool:
+    """Пул заранее запущенных headless Chrome с выдачей/возвратом и перезапуском"""
+
+    def __init__(
+        self,
+        size: int = 2,
+        max_pages: int = 50,
+        max_rss_mb: int = 1024,
+        watchdog_interval: int = 60
+    ):
+        self.size = max(1, size)
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.watchdog_interval = watchdog_interval
+        self._idle: List[PooledDriver] = []
+        self._busy: Set[PooledDriver] = set()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._watchdog_task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+        return self._slots
+
+    def _create_driver_sync(self) -> Any:
+        """Запуск нового браузера (блокирующий)"""
+        # selenium импортируется при первом запуске браузера, а не при старте бота
+        from selenium import webdriver
+        from selenium.webdriver.chrome.service import Service
+
+        options = webdriver.ChromeOptions()
+
+        # Обязательные параметры для работы под root
+        options.add_argument("--headless=new")
+        options.add_argument("--no-sandbox")
+        options.add_argument("--disable-dev-shm-usage")
+
+        # Оптимальные настройки
+        options.add_argument("--window-size=1280,720")
+        options.add_argument("--disable-gpu")
+        options.add_argument("--disable-blink-features=AutomationControlled")
+        options.add_argument("--disable-extensions")
+
+        if SELENIUM_REMOTE_URL:
+            driver = webdriver.Remote(command_executor=SELENIUM_REMOTE_URL, options=options)
+        else:
+            if not os.path.exists(CHROME_BINARY):
+                raise FileNotFoundError(f"Chrome binary not found at {CHROME_BINARY}")
+            if not os.path.exists(CHROMEDRIVER_PATH):
+                raise FileNotFoundError(f"ChromeDriver not found at {CHROMEDRIVER_PATH}")
+
+            options.binary_location = CHROME_BINARY
+            service = Service(
+                executable_path=CHROMEDRIVER_PATH,
+                service_args=['--log-path=/tmp/chromedriver.log'],
+            )
+            driver = webdriver.Chrome(service=service, options=options)
+
+        # Настройки времени ожидания
+        driver.set_page_load_timeout(30)
+        driver.set_script_timeout(20)
+        return driver
+
+    async def _create(self) -> PooledDriver:
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        driver = await loop.run_in_executor(None, self._create_driver_sync)
+        logger.info(f"Browser started in {time.monotonic() - started:.1f}s")
+        return PooledDriver(driver)
+
+    async def _quit(self, item: PooledDriver):
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, item.driver.quit)
+        except Exception as e:
+            logger.error(f"Error closing driver: {str(e)}")
+
+    async def _is_healthy(self, item: PooledDriver) -> bool:
+        """Проверка, что браузер отвечает"""
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.wait_for(
+                loop.run_in_executor(None, item.driver.execute_script, "return 1"),
+                timeout=10
+            )
+            return True
+        except Exception as e:
+            logger.warning(f"Browser health check failed: {str(e)}")
+            return False
+
+    def _needs_recycle(self, item: PooledDriver) -> bool:
+        if item.pages >= self.max_pages:
+            logger.info(f"Recycling browser after {item.pages} pages")
+            return True
+        rss = item.rss_mb()
+        if rss > self.max_rss_mb:
+            logger.info(f"Recycling browser using {rss:.0f}MB")
+            return True
+        return False
+
+    async def start(self):
+        """Прогрев пула и запуск watchdog"""
+        self._closed = False
+        results = await asyncio.gather(
+            *(self._create() for _ in range(self.size - len(self._idle))),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Browser warm-up failed: {str(result)}")
+            else:
+                self._idle.append(result)
+        logger.info(f"Browser pool ready: {len(self._idle)}/{self.size}")
+
+        if psutil is not None and self._watchdog_task is None:
+            self._watchdog_task = asyncio.create_task(self._watchdog())
+        elif psutil is None:
+            logger.warning("psutil is not installed: browser memory limits and watchdog are disabled")
+
+    async def _checkout(self) -> PooledDriver:
+        """
+        Берет драйвер из пула; с момента выдачи и до возврата в _idle он числится
+        в _busy (и во время проверки), иначе watchdog примет его Chrome за осиротевший
+        """
+        while self._idle:
+            item = self._idle.pop()
+            self._busy.add(item)
+            try:
+                healthy = await self._is_healthy(item)
+            except BaseException:
+                self._busy.discard(item)
+                self._idle.append(item)
+                raise
+            if healthy:
+                return item
+            self._busy.discard(item)
+            await self._quit(item)
+        item = await self._create()
+        self._busy.add(item)
+        return item
+
+    async def _checkin(self, item: PooledDriver, broken: bool = False):
+        item.pages += 1
+        try:
+            if broken or self._closed or self._needs_recycle(item):
+                await self._quit(item)
+                if not self._closed:
+                    asyncio.create_task(self._replenish())
+                return
+
+            # Сбрасываем состояние страницы перед следующим использованием
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(None, item.driver.get, "about:blank")
+                self._idle.append(item)
+            except Exception:
+                await self._quit(item)
+        finally:
+            self._busy.discard(item)
+
+    async def _replenish(self):
+        """Запускает браузер взамен перезапущенного, чтобы пул оставался теплым"""
+        if self._closed or len(self._idle) + len(self._busy) >= self.size:
+            return
+        try:
+            item = await self._create()
+        except Exception as e:
+            logger.error(f"Browser replenish failed: {str(e)}")
+            return
+        if self._closed:
+            await self._quit(item)
+        else:
+            self._idle.append(item)
+
+    @asynccontextmanager
+    async def driver(self):
+        """Выдает WebDriver из пула и возвращает его после использования"""
+        async with self._get_slots():
+            item = await self._checkout()
+            broken = False
+            try:
+                yield item.driver
+            except Exception:
+                broken = not await self._is_healthy(item)
+                raise
+            finally:
+                await self._checkin(item, broken=broken)
+
+    def _known_pids(self) -> Set[int]:
+        pids: Set[int] = set()
+        for item in list(self._idle) + list(self._busy):
+            pids |= item.process_pids()
+        return pids
+
+    def _kill_orphans(self) -> int:
+        """Убивает процессы Chrome, которые не принадлежат ни одному драйверу пула"""
+        known = self._known_pids()
+        own_pid = os.getpid()
+        killed = 0
+        for proc in psutil.process_iter(['pid', 'ppid', 'name', 'create_time']):
+            try:
+                info = proc.info
+                name = (info.get('name') or '').lower()
+                if info['pid'] in known or not name.startswith(CHROME_PROCESS_NAMES):
+                    continue
+                if time.time() - info['create_time'] < self.watchdog_interval:
+                    continue  # браузер мог только что запуститься
+                # Наш потомок вне пула или осиротевший headless-процесс
+                is_ours = any(parent.pid == own_pid for parent in proc.parents())
+                is_orphan = info['ppid'] == 1 and '--headless' in ' '.join(proc.cmdline())
+                if is_ours or is_orphan:
+                    proc.kill()
+                    killed += 1
+            except psutil.Error:
+                continue
+        return killed
+
+    async def _watchdog(self):
+        loop = asyncio.get_running_loop()
+        while not self._closed:
+            await asyncio.sleep(self.watchdog_interval)
+            try:
+                killed = await loop.run_in_executor(None, self._kill_orphans)
+                if killed:
+                    logger.warning(f"Watchdog killed {killed} orphaned chrome processes")
+            except Exception as e:
+                logger.error(f"Browser watchdog error: {str(e)}")
+
+    def stats(self) -> dict:
+        return {
+            'size': self.size,
+            'idle': len(self._idle),
+            'busy': len(self._busy),
+        }
+
+    async def close(self):
+        """Закрывает все браузеры пула"""
+        self._closed = True
+        if self._watchdog_task is not None:
+            self._watchdog_task.cancel()
+            self._watchdog_task = None
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*(self._quit(item) for item in idle))
+
+
+browser_pool = BrowserPool(
+    size=BROWSER_POOL_SIZE,
+    max_pages=BROWSER_MAX_PAGES,
+    max_rss_mb=BROWSER_MAX_RSS_MB,
+    watchdog_interval=BROWSER_WATCHDOG_INTERVAL
+)
@@ -0,0 +1,331 @@
+import asyncio
+import fnmatch
+import itertools
+import logging
+import os
+import shutil
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from config import (
+    DISK_ADMIT_TIMEOUT,
+    DISK_BUDGET_MB,
+    DISK_CACHE_GRACE,
+    DISK_JANITOR_INTERVAL,
+    DISK_MIN_FREE_MB,
+    DISK_STALE_AGE,
+    DISK_USAGE_TTL,
+    DOWNLOAD_DIR,
+    SEGMENT_CACHE_DIR,
+)
+from services.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Временные артефакты, которые janitor удаляет по возрасту
+STALE_PATTERNS = ('job_*', 'temp_*', '*_compressed.mp4', '*.part', '*.ytdl', '*.tmp.mp4')
+
+
+class DiskQuotaExceeded(Exception):
+    """Места под задачу нет даже после очистки"""
+
+
+class Reservation:
+    """Место на диске, зарезервированное одной задачей"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, size: int):
+        self.id = next(self._ids)
+        self.size = size
+        self.paths: Set[str] = set()
+        self.created_at = time.time()
+
+    def protect(self, path: str):
+        """Файлы и папки задачи не удаляются при очистке, пока резерв активен"""
+        self.paths.add(os.path.abspath(path))
+
+
+class DiskManager:
+    """
+    Бюджет диска для папки загрузок: резервирование места под задачи,
+    LRU-вытеснение кэша и брошенных файлов, периодическая очистка
+    """
+
+    def __init__(
+        self,
+        root: str,
+        budget: int,
+        min_free: int,
+        cache_dirs: Sequence[str] = (),
+        stale_age: int = 3600,
+        janitor_interval: int = 600,
+        admit_timeout: int = 120,
+        usage_ttl: float = 2.0,
+        cache_grace: int = 300
+    ):
+        self.root = os.path.abspath(root)
+        self.budget = budget
+        self.min_free = min_free
+        self.cache_dirs = [os.path.abspath(path) for path in cache_dirs]
+        self.stale_age = stale_age
+        self.janitor_interval = janitor_interval
+        self.admit_timeout = admit_timeout
+        self.usage_ttl = usage_ttl
+        self.cache_grace = cache_grace
+        # (время обхода, занято всего, записано каждым резервом)
+        self._usage_cache: Optional[Tuple[float, int, Dict[int, int]]] = None
+        self._reservations: Dict[int, Reservation] = {}
+        self._condition: Optional[asyncio.Condition] = None
+        self._janitor_task: Optional[asyncio.Task] = None
+        self.rejected = 0
+        self.evicted_bytes = 0
+        self.janitor_removed = 0
+
+    def _get_condition(self) -> asyncio.Condition:
+        # Condition создается внутри работающего loop
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    def _scan(self) -> Tuple[int, Dict[int, int]]:
+        """
+        Обход папки загрузок: сколько занято всего и сколько из этого уже
+        записали активные задачи (в защищенные резервами пути).
+        Результат запоминается на usage_ttl, чтобы повторные проверки
+        допуска не обходили дерево каждый раз
+        """
+        now = time.monotonic()
+        cached = self._usage_cache
+        if cached is not None and now - cached[0] < self.usage_ttl:
+            return cached[1], cached[2]
+
+        reservations = list(self._reservations.values())
+        total = 0
+        written: Dict[int, int] = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            dir_owner = next((r.id for r in reservations if self._is_within(dirpath, r.paths)), None)
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    size = os.lstat(path).st_size
+                except OSError:
+                    continue
+                total += size
+                owner = dir_owner
+                if owner is None:
+                    owner = next((r.id for r in reservations if path in r.paths), None)
+                if owner is not None:
+                    written[owner] = written.get(owner, 0) + size
+        self._usage_cache = (now, total, written)
+        return total, written
+
+    def _invalidate_usage(self):
+        self._usage_cache = None
+
+    def usage(self) -> int:
+        """Сколько байт сейчас занимает папка загрузок"""
+        return self._scan()[0]
+
+    def reserved(self) -> int:
+        return sum(r.size for r in self._reservations.values())
+
+    def outstanding(self) -> int:
+        """
+        Еще не записанная часть резервов: записанное задачами уже входит
+        в usage() и в занятое место на диске, считать его дважды нельзя
+        """
+        _, written = self._scan()
+        return sum(
+            max(0, r.size - written.get(r.id, 0))
+            for r in list(self._reservations.values())
+        )
+
+    def free(self) -> int:
+        return shutil.disk_usage(self.root).free
+
+    def ensure_free(self, needed: int = 0):
+        """Проверка свободного места на диске (синхронная)"""
+        free = self.free() - self.outstanding()
+        if free - needed < self.min_free:
+            raise RuntimeError(
+                f"Not enough disk space. Need {(self.min_free + needed) // (1024 * 1024)}MB, "
+                f"available {max(free, 0) // (1024 * 1024)}MB"
+            )
+
+    def _shortfall(self, size: int) -> int:
+        """Сколько байт не хватает, чтобы принять задачу размером size"""
+        outstanding = self.outstanding()
+        over_budget = self.usage() + outstanding + size - self.budget
+        under_free = self.min_free - (self.free() - outstanding - size)
+        return max(over_budget, under_free, 0)
+
+    def _protected(self) -> Set[str]:
+        paths: Set[str] = set()
+        for reservation in self._reservations.values():
+            paths |= reservation.paths
+        return paths
+
+    @staticmethod
+    def _is_within(path: str, roots: Set[str]) -> bool:
+        return any(path == root or path.startswith(root + os.sep) for root in roots)
+
+    def _eviction_candidates(self) -> List[Tuple[float, int, str]]:
+        """(время последнего использования, размер, путь): кэш и брошенные файлы"""
+        now = time.time()
+        protected = self._protected()
+        candidates = []
+        for dirpath, _, filenames in os.walk(self.root):
+            in_cache = self._is_within(dirpath, set(self.cache_dirs))
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                if self._is_within(path, protected):
+                    continue
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                last_used = max(stat.st_atime, stat.st_mtime)
+                # Кэш - после короткой паузы (запись может еще читаться задачей),
+                # вне кэша - только файлы, к которым давно никто не обращался
+                max_idle = self.cache_grace if in_cache else self.stale_age
+                if now - last_used > max_idle:
+                    candidates.append((last_used, stat.st_size, path))
+        candidates.sort()
+        return candidates
+
+    def evict(self, needed: int) -> int:
+        """Удаляет давно не использованные файлы, пока не освободится needed байт"""
+        freed = 0
+        for _, size, path in self._eviction_candidates():
+            if freed >= needed:
+                break
+            try:
+                os.remove(path)
+                freed += size
+            except OSError as e:
+                logger.warning(f"Eviction failed for {path}: {str(e)}")
+        if freed:
+            self._invalidate_usage()
+            self.evicted_bytes += freed
+            logger.info(f"Evicted {freed / 1048576:.1f}MB from {self.root}")
+        return freed
+
+    def _admit_sync(self, size: int) -> bool:
+        shortfall = self._shortfall(size)
+        if shortfall and self.evict(shortfall) >= shortfall:
+            shortfall = self._shortfall(size)
+        return shortfall == 0
+
+    @asynccontextmanager
+    async def reserve(self, size: int):
+        """
+        Резервирует место под задачу; ждет освобождения до admit_timeout
+        :raises DiskQuotaExceeded: Если место так и не освободилось
+        """
+        loop = asyncio.get_running_loop()
+        condition = self._get_condition()
+        deadline = loop.time() + self.admit_timeout
+        reservation = Reservation(size)
+
+        with span('disk_admit', size_mb=round(size / 1048576, 1)):
+            async with condition:
+                while not await loop.run_in_executor(None, self._admit_sync, size):
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        raise DiskQuotaExceeded(f"No disk space for {size / 1048576:.1f}MB job")
+                    try:
+                        # Ждем завершения других задач (или проверяем снова через 5с)
+                        await asyncio.wait_for(condition.wait(), timeout=min(remaining, 5))
+                    except asyncio.TimeoutError:
+                        pass
+                self._reservations[reservation.id] = reservation
+
+        try:
+            yield reservation
+        finally:
+            self._reservations.pop(reservation.id, None)
+            # Файлы задачи к этому моменту удалены (job_workdir) - место освободилось
+            self._invalidate_usage()
+            async with condition:
+                condition.notify_all()
+
+    def sweep(self, max_age: Optional[int] = None) -> int:
+        """Удаляет временные артефакты старше max_age, не принадлежащие активным задачам"""
+        max_age = self.stale_age if max_age is None else max_age
+        now = time.time()
+        protected = self._protected()
+        removed = 0
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not any(fnmatch.fnmatch(name, pattern) for pattern in STALE_PATTERNS):
+                continue
+            if self._is_within(path, protected):
+                continue
+            try:
+                if now - os.stat(path).st_mtime < max_age:
+                    continue
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    os.remove(path)
+                removed += 1
+            except OSError as e:
+                logger.warning(f"Janitor could not remove {path}: {str(e)}")
+        if removed:
+            self._invalidate_usage()
+        self.janitor_removed += removed
+        return removed
+
+    def _janitor_pass(self):
+        removed = self.sweep()
+        over = self.usage() - self.budget
+        freed = self.evict(over) if over > 0 else 0
+        if removed or freed:
+            logger.info(f"Disk janitor: removed {removed} stale items, evicted {freed / 1048576:.1f}MB")
+
+    async def _janitor(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self._janitor_pass)
+            except Exception as e:
+                logger.error(f"Disk janitor error: {str(e)}")
+            await asyncio.sleep(self.janitor_interval)
+
+    def start(self):
+        """Запускает периодическую очистку (вызывается из on_startup)"""
+        os.makedirs(self.root, exist_ok=True)
+        if self._janitor_task is None:
+            self._janitor_task = asyncio.create_task(self._janitor())
+
+    async def close(self):
+        if self._janitor_task is not None:
+            self._janitor_task.cancel()
+            self._janitor_task = None
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'usage_mb': self.usage() / 1048576,
+            'reserved_mb': self.reserved() / 1048576,
+            'budget_mb': self.budget / 1048576,
+            'active_jobs': len(self._reservations),
+            'rejected': self.rejected,
+            'evicted_mb': self.evicted_bytes / 1048576,
+            'janitor_removed': self.janitor_removed,
+        }
+
+
+disk_manager = DiskManager(
+    DOWNLOAD_DIR,
+    budget=DISK_BUDGET_MB * 1024 * 1024,
+    min_free=DISK_MIN_FREE_MB * 1024 * 1024,
+    cache_dirs=[SEGMENT_CACHE_DIR],
+    stale_age=DISK_STALE_AGE,
+    janitor_interval=DISK_JANITOR_INTERVAL,
+    admit_timeout=DISK_ADMIT_TIMEOUT,
+    usage_ttl=DISK_USAGE_TTL,
+    cache_grace=DISK_CACHE_GRACE
+)
@@ -1,27 +1,25 @@
-from pathlib import Path
-import requests
-from selenium.webdriver.common.by import By
 import yt_dlp
 import os
-import time
 import re
 import logging
-from typing import Optional
-from config import DOWNLOAD_DIR, MAX_FILE_SIZE, PLATFORMS
-from services.utils import compress_video
+from typing import Callable, Dict, List, Optional, Tuple
+from config import DOWNLOAD_DIR, FORMAT_TARGET_SIZE
+from services.jobs import download_engine
+from services.metrics import count_download, stage
+from services.tracing import traced
+from services.progress import ytdl_progress_hook
+from services.workdir import current_workdir
 from yt_dlp import YoutubeDL
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 
 logger = logging.getLogger(__name__)
 
-def get_ydl_opts(url: str) -> dict:
+MAX_HEIGHT_RE = re.compile(r'height<=(\d+)')
+VIDEO_EXT_RE = re.compile(r'ext=(\w+)')
+
+def get_ydl_opts(url: str, work_dir: str = DOWNLOAD_DIR) -> dict:
     """Возвращает параметры скачивания для разных платформ"""
     base_opts = {
-        'outtmpl': 'downloads/%(title)s.%(ext)s',
+        'outtmpl': os.path.join(work_dir, '%(title).150B.%(ext)s'),
         'quiet': False,
         'no_warnings': False,
         'retries': 3,
@@ -45,10 +43,10 @@ def get_ydl_opts(url: str) -> dict:
     # Для всех остальных платформ
     return base_opts
 
-def get_vk_ydl_opts():
+def get_vk_ydl_opts(work_dir: str = DOWNLOAD_DIR):
     """Оптимальные настройки для VK"""
     return {
-        'outtmpl': os.path.join(DOWNLOAD_DIR, 'vk_%(id)s.%(ext)s'),
+        'outtmpl': os.path.join(work_dir, 'vk_%(id)s.%(ext)s'),
         'quiet': False,
         'no_warnings': False,
         'retries': 3,
@@ -67,25 +65,154 @@ def get_vk_ydl_opts():
         'restrictfilenames': True
     }
 
-async def download_video(url: str) -> str:
-    """Скачивание видео с обработкой ошибок"""
+def estimate_format_size(fmt: Dict, duration: Optional[float]) -> Optional[int]:
+    """Размер формата в байтах: filesize, filesize_approx или битрейт x длительность"""
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        return int(size)
+    tbr = fmt.get('tbr') or ((fmt.get('vbr') or 0) + (fmt.get('abr') or 0))
+    if tbr and duration:
+        return int(tbr * 1000 / 8 * duration)
+    return None
+
+def pick_format_within(
+    info: Dict,
+    limit_bytes: int,
+    max_height: Optional[int] = None,
+    video_ext: Optional[str] = None
+) -> Optional[str]:
+    """
+    Выбирает лучший формат (или пару видео+аудио), который по метаданным yt-dlp
+    поместится в limit_bytes
+    :param max_height: Ограничение высоты из format настроек ([height<=N])
+    :param video_ext: Контейнер видео из format настроек ([ext=mp4])
+    :return: format_id для yt-dlp или None, если подходящего формата нет
+    """
+    formats = info.get('formats') or []
+    duration = info.get('duration')
+
+    def has_video(f: Dict) -> bool:
+        return f.get('vcodec') not in (None, 'none')
+
+    def has_audio(f: Dict) -> bool:
+        return f.get('acodec') not in (None, 'none')
+
+    # (format_id, высота, h264, битрейт, размер)
+    candidates: List[Tuple[str, int, bool, float, int]] = []
+
+    def add(format_id: str, video: Dict, size: Optional[int], tbr: float):
+        height = video.get('height') or 0
+        if size is None or size > limit_bytes or (max_height and height > max_height):
+            return
+        if video_ext and video.get('ext') != video_ext:
+            return
+        is_avc = str(video.get('vcodec', '')).startswith(('avc', 'h264'))
+        candidates.append((format_id, height, is_avc, tbr, size))
+
+    for f in formats:
+        if has_video(f) and has_audio(f):
+            add(f['format_id'], f, estimate_format_size(f, duration), f.get('tbr') or 0)
+
+    audios = [
+        (f, estimate_format_size(f, duration)) for f in formats
+        if has_audio(f) and not has_video(f)
+    ]
+    audios = [(f, size) for f, size in audios if size is not None]
+    if audios:
+        # В mp4 без перекодирования сливается только m4a
+        m4a = [item for item in audios if item[0].get('ext') == 'm4a']
+        audio, audio_size = max(m4a or audios, key=lambda item: item[0].get('abr') or 0)
+        for f in formats:
+            if has_video(f) and not has_audio(f):
+                video_size = estimate_format_size(f, duration)
+                if video_size is not None:
+                    add(
+                        f"{f['format_id']}+{audio['format_id']}", f,
+                        video_size + audio_size, (f.get('tbr') or 0) + (audio.get('abr') or 0)
+                    )
+
+    if not candidates:
+        return None
+    # Сначала H.264 (отправляется без перекодирования), затем высота и битрейт
+    best = max(candidates, key=lambda c: (c[2], c[1], c[3]))
+    logger.info(
+        f"Format {best[0]} ({best[1]}p) predicted {best[4] / 1048576:.1f}MB "
+        f"fits {limit_bytes / 1048576:.0f}MB"
+    )
+    return best[0]
+
+class OutputCollector:
+    """
+    Собирает итоговые пути файлов из хуков постпроцессоров yt-dlp
+    и передает прогресс загрузки в progress (если задан)
+    """
+
+    def __init__(self, progress: Optional[Callable[[Dict], None]] = None):
+        self.paths: List[str] = []
+        self.progress = progress
+
+    def hook(self, d: Dict):
+        if d.get('status') == 'finished':
+            path = d.get('info_dict', {}).get('filepath')
+            if path and path not in self.paths:
+                self.paths.append(path)
+
+    def attach(self, ydl_opts: dict) -> dict:
+        ydl_opts['postprocessor_hooks'] = [*ydl_opts.get('postprocessor_hooks', []), self.hook]
+        if self.progress is not None:
+            ydl_opts['progress_hooks'] = [*ydl_opts.get('progress_hooks', []), self.progress]
+        return ydl_opts
+
+def downloaded_path(info: Dict, collector: Optional[OutputCollector] = None) -> str:
+    """
+    Путь к скачанному файлу из результата yt-dlp (requested_downloads) или хуков,
+    без просмотра содержимого папки
+    """
+    candidates = [
+        item.get('filepath') or item.get('_filename')
+        for item in info.get('requested_downloads') or []
+    ]
+    candidates.append(info.get('filepath'))
+    if collector is not None:
+        candidates.extend(reversed(collector.paths))
+    for path in candidates:
+        if path and os.path.exists(path):
+            return path
+    raise FileNotFoundError("Не удалось найти скачанный файл")
+
+def _download_within_limit(ydl: YoutubeDL, info: Dict) -> Dict:
+    """
+    Скачивает уже извлеченное видео, заменяя формат на подходящий по размеру.
+    Если оценить размер нельзя, используется формат из настроек (и сжатие после)
+    """
+    spec = ydl.params.get('format')
+    selector = spec if isinstance(spec, str) else ''
+    height = MAX_HEIGHT_RE.search(selector)
+    ext = VIDEO_EXT_RE.search(selector)
+    fitting = pick_format_within(
+        info, FORMAT_TARGET_SIZE,
+        max_height=int(height.group(1)) if height else None,
+        video_ext=ext.group(1) if ext else None
+    )
+    if fitting:
+        # Селектор формата компилируется в YoutubeDL.__init__ - одной замены params мало
+        ydl.params['format'] = fitting
+        ydl.format_selector = ydl.build_format_selector(fitting)
+    else:
+        logger.info(f"No format predicted to fit for {info.get('id')}, using '{spec}'")
+    return ydl.process_ie_result(info, download=True)
+
+@traced()
+def _download_video_sync(url: str, work_dir: str, progress: Optional[Callable[[Dict], None]] = None) -> str:
+    """Скачивание видео с обработкой ошибок (блокирующее, выполняется в пуле)"""
     try:
-        ydl_opts = get_ydl_opts(url)
+        collector = OutputCollector(progress)
+        ydl_opts = collector.attach(get_ydl_opts(url, work_dir))
         
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-            filename = ydl.prepare_filename(info)
-            
-            if not os.path.exists(filename):
-                # Ищем любой видеофайл в папке загрузок
-                files = [f for f in os.listdir('downloads') 
-                        if f.endswith(('.mp4', '.mkv', '.webm'))]
-                if files:
-                    filename = os.path.join('downloads', files[0])
-                else:
-                    raise FileNotFoundError("Не удалось найти скачанный файл")
-            
-            return filename
+            info = ydl.extract_info(url, download=False)
+            info = _download_within_limit(ydl, info)
+            return downloaded_path(info, collector)
             
     except yt_dlp.DownloadError as e:
         logger.error(f"Ошибка скачивания: {str(e)}")
@@ -94,10 +221,12 @@ async def download_video(url: str) -> str:
         logger.error(f"Неожиданная ошибка: {str(e)}")
         raise
 
-async def download_twitter_video(url: str) -> str:
-    """Улучшенное скачивание Twitter видео"""
-    ydl_opts = {
-        'outtmpl': 'downloads/twitter_%(id)s.%(ext)s',
+@traced()
+def _download_twitter_video_sync(url: str, work_dir: str, progress: Optional[Callable[[Dict], None]] = None) -> str:
+    """Улучшенное скачивание Twitter видео (блокирующее, выполняется в пуле)"""
+    collector = OutputCollector(progress)
+    ydl_opts = collector.attach({
+        'outtmpl': os.path.join(work_dir, 'twitter_%(id)s.%(ext)s'),
         'format': 'bestvideo[ext=mp4]+bestaudio[ext=m4a]/best[ext=mp4]/best',
         'retries': 5,
         'socket_timeout': 60,
@@ -108,69 +237,54 @@ async def download_twitter_video(url: str) -> str:
             }
         },
         'logger': logging.getLogger('yt-dlp'),
-    }
+    })
     
     try:
-        # Сначала пробуем стандартный метод
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-            filename = ydl.prepare_filename(info)
-            
-            if not os.path.exists(filename):
-                # Если файл не найден, ищем любой видеофайл в папке загрузок
-                files = [f for f in os.listdir('downloads') 
-                        if f.startswith('twitter_') and f.endswith('.mp4')]
-                if files:
-                    filename = os.path.join('downloads', files[0])
-                else:
-                    raise FileNotFoundError("Видеофайл не найден после скачивания")
-            
-            return filename
+            info = ydl.extract_info(url, download=False)
+            info = _download_within_limit(ydl, info)
+            return downloaded_path(info, collector)
             
     except Exception as e:
         logger.error(f"Twitter video download failed: {str(e)}")
         raise ValueError(f"Не удалось скачать видео: {str(e)}")
 
-async def download_vk_video(url: str) -> str:
-    """Улучшенная загрузка видео из VK"""
+@traced()
+def _download_vk_video_sync(url: str, work_dir: str, progress: Optional[Callable[[Dict], None]] = None) -> str:
+    """Улучшенная загрузка видео из VK (блокирующее, выполняется в пуле)"""
     try:
-        # Создаем директорию, если не существует
-        os.makedirs(DOWNLOAD_DIR, exist_ok=True)
-        
-        ydl_opts = get_vk_ydl_opts()
-        filename = None
+        collector = OutputCollector(progress)
+        ydl_opts = collector.attach(get_vk_ydl_opts(work_dir))
 
         with YoutubeDL(ydl_opts) as ydl:
-            # Сначала получаем информацию о видео
+            # Сначала получаем информацию о видео, затем скачиваем подходящий формат
             info_dict = ydl.extract_info(url, download=False)
-            video_id = info_dict.get('id', 'video')
-            ext = info_dict.get('ext', 'mp4')
-            filename = os.path.join(DOWNLOAD_DIR, f'vk_{video_id}.{ext}')
-            
-            # Удаляем старый файл, если существует
-            if os.path.exists(filename):
-                os.remove(filename)
-            
-            # Скачиваем видео
-            ydl.download([url])
-            
-            # Проверяем, что файл создан
-            if not os.path.exists(filename):
-                # Ищем файл по шаблону, если не найден
-                for f in os.listdir(DOWNLOAD_DIR):
-                    if f.startswith(f'vk_{video_id}') and f.endswith(('.mp4', '.mkv', '.webm')):
-                        filename = os.path.join(DOWNLOAD_DIR, f)
-                        break
-                else:
-                    raise FileNotFoundError("Файл видео не найден после загрузки")
-            
-            return filename
+            info_dict = _download_within_limit(ydl, info_dict)
+            return downloaded_path(info_dict, collector)
 
     except Exception as e:
         logger.error(f"Ошибка загрузки VK видео: {str(e)}", exc_info=True)
-        if filename and os.path.exists(filename):
-            os.remove(filename)
         raise ValueError(f"Не удалось скачать видео: {str(e)}")
 
+def _progress_hook() -> Optional[Callable[[Dict], None]]:
+    """Хук прогресса; в пуле процессов не передается (замыкание не сериализуется)"""
+    return ytdl_progress_hook() if download_engine.pool_type == 'thread' else None
 
-    
+async def _run_download(func: Callable, url: str) -> str:
+    """Скачивание в пуле загрузок с замером времени и объема"""
+    with stage('download'):
+        path = await download_engine.run(func, url, current_workdir(), _progress_hook())
+    count_download(os.path.getsize(path))
+    return path
+
+async def download_video(url: str) -> str:
+    """Скачивание видео в пуле загрузок"""
+    return await _run_download(_download_video_sync, url)
+
+async def download_twitter_video(url: str) -> str:
+    """Скачивание Twitter видео в пуле загрузок"""
+    return await _run_download(_download_twitter_video_sync, url)
+
+async def download_vk_video(url: str) -> str:
+    """Загрузка видео из VK в пуле загрузок"""
+    return await _run_download(_download_vk_video_sync, url)
@@ -0,0 +1,401 @@
+import asyncio
+import logging
+import os
+import struct
+import time
+from collections import Counter
+from typing import List, Optional, Tuple, TypedDict
+
+from config import (
+    ENCODER_AUDIO_BITRATE,
+    ENCODER_CONTAINER_OVERHEAD,
+    ENCODER_MAX_ATTEMPTS,
+    ENCODER_MIN_AUDIO_BITRATE,
+    ENCODER_MIN_VIDEO_BITRATE,
+    ENCODER_PRESET,
+    ENCODER_TARGET_HEIGHT,
+    ENCODER_TWO_PASS,
+    FFMPEG_PATH,
+    PROGRESS_HOOK_INTERVAL,
+)
+from services.metrics import ffmpeg_active
+from services.probe import MediaProbe, probe_media
+from services.tracing import span, traced
+from services.progress import ProgressReporter, current_progress, encode_text
+
+logger = logging.getLogger(__name__)
+
+
+class CompressionResult(TypedDict):
+    success: bool
+    output_path: str
+    target_size: int
+    predicted_size: int
+    actual_size: int
+    video_bitrate: int  # кбит/с
+    audio_bitrate: int  # кбит/с
+    attempts: int
+    action: str
+
+
+class EncodePlan(TypedDict):
+    action: str  # copy | remux | audio | downscale | encode
+    reason: str
+    video_filter: Optional[str]
+
+
+# Telegram воспроизводит без конвертации H.264 (yuv420p) + AAC в mp4
+COMPATIBLE_VIDEO_CODECS = ('h264',)
+COMPATIBLE_PIX_FMTS = ('yuv420p', 'yuvj420p', None)
+COMPATIBLE_AUDIO_CODECS = ('aac', 'mp3', None)
+
+# Решения планировщика и секунды видео, не прошедшие полное перекодирование
+plan_stats: Counter = Counter()
+
+
+def plan_bitrates(duration: float, target_bytes: int) -> Tuple[int, int]:
+    """
+    Делит бюджет размера между видео, аудио и накладными расходами контейнера
+    :return: (битрейт видео, битрейт аудио) в кбит/с
+    """
+    usable_kbits = target_bytes * 8 / 1000 * (1 - ENCODER_CONTAINER_OVERHEAD)
+    total_kbps = usable_kbits / duration
+
+    audio_kbps = ENCODER_AUDIO_BITRATE
+    if total_kbps - audio_kbps < ENCODER_MIN_VIDEO_BITRATE:
+        audio_kbps = ENCODER_MIN_AUDIO_BITRATE
+
+    video_kbps = int(total_kbps - audio_kbps)
+    if video_kbps < ENCODER_MIN_VIDEO_BITRATE:
+        logger.warning(
+            f"Size budget too small for {duration:.0f}s video: {video_kbps}k video bitrate"
+        )
+        video_kbps = max(video_kbps, 50)
+    return video_kbps, audio_kbps
+
+
+def predict_size(duration: float, video_kbps: int, audio_kbps: int) -> int:
+    """Ожидаемый размер файла в байтах"""
+    payload = (video_kbps + audio_kbps) * 1000 / 8 * duration
+    return int(payload / (1 - ENCODER_CONTAINER_OVERHEAD))
+
+
+async def _read_progress(stream: asyncio.StreamReader, duration: float, label: str, reporter: ProgressReporter):
+    """Разбирает блоки key=value из ffmpeg -progress и передает процент репортеру"""
+    last = 0.0
+    speed = None
+    async for raw in stream:
+        key, _, value = raw.decode(errors='ignore').strip().partition('=')
+        if key == 'speed':
+            speed = value if value not in ('', 'N/A') else None
+        elif key == 'out_time_us':
+            try:
+                seconds = int(value) / 1_000_000
+            except ValueError:
+                continue
+            now = time.monotonic()
+            if now - last >= PROGRESS_HOOK_INTERVAL:
+                last = now
+                reporter.update(encode_text(label, seconds * 100 / duration, speed))
+
+
+async def _run_ffmpeg(cmd: List[str], duration: float = 0, label: str = 'Обрабатываю видео') -> bool:
+    """
+    Запускает ffmpeg; если у задачи есть репортер прогресса и известна длительность,
+    ход кодирования читается из -progress
+    """
+    reporter = current_progress()
+    track = reporter is not None and duration > 0
+    if track:
+        cmd = [cmd[0], '-progress', 'pipe:1', '-nostats', *cmd[1:]]
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE if track else asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE
+    )
+    ffmpeg_active.inc()
+    try:
+        with span('ffmpeg', label=label):
+            if track:
+                _, stderr = await asyncio.gather(
+                    _read_progress(proc.stdout, duration, label, reporter),
+                    proc.stderr.read()
+                )
+                await proc.wait()
+            else:
+                _, stderr = await proc.communicate()
+    finally:
+        ffmpeg_active.dec()
+    if proc.returncode != 0:
+        logger.error(f"FFmpeg error: {stderr.decode(errors='ignore')[-1000:]}")
+        return False
+    return True
+
+
+async def _encode(
+    input_path: str,
+    output_path: str,
+    video_kbps: int,
+    audio_kbps: int,
+    video_filter: Optional[str],
+    two_pass: bool,
+    duration: float = 0
+) -> bool:
+    """Кодирование с заданным средним битрейтом (ABR, опционально в два прохода)"""
+    rate_args = [
+        '-c:v', 'libx264',
+        '-preset', ENCODER_PRESET,
+        '-b:v', f'{video_kbps}k',
+        '-maxrate', f'{int(video_kbps * 1.5)}k',
+        '-bufsize', f'{video_kbps * 2}k',
+    ]
+    filter_args = ['-vf', video_filter] if video_filter else []
+
+    if not two_pass:
+        return await _run_ffmpeg([
+            FFMPEG_PATH, '-i', input_path,
+            *rate_args, *filter_args,
+            '-c:a', 'aac', '-b:a', f'{audio_kbps}k',
+            '-movflags', '+faststart',
+            '-y', output_path
+        ], duration, 'Сжимаю видео')
+
+    passlog = f"{output_path}.passlog"
+    try:
+        first = await _run_ffmpeg([
+            FFMPEG_PATH, '-i', input_path,
+            *rate_args, *filter_args,
+            '-pass', '1', '-passlogfile', passlog,
+            '-an', '-f', 'null', '-y', os.devnull
+        ], duration, 'Сжимаю видео (проход 1/2)')
+        if not first:
+            return False
+        return await _run_ffmpeg([
+            FFMPEG_PATH, '-i', input_path,
+            *rate_args, *filter_args,
+            '-pass', '2', '-passlogfile', passlog,
+            '-c:a', 'aac', '-b:a', f'{audio_kbps}k',
+            '-movflags', '+faststart',
+            '-y', output_path
+        ], duration, 'Сжимаю видео (проход 2/2)')
+    finally:
+        for suffix in ('-0.log', '-0.log.mbtree', '-0.log.temp', '-0.log.mbtree.temp'):
+            if os.path.exists(passlog + suffix):
+                os.remove(passlog + suffix)
+
+
+@traced()
+async def compress_to_size(
+    input_path: str,
+    output_path: str,
+    target_size_mb: float,
+    video_filter: Optional[str] = None,
+    two_pass: bool = ENCODER_TWO_PASS
+) -> CompressionResult:
+    """
+    Сжимает видео так, чтобы результат гарантированно поместился в target_size_mb.
+    Бюджет делится между видео, аудио и контейнером; если результат все равно
+    больше лимита, выполняется проверочное перекодирование с уменьшенным битрейтом.
+    Без video_filter разрешение уменьшается только если оно выше ENCODER_TARGET_HEIGHT
+    """
+    target_bytes = int(target_size_mb * 1024 * 1024)
+    result: CompressionResult = {
+        'success': False,
+        'output_path': output_path,
+        'target_size': target_bytes,
+        'predicted_size': 0,
+        'actual_size': 0,
+        'video_bitrate': 0,
+        'audio_bitrate': 0,
+        'attempts': 0,
+        'action': 'encode',
+    }
+
+    probe = await probe_media(input_path)
+    if not probe or probe['duration'] <= 0:
+        logger.error(f"Cannot compress {input_path}: unknown duration")
+        return result
+    duration = probe['duration']
+
+    if video_filter is None and probe['height'] > ENCODER_TARGET_HEIGHT:
+        video_filter = f'scale=-2:{ENCODER_TARGET_HEIGHT}'
+    if video_filter:
+        result['action'] = 'downscale'
+
+    video_kbps, audio_kbps = plan_bitrates(duration, target_bytes)
+    for attempt in range(1, ENCODER_MAX_ATTEMPTS + 1):
+        result['attempts'] = attempt
+        result['video_bitrate'] = video_kbps
+        result['audio_bitrate'] = audio_kbps
+        result['predicted_size'] = predict_size(duration, video_kbps, audio_kbps)
+
+        if not await _encode(input_path, output_path, video_kbps, audio_kbps, video_filter, two_pass, duration):
+            return result
+
+        result['actual_size'] = os.path.getsize(output_path) if os.path.exists(output_path) else 0
+        logger.info(
+            f"Compression attempt {attempt}: predicted {result['predicted_size'] / 1048576:.1f}MB, "
+            f"actual {result['actual_size'] / 1048576:.1f}MB, target {target_size_mb}MB "
+            f"({video_kbps}k video + {audio_kbps}k audio)"
+        )
+
+        if not result['actual_size']:
+            return result
+        if result['actual_size'] <= target_bytes:
+            result['success'] = True
+            return result
+
+        # Перекодируем с битрейтом, уменьшенным пропорционально промаху (+5% запас)
+        ratio = target_bytes / max(result['actual_size'], 1)
+        video_kbps = max(int(video_kbps * ratio * 0.95), 50)
+
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    logger.error(f"Could not fit {input_path} into {target_size_mb}MB")
+    return result
+
+
+def has_faststart(path: str) -> bool:
+    """Проверяет, что атом moov стоит перед mdat (можно воспроизводить до полной загрузки)"""
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    return False
+                size, kind = struct.unpack('>I4s', header)
+                if kind == b'moov':
+                    return True
+                if kind == b'mdat':
+                    return False
+                if size == 1:  # 64-битный размер атома
+                    size = struct.unpack('>Q', f.read(8))[0]
+                    f.seek(size - 16, os.SEEK_CUR)
+                elif size == 0:  # атом до конца файла
+                    return False
+                else:
+                    f.seek(size - 8, os.SEEK_CUR)
+    except (OSError, struct.error):
+        return False
+
+
+def is_mp4_file(path: str, probe: MediaProbe) -> bool:
+    """
+    ffprobe называет mov и mp4 одним демуксером ('mov,mp4,m4a,3gp,3g2,mj2'),
+    поэтому контейнер уточняется по расширению файла
+    """
+    return 'mp4' in probe['format_name'] and os.path.splitext(path)[1].lower() in ('.mp4', '.m4v')
+
+
+def plan_encode(
+    probe: MediaProbe,
+    target_bytes: int,
+    faststart: bool,
+    is_mp4: bool,
+    target_height: int = ENCODER_TARGET_HEIGHT
+) -> EncodePlan:
+    """Выбирает самое дешевое действие, после которого файл подойдет для Telegram"""
+    fits = probe['size'] <= target_bytes
+    video_ok = (
+        probe['video_codec'] in COMPATIBLE_VIDEO_CODECS
+        and probe['pix_fmt'] in COMPATIBLE_PIX_FMTS
+    )
+    audio_ok = probe['audio_codec'] in COMPATIBLE_AUDIO_CODECS
+    scale = f'scale=-2:{target_height}' if probe['height'] > target_height else None
+
+    if fits and video_ok and audio_ok:
+        if is_mp4 and faststart:
+            return {'action': 'copy', 'reason': 'already compatible', 'video_filter': None}
+        return {'action': 'remux', 'reason': 'container/faststart only', 'video_filter': None}
+    if fits and video_ok:
+        return {'action': 'audio', 'reason': f"audio codec {probe['audio_codec']}", 'video_filter': None}
+    if scale:
+        return {'action': 'downscale', 'reason': f"{probe['height']}p above {target_height}p", 'video_filter': scale}
+    reason = 'over size limit' if not fits else f"video codec {probe['video_codec']}"
+    return {'action': 'encode', 'reason': reason, 'video_filter': None}
+
+
+async def _stream_copy(input_path: str, output_path: str, reencode_audio: bool, duration: float = 0) -> bool:
+    """Перепаковка в mp4 без перекодирования видео"""
+    audio_args = ['-c:a', 'aac', '-b:a', f'{ENCODER_AUDIO_BITRATE}k'] if reencode_audio else ['-c:a', 'copy']
+    return await _run_ffmpeg([
+        FFMPEG_PATH, '-i', input_path,
+        '-map', '0:v:0', '-map', '0:a:0?',
+        '-c:v', 'copy', *audio_args,
+        '-movflags', '+faststart',
+        '-y', output_path
+    ], duration, 'Перепаковываю видео')
+
+
+@traced()
+async def encode_for_telegram(
+    input_path: str,
+    output_path: str,
+    target_size_mb: float,
+    require_output: bool = False
+) -> CompressionResult:
+    """
+    Готовит видео к отправке самым дешевым способом: без изменений, перепаковка,
+    перекодирование только аудио, уменьшение разрешения или полное кодирование.
+    При action == 'copy' результатом остается исходный файл (output_path не создается),
+    если не передан require_output
+    """
+    target_bytes = int(target_size_mb * 1024 * 1024)
+    probe = await probe_media(input_path)
+    if not probe:
+        return await compress_to_size(input_path, output_path, target_size_mb)
+
+    plan = plan_encode(probe, target_bytes, has_faststart(input_path), is_mp4_file(input_path, probe))
+    if plan['action'] == 'copy' and require_output:
+        plan = {'action': 'remux', 'reason': 'output file required', 'video_filter': None}
+
+    plan_stats[plan['action']] += 1
+    if plan['action'] in ('copy', 'remux', 'audio'):
+        plan_stats['seconds_not_reencoded'] += int(probe['duration'])
+    logger.info(
+        f"Encode plan for {os.path.basename(input_path)}: {plan['action']} ({plan['reason']}); "
+        f"{probe['video_codec']}/{probe['audio_codec']} {probe['height']}p, "
+        f"{probe['size'] / 1048576:.1f}MB, {probe['duration']:.0f}s"
+    )
+
+    if plan['action'] == 'copy':
+        return {
+            'success': True,
+            'output_path': input_path,
+            'target_size': target_bytes,
+            'predicted_size': probe['size'],
+            'actual_size': probe['size'],
+            'video_bitrate': 0,
+            'audio_bitrate': 0,
+            'attempts': 0,
+            'action': 'copy',
+        }
+
+    if plan['action'] in ('remux', 'audio'):
+        ok = await _stream_copy(
+            input_path, output_path,
+            reencode_audio=plan['action'] == 'audio', duration=probe['duration']
+        )
+        actual = os.path.getsize(output_path) if ok and os.path.exists(output_path) else 0
+        if 0 < actual <= target_bytes:
+            return {
+                'success': True,
+                'output_path': output_path,
+                'target_size': target_bytes,
+                'predicted_size': probe['size'],
+                'actual_size': actual,
+                'video_bitrate': 0,
+                'audio_bitrate': ENCODER_AUDIO_BITRATE if plan['action'] == 'audio' else 0,
+                'attempts': 1,
+                'action': plan['action'],
+            }
+        logger.warning(f"{plan['action']} did not produce a usable file, falling back to encode")
+
+    # Файл, который уже помещается, не раздуваем до полного бюджета
+    budget_mb = min(target_size_mb, probe['size'] / (1024 * 1024)) if probe['size'] <= target_bytes else target_size_mb
+    return await compress_to_size(input_path, output_path, budget_mb, video_filter=plan['video_filter'])
+
+
+def encoder_stats() -> dict:
+    """Сколько раз выбиралось каждое действие"""
+    return dict(plan_stats)
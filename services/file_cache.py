@@ -0,0 +1,168 @@
+import json
+import logging
+import sqlite3
+import time
+from typing import Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from config import FILE_CACHE_MAX_ENTRIES, FILE_CACHE_PATH, FILE_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+# Параметры, которые не влияют на контент (трекинг, шаринг)
+TRACKING_PARAMS = {
+    'si', 'feature', 'igshid', 'igsh', 'utm_source', 'utm_medium', 'utm_campaign',
+    'utm_term', 'utm_content', 'ref', 'ref_src', 's', 't', 'pp', 'fbclid', 'from',
+}
+
+HOST_ALIASES = {
+    'x.com': 'twitter.com',
+    'mobile.twitter.com': 'twitter.com',
+    'm.youtube.com': 'youtube.com',
+    'music.youtube.com': 'youtube.com',
+    'm.vk.com': 'vk.com',
+}
+
+
+def normalize_source_url(url: str) -> str:
+    """Приводит ссылку к каноническому виду для использования в качестве ключа"""
+    url = url.strip()
+    if '://' not in url:
+        url = f"https://{url}"
+
+    parts = urlsplit(url)
+    host = parts.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    host = HOST_ALIASES.get(host, host)
+    path = parts.path.rstrip('/') or '/'
+
+    query = [(k, v) for k, v in parse_qsl(parts.query) if k.lower() not in TRACKING_PARAMS]
+
+    # youtu.be/<id> и shorts -> youtube.com/watch?v=<id>
+    if host == 'youtu.be' and path != '/':
+        query = [('v', path.lstrip('/'))] + [(k, v) for k, v in query if k != 'v']
+        host, path = 'youtube.com', '/watch'
+    elif host == 'youtube.com' and path.startswith('/shorts/'):
+        query = [('v', path.split('/')[2])] + [(k, v) for k, v in query if k != 'v']
+        path = '/watch'
+
+    return urlunsplit(('https', host, path, urlencode(sorted(query)), ''))
+
+
+class FileIdCache:
+    """Постоянное хранилище file_id Telegram по ссылке на источник (TTL + LRU)"""
+
+    def __init__(self, path: str, ttl: int, max_entries: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _get_conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS file_ids ("
+                " key TEXT PRIMARY KEY,"
+                " items TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_file_ids_last_used ON file_ids (last_used)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    @staticmethod
+    def make_key(url: str, profile: str) -> str:
+        return f"{normalize_source_url(url)}|{profile}"
+
+    def get(self, url: str, profile: str = 'default') -> Optional[List[Dict]]:
+        """Возвращает сохраненные элементы или None"""
+        key = self.make_key(url, profile)
+        try:
+            conn = self._get_conn()
+            row = conn.execute(
+                "SELECT items, created_at FROM file_ids WHERE key = ?", (key,)
+            ).fetchone()
+            now = time.time()
+
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    conn.execute("DELETE FROM file_ids WHERE key = ?", (key,))
+                    conn.commit()
+                self.misses += 1
+                return None
+
+            conn.execute("UPDATE file_ids SET last_used = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+        except Exception as e:
+            logger.error(f"File cache read failed: {str(e)}")
+            self.misses += 1
+            return None
+
+    def put(self, url: str, items: List[Dict], profile: str = 'default'):
+        """Сохраняет элементы (type + file_id/text) для ссылки"""
+        if not items:
+            return
+        key = self.make_key(url, profile)
+        now = time.time()
+        try:
+            conn = self._get_conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO file_ids (key, items, created_at, last_used) "
+                "VALUES (?, ?, ?, ?)",
+                (key, json.dumps(items, ensure_ascii=False), now, now)
+            )
+            self._evict(conn, now)
+            conn.commit()
+        except Exception as e:
+            logger.error(f"File cache write failed: {str(e)}")
+
+    def invalidate(self, url: str, profile: str = 'default'):
+        """Удаляет запись (например, если Telegram отверг file_id)"""
+        try:
+            conn = self._get_conn()
+            conn.execute("DELETE FROM file_ids WHERE key = ?", (self.make_key(url, profile),))
+            conn.commit()
+        except Exception as e:
+            logger.error(f"File cache invalidate failed: {str(e)}")
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        """Удаляет просроченные записи и самые давно использованные сверх лимита"""
+        conn.execute("DELETE FROM file_ids WHERE created_at < ?", (now - self.ttl,))
+        count = conn.execute("SELECT COUNT(*) FROM file_ids").fetchone()[0]
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM file_ids WHERE key IN ("
+                " SELECT key FROM file_ids ORDER BY last_used ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def stats(self) -> Dict[str, float]:
+        """Счетчики попаданий/промахов и размер кэша"""
+        total = self.hits + self.misses
+        try:
+            entries = self._get_conn().execute("SELECT COUNT(*) FROM file_ids").fetchone()[0]
+        except Exception:
+            entries = -1
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'entries': entries,
+        }
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+file_id_cache = FileIdCache(FILE_CACHE_PATH, FILE_CACHE_TTL, FILE_CACHE_MAX_ENTRIES)
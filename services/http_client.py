@@ -0,0 +1,148 @@
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Dict, Optional, Type
+
+import aiohttp
+
+from config import HTTP_CONNECT_TIMEOUT, HTTP_DNS_TTL, HTTP_LIMIT, HTTP_LIMIT_PER_HOST, HTTP_READ_TIMEOUT, HTTP_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+
+class HostStats:
+    """Статистика запросов к одному хосту"""
+
+    __slots__ = ('requests', 'errors', 'total_time', 'max_time', 'new_connections', 'reused_connections')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.new_connections = 0
+        self.reused_connections = 0
+
+    def as_dict(self) -> Dict[str, float]:
+        connections = self.new_connections + self.reused_connections
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'avg_latency': self.total_time / self.requests if self.requests else 0.0,
+            'max_latency': self.max_time,
+            'new_connections': self.new_connections,
+            'reused_connections': self.reused_connections,
+            'reuse_rate': self.reused_connections / connections if connections else 0.0,
+        }
+
+
+class HttpClient:
+    """Общий для всего приложения aiohttp клиент с пулом соединений и статистикой"""
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 10,
+        dns_ttl: int = 300,
+        timeout: int = 30,
+        connect_timeout: int = 10,
+        read_timeout: int = 30
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.timeout = timeout
+        # Скачивание медиа: без общего лимита (большой файл качается долго),
+        # но с лимитом на подключение и на паузу между порциями данных
+        self.media_timeout = aiohttp.ClientTimeout(
+            total=None,
+            sock_connect=connect_timeout,
+            sock_read=read_timeout
+        )
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._hosts: Dict[str, HostStats] = defaultdict(HostStats)
+        # Подмена класса запроса (перенаправление на локальные стенды в benchmarks)
+        self.request_class: Optional[Type[aiohttp.ClientRequest]] = None
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(self._on_request_start)
+        trace.on_request_end.append(self._on_request_end)
+        trace.on_request_exception.append(self._on_request_exception)
+        trace.on_connection_create_end.append(self._on_connection_create)
+        trace.on_connection_reuseconn.append(self._on_connection_reuse)
+        return trace
+
+    async def _on_request_start(self, session, ctx, params):
+        ctx.host = params.url.host or ''
+        ctx.started = asyncio.get_running_loop().time()
+
+    async def _on_request_end(self, session, ctx, params):
+        elapsed = asyncio.get_running_loop().time() - ctx.started
+        stats = self._hosts[ctx.host]
+        stats.requests += 1
+        stats.total_time += elapsed
+        stats.max_time = max(stats.max_time, elapsed)
+
+    async def _on_request_exception(self, session, ctx, params):
+        stats = self._hosts[getattr(ctx, 'host', '')]
+        stats.requests += 1
+        stats.errors += 1
+
+    async def _on_connection_create(self, session, ctx, params):
+        self._hosts[getattr(ctx, 'host', '')].new_connections += 1
+
+    async def _on_connection_reuse(self, session, ctx, params):
+        self._hosts[getattr(ctx, 'host', '')].reused_connections += 1
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.dns_ttl,
+            use_dns_cache=True,
+        )
+        extra = {'request_class': self.request_class} if self.request_class else {}
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            trace_configs=[self._trace_config()],
+            **extra
+        )
+
+    async def start(self):
+        """Создает сессию (вызывается из on_startup)"""
+        if self._session is None or self._session.closed:
+            self._session = self._create_session()
+            logger.info(
+                f"HTTP client started: limit={self.limit}, per_host={self.limit_per_host}, "
+                f"dns_ttl={self.dns_ttl}s"
+            )
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """Общая сессия; создается при первом обращении, если start() не вызывался"""
+        if self._session is None or self._session.closed:
+            self._session = self._create_session()
+        return self._session
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Задержки и переиспользование соединений по хостам"""
+        return {host: stats.as_dict() for host, stats in self._hosts.items()}
+
+    async def close(self):
+        """Закрывает сессию (вызывается из on_shutdown)"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            logger.info("HTTP client closed")
+        self._session = None
+
+
+http_client = HttpClient(
+    limit=HTTP_LIMIT,
+    limit_per_host=HTTP_LIMIT_PER_HOST,
+    dns_ttl=HTTP_DNS_TTL,
+    timeout=HTTP_TIMEOUT,
+    connect_timeout=HTTP_CONNECT_TIMEOUT,
+    read_timeout=HTTP_READ_TIMEOUT
+)
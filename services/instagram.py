@@ -4,13 +4,11 @@ import logging
 import os
 import re
 import time
-import subprocess
+import hashlib
 import shutil
+import uuid
 from typing import List, Tuple, Optional, Dict
-from pathlib import Path
-from datetime import datetime
 
-import instaloader
 from config import (
     DOWNLOAD_DIR,
     INSTAGRAM_API_ENDPOINT,
@@ -19,10 +17,19 @@ from config import (
     MAX_RETRIES,
     MAX_FILE_SIZE,
     FFMPEG_PATH,
-    MAX_MERGED_VIDEO_SIZE,
     MAX_TELEGRAM_VIDEO_SIZE,
-    PHOTO_DURATION
+    PHOTO_DURATION,
+    PHOTO_SEGMENT_FPS,
+    SEGMENT_CACHE_DIR,
+    SEGMENT_WORKERS
 )
+from services.http_client import http_client
+from services.probe import probe_media
+from services.encoder import encode_for_telegram
+from services.disk_quota import disk_manager
+from services.workdir import current_workdir
+from services.metrics import count_download, ffmpeg_active, stage
+from services.tracing import traced
 
 logger = logging.getLogger(__name__)
 
@@ -59,6 +66,7 @@ class InstagramDownloader:
                 path = '\\\\?\\' + path
         return path
 
+    @traced()
     async def download_content(self, url: str, merge_all: bool = False) -> Tuple[Dict[str, List[str]], str]:
         """
         Основной метод загрузки контента
@@ -69,20 +77,25 @@ class InstagramDownloader:
             result = {'media': [], 'text': []}
             
             # Загрузка контента
-            media_files, status = await self._download_content_raw(url)
+            with stage('download'):
+                media_files, status = await self._download_content_raw(url)
+            for file in media_files:
+                count_download(os.path.getsize(file))
             result['media'] = media_files
             
             if not media_files:
                 return result, status
                 
             # Извлечение текста
-            text_file = await self._extract_post_text(url)
+            with stage('extract'):
+                text_file = await self._extract_post_text(url)
             if text_file:
                 result['text'].append(text_file)
             
             # Объединение медиа если требуется
             if merge_all and len(media_files) > 1:
-                merged_file = await self._merge_all_media(media_files)
+                with stage('merge'):
+                    merged_file = await self._merge_all_media(media_files)
                 if merged_file:
                     # Удаляем оригиналы и добавляем объединенный файл
                     for f in media_files:
@@ -94,7 +107,8 @@ class InstagramDownloader:
             final_media = []
             for file in result['media']:
                 if file.lower().endswith(('.mp4', '.mov')):
-                    compressed = await self._process_video_file(file)
+                    with stage('encode'):
+                        compressed = await self._process_video_file(file)
                     final_media.append(compressed if compressed else file)
                 else:
                     final_media.append(file)
@@ -107,74 +121,39 @@ class InstagramDownloader:
             return {'media': [], 'text': []}, f"Error: {str(e)}"
 
     def _check_disk_space(self):
-        """Проверяет доступное место на диске"""
+        """Проверяет доступное место на диске (с учетом мест, зарезервированных задачами)"""
         try:
-            total, used, free = shutil.disk_usage(DOWNLOAD_DIR)
-            min_space = 500 * 1024 * 1024  # 500MB минимально
-            if free < min_space:
-                raise RuntimeError(
-                    f"Not enough disk space. Need {min_space//(1024*1024)}MB, "
-                    f"available {free//(1024*1024)}MB"
-                )
+            disk_manager.ensure_free()
         except Exception as e:
             logger.error(f"Disk space check failed: {str(e)}")
             raise
 
+    @traced()
     async def _merge_all_media(self, media_files: List[str]) -> Optional[str]:
         """Объединяет фото и видео в одно видео"""
         if not media_files:
             return None
 
         # Создаем уникальную временную папку
-        temp_dir = self._safe_path(os.path.join(DOWNLOAD_DIR, f"temp_{int(time.time())}"))
+        work_dir = current_workdir()
+        temp_dir = self._safe_path(os.path.join(work_dir, f"temp_{uuid.uuid4().hex[:8]}"))
         self._ensure_directory_exists(temp_dir)
 
-        output_file = self._safe_path(os.path.join(DOWNLOAD_DIR, f"merged_{int(time.time())}.mp4"))
+        output_file = self._safe_path(os.path.join(work_dir, f"merged_{uuid.uuid4().hex[:8]}.mp4"))
 
         try:
-            # 1. Конвертируем все медиафайлы в видео сегменты
-            video_segments = []
-            for i, file in enumerate(media_files):
-                if not os.path.exists(file):
-                    logger.error(f"Исходный файл не найден: {file}")
-                    continue
-
-                ext = os.path.splitext(file)[1].lower()
-                segment_path = self._safe_path(os.path.join(temp_dir, f"segment_{i}.mp4"))
-
-                if ext in ('.jpg', '.jpeg', '.png', '.webp'):
-                    cmd = [
-                        FFMPEG_PATH,
-                        '-loop', '1',
-                        '-i', self._safe_path(file),
-                        '-c:v', 'libx264',
-                        '-t', str(PHOTO_DURATION),
-                        '-pix_fmt', 'yuv420p',
-                        '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2',
-                        '-y',
-                        segment_path
-                    ]
-                elif ext in ('.mp4', '.mov'):
-                    cmd = [
-                        FFMPEG_PATH,
-                        '-i', self._safe_path(file),
-                        '-c', 'copy',
-                        '-y',
-                        segment_path
-                    ]
-                else:
-                    continue
-
-                try:
-                    process = await asyncio.create_subprocess_exec(*cmd)
-                    await process.wait()
-                    
-                    if process.returncode == 0 and os.path.exists(segment_path):
-                        video_segments.append(segment_path)
-                    else:
-                        logger.error(f"Не удалось создать сегмент {i}")
-                except Exception as e:
-                    logger.error(f"Ошибка обработки сегмента {i}: {str(e)}")
+            # 1. Конвертируем все медиафайлы в видео сегменты параллельно
+            semaphore = asyncio.Semaphore(SEGMENT_WORKERS)
+            started = time.monotonic()
+            segments = await asyncio.gather(*(
+                self._render_segment(semaphore, i, file, temp_dir)
+                for i, file in enumerate(media_files)
+            ))
+            video_segments = [segment for segment in segments if segment]
+            logger.info(
+                f"Rendered {len(video_segments)}/{len(media_files)} segments "
+                f"in {time.monotonic() - started:.1f}s"
+            )
 
             if not video_segments:
                 logger.error("Не создано ни одного валидного видео сегмента")
@@ -211,7 +190,11 @@ class InstagramDownloader:
                     *concat_cmd,
                     cwd=temp_dir
                 )
-                await process.wait()
+                ffmpeg_active.inc()
+                try:
+                    await process.wait()
+                finally:
+                    ffmpeg_active.dec()
 
                 # Улучшенная проверка результата
                 if process.returncode != 0 or not os.path.exists(output_file) or os.path.getsize(output_file) == 0:
@@ -231,10 +214,112 @@ class InstagramDownloader:
             return None
             
         finally:
-            # Добавляем небольшую задержку перед очисткой
-            await asyncio.sleep(1)
             self._cleanup_temp_directory(temp_dir)
 
+    async def _render_segment(self, semaphore: asyncio.Semaphore, index: int, file: str, temp_dir: str) -> Optional[str]:
+        """Превращает один медиафайл в видео сегмент"""
+        if not os.path.exists(file):
+            logger.error(f"Исходный файл не найден: {file}")
+            return None
+
+        ext = os.path.splitext(file)[1].lower()
+        async with semaphore:
+            try:
+                segment_path = self._safe_path(os.path.join(temp_dir, f"segment_{index}.mp4"))
+                if ext in ('.jpg', '.jpeg', '.png', '.webp'):
+                    cached = await self._render_photo_segment(file)
+                    if cached:
+                        # Своя ссылка в папке задачи: очистка кэша не удалит сегмент во время склейки
+                        self._link_or_copy(cached, segment_path)
+                        return segment_path
+                    return None
+                if ext in ('.mp4', '.mov'):
+                    cmd = [
+                        FFMPEG_PATH,
+                        '-i', self._safe_path(file),
+                        '-c', 'copy',
+                        '-y',
+                        segment_path
+                    ]
+                    if await self._run_ffmpeg(cmd) and os.path.exists(segment_path):
+                        return segment_path
+                    logger.error(f"Не удалось создать сегмент {index}")
+            except Exception as e:
+                logger.error(f"Ошибка обработки сегмента {index}: {str(e)}")
+        return None
+
+    async def _render_photo_segment(self, file: str) -> Optional[str]:
+        """Сегмент из фото; готовые сегменты кэшируются по хэшу содержимого"""
+        loop = asyncio.get_running_loop()
+        digest = await loop.run_in_executor(None, self._file_digest, file)
+        # Параметры кодирования входят в ключ, чтобы смена настроек не отдавала старые сегменты
+        key = f"{digest}_{PHOTO_DURATION}s_{PHOTO_SEGMENT_FPS}fps"
+        self._ensure_directory_exists(SEGMENT_CACHE_DIR)
+        cached = self._safe_path(os.path.join(SEGMENT_CACHE_DIR, f"{key}.mp4"))
+
+        if os.path.exists(cached):
+            os.utime(cached)  # для LRU очистки кэша
+            logger.info(f"Segment cache hit: {os.path.basename(file)}")
+            return cached
+
+        tmp_path = self._safe_path(os.path.join(SEGMENT_CACHE_DIR, f"{key}.{uuid.uuid4().hex[:8]}.tmp.mp4"))
+        cmd = [
+            FFMPEG_PATH,
+            '-loop', '1',
+            '-framerate', str(PHOTO_SEGMENT_FPS),
+            '-i', self._safe_path(file),
+            '-c:v', 'libx264',
+            '-preset', 'veryfast',
+            '-tune', 'stillimage',
+            '-r', str(PHOTO_SEGMENT_FPS),
+            '-t', str(PHOTO_DURATION),
+            '-pix_fmt', 'yuv420p',
+            '-vf', 'scale=trunc(iw/2)*2:trunc(ih/2)*2',
+            '-y',
+            tmp_path
+        ]
+        if await self._run_ffmpeg(cmd) and os.path.exists(tmp_path):
+            os.replace(tmp_path, cached)  # атомарно, параллельные запросы не видят недописанный файл
+            return cached
+
+        logger.error(f"Не удалось создать сегмент из {file}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+    @staticmethod
+    def _link_or_copy(source: str, target: str):
+        """Жесткая ссылка на файл, копия - если ссылки не поддерживаются"""
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copyfile(source, target)
+
+    @staticmethod
+    def _file_digest(path: str) -> str:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    async def _run_ffmpeg(self, cmd: List[str]) -> bool:
+        """Запускает ffmpeg без вывода в консоль, возвращает успех"""
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        ffmpeg_active.inc()
+        try:
+            _, stderr = await process.communicate()
+        finally:
+            ffmpeg_active.dec()
+        if process.returncode != 0:
+            logger.error(f"FFmpeg error: {stderr.decode(errors='ignore')[-500:]}")
+            return False
+        return True
+
     def _cleanup_temp_directory(self, temp_dir: str):
         """Рекурсивно удаляет временную директорию"""
         try:
@@ -255,90 +340,33 @@ class InstagramDownloader:
             logger.error(f"Error cleaning temp directory: {str(e)}")
 
     async def _process_video_file(self, file_path: str) -> Optional[str]:
-        """Сжимает видео если превышен лимит размера"""
+        """Готовит видео к отправке (перепаковка/сжатие только при необходимости)"""
         try:
             if not os.path.exists(file_path):
                 logger.error(f"Video file not found: {file_path}")
                 return None
 
-            file_size = os.path.getsize(file_path) / (1024 * 1024)  # MB
-            
-            if file_size > MAX_TELEGRAM_VIDEO_SIZE:
-                compressed_path = self._safe_path(
-                    f"{os.path.splitext(file_path)[0]}_compressed.mp4"
-                )
-                if await self._compress_video(file_path, compressed_path):
-                    await self._safe_remove_file(file_path)
-                    return compressed_path
+            compressed_path = self._safe_path(
+                f"{os.path.splitext(file_path)[0]}_compressed.mp4"
+            )
+            result = await encode_for_telegram(
+                self._safe_path(file_path),
+                compressed_path,
+                MAX_TELEGRAM_VIDEO_SIZE
+            )
+            if result['success'] and result['output_path'] == compressed_path:
+                await self._safe_remove_file(file_path)
+                return compressed_path
         except Exception as e:
             logger.error(f"Video processing failed: {str(e)}")
         return None
 
-    async def _compress_video(self, input_path: str, output_path: str) -> bool:
-        """Сжимает видео с сохранением качества"""
-        try:
-            duration = await self._get_video_duration(input_path)
-            if not duration or duration <= 0:
-                logger.error(f"Invalid video duration: {duration}")
-                return False
-                
-            target_bitrate = int((MAX_TELEGRAM_VIDEO_SIZE * 8192) / duration)
-
-            cmd = [
-                FFMPEG_PATH,
-                '-i', self._safe_path(input_path),
-                '-c:v', 'libx264',
-                '-preset', 'fast',
-                '-crf', '23',
-                '-maxrate', f'{target_bitrate}k',
-                '-bufsize', f'{target_bitrate * 2}k',
-                '-vf', 'scale=-2:720',
-                '-c:a', 'aac',
-                '-b:a', '128k',
-                '-movflags', '+faststart',
-                '-y',
-                self._safe_path(output_path)
-            ]
-
-            process = await asyncio.create_subprocess_exec(*cmd)
-            await process.wait()
-            
-            return os.path.exists(output_path) and os.path.getsize(output_path) > 0
-
-        except Exception as e:
-            logger.error(f"Compression failed: {str(e)}")
-            return False
-
     async def _get_video_duration(self, video_path: str) -> Optional[float]:
         """Получает длительность видео в секундах"""
-        try:
-            cmd = [
-                FFMPEG_PATH,
-                '-i', self._safe_path(video_path),
-                '-f', 'null',
-                '-'
-            ]
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stderr=subprocess.PIPE,
-                stdout=subprocess.PIPE
-            )
-            _, stderr = await process.communicate()
-            
-            duration_match = re.search(
-                r"Duration: (\d+):(\d+):(\d+\.\d+)", 
-                stderr.decode(errors='ignore')
-            )
-            if duration_match:
-                hours = float(duration_match.group(1))
-                minutes = float(duration_match.group(2))
-                seconds = float(duration_match.group(3))
-                return hours * 3600 + minutes * 60 + seconds
-            return None
-        except Exception as e:
-            logger.error(f"Failed to get duration: {str(e)}")
-            return None
+        probe = await probe_media(self._safe_path(video_path))
+        return probe['duration'] if probe else None
 
+    @traced()
     async def _extract_post_text(self, url: str) -> Optional[str]:
         """Извлекает текст поста"""
         if '/p/' not in url and '/reel/' not in url and '/tv/' not in url:
@@ -350,7 +378,7 @@ class InstagramDownloader:
             
         # Для Instaloader проверяем файл с текстом
         caption_file = self._safe_path(
-            os.path.join(DOWNLOAD_DIR, f"{shortcode}_caption.txt")
+            os.path.join(current_workdir(), f"{shortcode}_caption.txt")
         )
         if os.path.exists(caption_file):
             return caption_file
@@ -358,6 +386,7 @@ class InstagramDownloader:
         # Для API или если файл не создан
         try:
             if not self.use_api:
+                import instaloader
                 post = instaloader.Post.from_shortcode(self.loader.context, shortcode)
                 caption = post.caption
                 if caption:
@@ -396,6 +425,7 @@ class InstagramDownloader:
 
         return [], "Unknown error occurred"
 
+    @traced()
     async def _download_via_api(self, url: str) -> Tuple[List[str], str]:
         """Загрузка через API"""
         content_type, payload = self._prepare_api_payload(url)
@@ -408,47 +438,47 @@ class InstagramDownloader:
         }
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    INSTAGRAM_API_ENDPOINT,
-                    json=payload,
-                    headers=headers,
-                    timeout=aiohttp.ClientTimeout(total=30)
-                ) as response:
-                    
-                    if response.status != 200:
-                        error_msg = await response.text()
-                        return [], f"API error {response.status}: {error_msg}"
+            session = http_client.session
+            async with session.post(
+                INSTAGRAM_API_ENDPOINT,
+                json=payload,
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=30)
+            ) as response:
+                
+                if response.status != 200:
+                    error_msg = await response.text()
+                    return [], f"API error {response.status}: {error_msg}"
 
-                    data = await response.json()
-                    
-                    if not data.get('success'):
-                        return [], "API request failed"
-                    
-                    media_items = data.get('data', [])
-                    if not media_items:
-                        return [], "No media data found"
+                data = await response.json()
+                
+                if not data.get('success'):
+                    return [], "API request failed"
+                
+                media_items = data.get('data', [])
+                if not media_items:
+                    return [], "No media data found"
+                
+                downloaded_files = []
+                for item in media_items:
+                    media_url = item.get('url')
+                    if not media_url:
+                        continue
                     
-                    downloaded_files = []
-                    for item in media_items:
-                        media_url = item.get('url')
-                        if not media_url:
-                            continue
-                        
-                        ext = self._get_file_extension(media_url, item)
-                        filename = self._safe_path(
-                            os.path.join(
-                                DOWNLOAD_DIR,
-                                f"insta_{content_type}_{int(time.time())}_{len(downloaded_files)}{ext}"
-                            )
+                    ext = self._get_file_extension(media_url, item)
+                    filename = self._safe_path(
+                        os.path.join(
+                            current_workdir(),
+                            f"insta_{content_type}_{len(downloaded_files)}{ext}"
                         )
-                        
-                        if await self._download_media_file(session, media_url, filename):
-                            downloaded_files.append(filename)
+                    )
                     
-                    if downloaded_files:
-                        return downloaded_files, "Download successful via API"
-                    return [], "No downloadable media found"
+                    if await self._download_media_file(session, media_url, filename):
+                        downloaded_files.append(filename)
+                
+                if downloaded_files:
+                    return downloaded_files, "Download successful via API"
+                return [], "No downloadable media found"
 
         except asyncio.TimeoutError:
             return [], "API request timed out"
@@ -461,7 +491,7 @@ class InstagramDownloader:
     async def _download_media_file(self, session: aiohttp.ClientSession, url: str, filename: str) -> bool:
         """Загрузка одного медиафайла"""
         try:
-            async with session.get(url, timeout=aiohttp.ClientTimeout(total=60)) as response:
+            async with session.get(url, timeout=http_client.media_timeout) as response:
                 if response.status != 200:
                     return False
                 
@@ -484,6 +514,7 @@ class InstagramDownloader:
             logger.error(f"Download failed: {url} - {str(e)}")
             return False
 
+    @traced()
     async def _download_via_instaloader(self, url: str) -> Tuple[List[str], str]:
         """Загрузка через Instaloader"""
         try:
@@ -501,17 +532,16 @@ class InstagramDownloader:
             return [], "Invalid Instagram URL"
 
         try:
+            import instaloader
             post = instaloader.Post.from_shortcode(self.loader.context, shortcode)
+            work_dir = current_workdir()
+            # Вызовы Instaloader синхронные, поэтому смена папки не пересекается с другими задачами
+            self.loader.dirname_pattern = work_dir
             self.loader.download_post(post, target=shortcode)
-            await asyncio.sleep(2)
 
-            media_files = self._find_downloaded_files(shortcode)
+            media_files = self._resolve_manifest(self._post_manifest(post, work_dir))
             if not media_files:
-                alt_files = self._find_files_recursive(shortcode)
-                if alt_files:
-                    return alt_files, "Download successful"
                 return [], "Files not found after download"
-
             return media_files, "Download successful"
 
         except Exception as e:
@@ -525,6 +555,7 @@ class InstagramDownloader:
             return [], "Invalid story URL"
 
         try:
+            import instaloader
             profile = instaloader.Profile.from_username(self.loader.context, username)
             stories = list(self.loader.get_stories([profile.userid]))
             
@@ -540,46 +571,45 @@ class InstagramDownloader:
             if not target_item:
                 return [], "Story not found"
 
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"{username}_story_{timestamp}"
-            self.loader.download_storyitem(target_item, filename=filename)
+            work_dir = current_workdir()
+            self.loader.dirname_pattern = work_dir
+            self.loader.download_storyitem(target_item, target=username)
 
-            media_files = []
-            for ext in ['.jpg', '.mp4']:
-                path = self._safe_path(os.path.join(DOWNLOAD_DIR, f"{filename}{ext}"))
-                if os.path.exists(path):
-                    media_files.append(path)
-
-            return media_files if media_files else [], "Downloaded files not found"
+            base = os.path.join(work_dir, self.loader.format_filename(target_item, target=username))
+            media_files = self._resolve_manifest([(base, target_item.is_video)])
+            return media_files, "Download successful" if media_files else "Downloaded files not found"
 
         except Exception as e:
             logger.error(f"Story download failed: {str(e)}")
             return [], f"Story download failed: {str(e)}"
 
-    def _find_downloaded_files(self, shortcode: str) -> List[str]:
-        """Поиск скачанных файлов по shortcode"""
+    def _post_manifest(self, post, work_dir: str) -> List[Tuple[str, bool]]:
+        """
+        Ожидаемые файлы поста по его узлам (путь без расширения, видео ли это)
+        в том же порядке и с теми же именами, что дает Instaloader
+        """
+        base = os.path.join(work_dir, self.loader.format_filename(post, target=post.shortcode))
+        if post.typename == 'GraphSidecar':
+            return [
+                (f"{base}_{index}", node.is_video)
+                for index, node in enumerate(post.get_sidecar_nodes(), start=1)
+            ]
+        return [(base, post.is_video)]
+
+    def _resolve_manifest(self, manifest: List[Tuple[str, bool]]) -> List[str]:
+        """Проверяет ожидаемые файлы: для видео берется mp4, а не превью"""
         media_files = []
-        for ext in ['.jpg', '.jpeg', '.png', '.mp4', '.webp']:
-            path = self._safe_path(os.path.join(DOWNLOAD_DIR, f"{shortcode}{ext}"))
-            if os.path.exists(path):
-                media_files.append(path)
-        
-        if not media_files:
-            for f in os.listdir(DOWNLOAD_DIR):
-                if f.startswith(shortcode) and f.lower().endswith(('.jpg', '.jpeg', '.png', '.mp4', '.webp')):
-                    media_files.append(self._safe_path(os.path.join(DOWNLOAD_DIR, f)))
-        
+        for base, is_video in manifest:
+            extensions = ('.mp4',) if is_video else ('.jpg', '.jpeg', '.png', '.webp', '.heic')
+            for ext in extensions:
+                path = self._safe_path(f"{base}{ext}")
+                if os.path.exists(path):
+                    media_files.append(path)
+                    break
+            else:
+                logger.warning(f"Expected Instaloader file is missing: {base}")
         return media_files
 
-    def _find_files_recursive(self, pattern: str) -> List[str]:
-        """Рекурсивный поиск файлов"""
-        files = []
-        for root, _, filenames in os.walk(DOWNLOAD_DIR):
-            for f in filenames:
-                if f.startswith(pattern) and f.lower().endswith(('.jpg', '.jpeg', '.png', '.mp4', '.webp')):
-                    files.append(self._safe_path(os.path.join(root, f)))
-        return files
-
     def _prepare_api_payload(self, url: str) -> Tuple[Optional[str], dict]:
         """Подготовка запроса к API"""
         if '/stories/' in url:
@@ -0,0 +1,97 @@
+import asyncio
+import contextvars
+import functools
+import logging
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from config import DOWNLOAD_POOL_TYPE, DOWNLOAD_WORKERS
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadEngine:
+    """Пул воркеров для блокирующих загрузок, чтобы не останавливать event loop"""
+
+    def __init__(self, workers: int = 4, pool_type: str = 'thread'):
+        self.workers = max(1, workers)
+        self.pool_type = pool_type if pool_type in ('thread', 'process') else 'thread'
+        self._executor: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._queued = 0
+        self._active = 0
+        self._completed = 0
+        self._failed = 0
+
+    def _get_executor(self) -> Executor:
+        """Создает пул при первом обращении"""
+        if self._executor is None:
+            if self.pool_type == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix='download'
+                )
+            logger.info(f"Download pool started: {self.pool_type} x{self.workers}")
+        return self._executor
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        # Семафор создается внутри работающего loop
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        return self._slots
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Выполняет блокирующую функцию в пуле и возвращает ее результат"""
+        loop = asyncio.get_running_loop()
+        call = functools.partial(func, *args, **kwargs)
+        if self.pool_type == 'thread':
+            # run_in_executor не переносит contextvars (request id, трассировка) в поток
+            call = functools.partial(contextvars.copy_context().run, call)
+
+        self._queued += 1
+        queued = True
+        try:
+            async with self._get_slots():
+                self._queued -= 1
+                queued = False
+                self._active += 1
+                try:
+                    result = await loop.run_in_executor(self._get_executor(), call)
+                finally:
+                    self._active -= 1
+            self._completed += 1
+            return result
+        except Exception:
+            self._failed += 1
+            raise
+        finally:
+            if queued:
+                self._queued -= 1
+
+    def submit(self, func: Callable, *args, **kwargs) -> 'asyncio.Future':
+        """Ставит задачу в очередь и возвращает future для ожидания результата"""
+        return asyncio.ensure_future(self.run(func, *args, **kwargs))
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики очереди и загрузки воркеров"""
+        return {
+            'pool_type': self.pool_type,
+            'workers': self.workers,
+            'queued': self._queued,
+            'active': self._active,
+            'utilisation': self._active / self.workers,
+            'completed': self._completed,
+            'failed': self._failed,
+        }
+
+    def shutdown(self):
+        """Останавливает пул, не дожидаясь незавершенных задач"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            logger.info("Download pool stopped")
+
+
+download_engine = DownloadEngine(DOWNLOAD_WORKERS, DOWNLOAD_POOL_TYPE)
@@ -0,0 +1,57 @@
+import asyncio
+import importlib
+import logging
+import sys
+import time
+from types import ModuleType
+from typing import Callable, Dict, Iterable
+
+logger = logging.getLogger(__name__)
+
+# Время первого импорта модулей, загруженных через timed_import (сек)
+import_times: Dict[str, float] = {}
+
+
+def timed_import(name: str) -> ModuleType:
+    """
+    Импортирует модуль и запоминает, сколько занял первый импорт.
+    import_module вызывается всегда: он ждет импорт, идущий в другом потоке
+    (warm_up), вместо того чтобы вернуть недогруженный модуль из sys.modules
+    """
+    first = name not in sys.modules and name not in import_times
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    if first:
+        elapsed = time.perf_counter() - started
+        import_times.setdefault(name, elapsed)
+        logger.info(f"Imported {name} in {elapsed * 1000:.0f}ms")
+    return module
+
+
+def lazy_callable(module_name: str, attr: str) -> Callable:
+    """Функция-обертка, которая импортирует модуль только при первом вызове"""
+    def call(*args, **kwargs):
+        return getattr(timed_import(module_name), attr)(*args, **kwargs)
+    call.__name__ = attr
+    call.__qualname__ = attr
+    return call
+
+
+async def warm_up(modules: Iterable[str]):
+    """Фоновый импорт модулей в потоке, чтобы первый запрос не ждал загрузки"""
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    for name in modules:
+        try:
+            await loop.run_in_executor(None, timed_import, name)
+        except Exception as e:
+            logger.error(f"Warm-up import of {name} failed: {str(e)}")
+    logger.info(f"Warm-up finished in {time.perf_counter() - started:.2f}s: {import_report()}")
+
+
+def import_report() -> Dict[str, str]:
+    """Время импорта модулей, от самых медленных"""
+    return {
+        name: f"{elapsed * 1000:.0f}ms"
+        for name, elapsed in sorted(import_times.items(), key=lambda item: -item[1])
+    }
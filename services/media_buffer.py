@@ -0,0 +1,81 @@
+import logging
+import os
+from typing import Dict, Optional
+
+from config import INMEMORY_BUDGET_MB
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBudget:
+    """
+    Общий лимит байт, которые скачанные медиа могут держать в памяти.
+    Не блокирует: если места нет, вызывающий сохраняет файл на диск
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self.peak = 0
+        self.granted = 0
+        self.denied = 0
+
+    def try_acquire(self, size: int) -> bool:
+        if self.used + size > self.limit:
+            self.denied += 1
+            return False
+        self.used += size
+        self.peak = max(self.peak, self.used)
+        self.granted += 1
+        return True
+
+    def release(self, size: int):
+        self.used = max(self.used - size, 0)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'used_mb': self.used / 1048576,
+            'peak_mb': self.peak / 1048576,
+            'limit_mb': self.limit / 1048576,
+            'granted': self.granted,
+            'denied': self.denied,
+        }
+
+
+image_memory = MemoryBudget(INMEMORY_BUDGET_MB * 1024 * 1024)
+
+
+class FetchedMedia:
+    """
+    Скачанный файл: байты в памяти (маленькие файлы) или путь на диске.
+    После отправки нужно вызвать release()
+    """
+
+    def __init__(self, filename: str, data: Optional[bytes] = None, path: Optional[str] = None, reserved: int = 0):
+        self.filename = filename
+        self.data = data
+        self.path = path
+        self._reserved = reserved
+
+    @property
+    def in_memory(self) -> bool:
+        return self.data is not None
+
+    @property
+    def size(self) -> int:
+        if self.data is not None:
+            return len(self.data)
+        return os.path.getsize(self.path) if self.path and os.path.exists(self.path) else 0
+
+    def release(self):
+        """Освобождает память из бюджета или удаляет файл с диска"""
+        if self._reserved:
+            image_memory.release(self._reserved)
+            self._reserved = 0
+        self.data = None
+        if self.path and os.path.exists(self.path):
+            try:
+                os.remove(self.path)
+            except OSError as e:
+                logger.warning(f"Could not remove {self.path}: {str(e)}")
+        self.path = None
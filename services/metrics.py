@@ -0,0 +1,299 @@
+import logging
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+
+# Границы корзин для длительностей (сек): от разбора ссылки до многоминутного сжатия
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+Collector = Callable[[], Union[float, Dict[LabelValues, float]]]
+
+
+class Metric(ABC):
+    """Базовый класс метрики с метками (формат Prometheus text 0.0.4)"""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """Строки значений метрики (без HELP/TYPE)"""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    """
+    Значения по меткам; collect (если задан) вызывается при каждом чтении /metrics
+    и возвращает число или словарь {значения меток: число} - для счетчиков,
+    которые уже ведут другие модули (stats())
+    """
+
+    kind = 'counter'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        collect: Optional[Collector] = None
+    ):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._collect = collect
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        values = dict(self._values)
+        if self._collect is not None:
+            try:
+                collected = self._collect()
+            except Exception as e:
+                logger.warning(f"Metric {self.name} collect failed: {str(e)}")
+                collected = {}
+            values.update(collected if isinstance(collected, dict) else {(): collected})
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Gauge(Counter):
+    """Текущее значение, которое может уменьшаться"""
+
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # значения меток -> (счетчики по корзинам, сумма, количество)
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0, 0])
+        counts, totals = series
+        counts[bisect_left(self.buckets, value)] += 1
+        totals[0] += value
+        totals[1] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, (total, count)) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float('inf')), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                bucket_labels = _format_labels(self.labelnames, key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {int(count)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return '\n'.join(metric.render() for metric in self._metrics.values()) + '\n'
+
+
+registry = Registry()
+
+stage_seconds = registry.register(Histogram(
+    'bot_stage_seconds', 'Duration of one processing stage',
+    ('handler', 'stage')
+))
+request_seconds = registry.register(Histogram(
+    'bot_request_seconds', 'End-to-end duration of one link',
+    ('handler',)
+))
+requests_total = registry.register(Counter(
+    'bot_requests_total', 'Processed links by outcome',
+    ('handler', 'outcome')
+))
+errors_total = registry.register(Counter(
+    'bot_errors_total', 'Errors by stage and exception type',
+    ('handler', 'stage', 'type')
+))
+api_calls_total = registry.register(Counter(
+    'bot_telegram_api_calls_total', 'Telegram Bot API calls by method and status',
+    ('method', 'status')
+))
+bytes_downloaded_total = registry.register(Counter(
+    'bot_bytes_downloaded_total', 'Bytes of media downloaded from platforms',
+    ('handler',)
+))
+bytes_uploaded_total = registry.register(Counter(
+    'bot_bytes_uploaded_total', 'Bytes of media uploaded to Telegram',
+    ('handler',)
+))
+ffmpeg_active = registry.register(Gauge(
+    'bot_ffmpeg_processes', 'Running ffmpeg processes'
+))
+
+# Обработчик текущей задачи (handle_instagram, handle_video_download, ...)
+_handler: ContextVar[str] = ContextVar('metrics_handler', default='none')
+
+
+def current_handler() -> str:
+    return _handler.get()
+
+
+@contextmanager
+def track_request(handler: str):
+    """Метка обработчика для всех стадий внутри и общее время обработки ссылки"""
+    token = _handler.set(handler)
+    started = time.perf_counter()
+    outcome = 'ok'
+    try:
+        yield
+    except BaseException:
+        outcome = 'error'
+        raise
+    finally:
+        request_seconds.observe(time.perf_counter() - started, handler=handler)
+        requests_total.inc(handler=handler, outcome=outcome)
+        _handler.reset(token)
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Время одной стадии (classify, extract, download, probe, encode, merge, upload)
+    с меткой текущего обработчика; исключения считаются по типу
+    """
+    handler = _handler.get()
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        errors_total.inc(handler=handler, stage=name, type=type(e).__name__)
+        raise
+    finally:
+        stage_seconds.observe(time.perf_counter() - started, handler=handler, stage=name)
+
+
+def count_download(size: int):
+    bytes_downloaded_total.inc(size, handler=_handler.get())
+
+
+def register_runtime_gauges():
+    """Очереди, пулы и кэши, значения которых читаются в момент запроса /metrics"""
+    from services.browser_pool import browser_pool
+    from services.disk_quota import disk_manager
+    from services.file_cache import file_id_cache
+    from services.jobs import download_engine
+    from services.media_buffer import image_memory
+    from services.scheduler import job_scheduler
+    from services.singleflight import inflight
+
+    registry.register(Gauge(
+        'bot_queue_jobs', 'Jobs in the link scheduler', ('state',),
+        collect=lambda: {
+            ('active',): job_scheduler.stats()['active'],
+            ('queued',): job_scheduler.stats()['queued'],
+        }
+    ))
+    registry.register(Gauge(
+        'bot_download_pool_jobs', 'Jobs in the blocking download pool', ('state',),
+        collect=lambda: {
+            ('active',): download_engine.stats()['active'],
+            ('queued',): download_engine.stats()['queued'],
+        }
+    ))
+    registry.register(Gauge(
+        'bot_browser_processes', 'Chrome instances in the browser pool', ('state',),
+        collect=lambda: {
+            ('idle',): browser_pool.stats()['idle'],
+            ('busy',): browser_pool.stats()['busy'],
+        }
+    ))
+    registry.register(Counter(
+        'bot_file_cache_lookups_total', 'file_id cache lookups', ('result',),
+        collect=lambda: {('hit',): file_id_cache.hits, ('miss',): file_id_cache.misses}
+    ))
+    registry.register(Counter(
+        'bot_singleflight_calls_total', 'Single-flight leaders and followers', ('role',),
+        collect=lambda: {('leader',): inflight.leaders, ('follower',): inflight.followers}
+    ))
+    registry.register(Gauge(
+        'bot_disk_reserved_bytes', 'Disk space reserved by running jobs',
+        collect=disk_manager.reserved
+    ))
+    registry.register(Gauge(
+        'bot_memory_media_bytes', 'Media bytes held in memory',
+        collect=lambda: image_memory.used
+    ))
+
+
+async def start_metrics_server(host: str, port: int):
+    """HTTP сервер с /metrics; возвращает AppRunner для остановки"""
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(text=registry.render(), content_type='text/plain', charset='utf-8')
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Metrics endpoint: http://{host}:{port}/metrics")
+    return runner
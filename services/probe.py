@@ -0,0 +1,109 @@
+import asyncio
+import json
+import logging
+import os
+from collections import OrderedDict
+from typing import Optional, Tuple, TypedDict
+
+from config import FFPROBE_PATH, PROBE_CACHE_SIZE
+from services.metrics import stage
+from services.tracing import traced
+
+logger = logging.getLogger(__name__)
+
+
+class MediaProbe(TypedDict):
+    duration: float
+    size: int
+    bit_rate: int
+    format_name: str
+    width: int
+    height: int
+    video_codec: Optional[str]
+    pix_fmt: Optional[str]
+    audio_codec: Optional[str]
+    audio_bitrate: int
+
+
+_cache: 'OrderedDict[Tuple[str, int, int], MediaProbe]' = OrderedDict()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def _parse(data: dict, size: int) -> MediaProbe:
+    """Разбор JSON ответа ffprobe"""
+    fmt = data.get('format', {})
+    video = next((s for s in data.get('streams', []) if s.get('codec_type') == 'video'), {})
+    audio = next((s for s in data.get('streams', []) if s.get('codec_type') == 'audio'), {})
+
+    duration = float(fmt.get('duration') or video.get('duration') or 0)
+    bit_rate = int(fmt.get('bit_rate') or 0)
+    if not bit_rate and duration:
+        bit_rate = int(size * 8 / duration)
+
+    return {
+        'duration': duration,
+        'size': size,
+        'bit_rate': bit_rate,
+        'format_name': fmt.get('format_name', ''),
+        'width': int(video.get('width') or 0),
+        'height': int(video.get('height') or 0),
+        'video_codec': video.get('codec_name'),
+        'pix_fmt': video.get('pix_fmt'),
+        'audio_codec': audio.get('codec_name'),
+        'audio_bitrate': int(audio.get('bit_rate') or 0),
+    }
+
+
+@traced()
+async def probe_media(path: str) -> Optional[MediaProbe]:
+    """
+    Читает метаданные контейнера (без декодирования) одним вызовом ffprobe.
+    Результат кэшируется по пути + mtime + размеру файла
+    """
+    try:
+        st = os.stat(path)
+    except OSError as e:
+        logger.error(f"Probe failed, file not accessible: {path} - {str(e)}")
+        return None
+
+    key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    cached = _cache.get(key)
+    if cached is not None:
+        _cache.move_to_end(key)
+        _stats['hits'] += 1
+        return cached
+    _stats['misses'] += 1
+
+    cmd = [
+        FFPROBE_PATH,
+        '-v', 'error',
+        '-print_format', 'json',
+        '-show_format',
+        '-show_streams',
+        path
+    ]
+    try:
+        with stage('probe'):
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            stdout, stderr = await proc.communicate()
+        if proc.returncode != 0:
+            logger.error(f"ffprobe error for {path}: {stderr.decode(errors='ignore').strip()}")
+            return None
+        result = _parse(json.loads(stdout.decode(errors='ignore') or '{}'), st.st_size)
+    except Exception as e:
+        logger.error(f"Probe failed for {path}: {str(e)}")
+        return None
+
+    _cache[key] = result
+    while len(_cache) > PROBE_CACHE_SIZE:
+        _cache.popitem(last=False)
+    return result
+
+
+def probe_cache_stats() -> dict:
+    """Счетчики кэша метаданных"""
+    return {**_stats, 'entries': len(_cache)}
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, Optional
+
+from config import PROGRESS_EDIT_INTERVAL, PROGRESS_HOOK_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+
+class ChatEditLimiter:
+    """
+    Очередь правок сообщений по чатам: не чаще одной правки в interval секунд
+    на чат, плюс пауза retry_after после ответа 429 от Telegram
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._next: Dict[int, float] = {}
+        self.throttled = 0
+
+    def reserve(self, chat_id: int) -> float:
+        """Занимает ближайший слот для правки; возвращает, сколько секунд ждать"""
+        now = time.monotonic()
+        if len(self._next) > 1000:
+            self._next = {chat: at for chat, at in self._next.items() if at > now}
+        slot = max(now, self._next.get(chat_id, 0.0))
+        self._next[chat_id] = slot + self.interval
+        return slot - now
+
+    def penalize(self, chat_id: int, retry_after: float):
+        self.throttled += 1
+        self._next[chat_id] = max(self._next.get(chat_id, 0.0), time.monotonic() + retry_after)
+
+
+edit_limiter = ChatEditLimiter(PROGRESS_EDIT_INTERVAL)
+
+
+class ProgressReporter:
+    """
+    Показывает ход долгой задачи в одном статусном сообщении.
+    Частые обновления схлопываются: отправляется только последнее состояние
+    """
+
+    def __init__(self, edit: Callable[[str], Awaitable], chat_id: int):
+        self._edit = edit
+        self.chat_id = chat_id
+        self._loop = asyncio.get_running_loop()
+        self._latest: Optional[str] = None
+        self._shown: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+        self.edits = 0
+
+    def update(self, text: str):
+        """Новое состояние (вызывается из event loop)"""
+        if self._closed:
+            return
+        self._latest = text
+        if self._task is None or self._task.done():
+            self._task = self._loop.create_task(self._flush())
+
+    def update_threadsafe(self, text: str):
+        """Новое состояние из потока пула загрузок"""
+        if not self._closed:
+            self._loop.call_soon_threadsafe(self.update, text)
+
+    async def _flush(self):
+        delay = edit_limiter.reserve(self.chat_id)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        text = self._latest
+        if self._closed or text is None or text == self._shown:
+            return
+        try:
+            await self._edit(text)
+            self._shown = text
+            self.edits += 1
+        except Exception as e:
+            retry_after = getattr(e, 'retry_after', None)
+            if retry_after:
+                edit_limiter.penalize(self.chat_id, retry_after)
+            logger.debug(f"Progress edit skipped: {str(e)}")
+        # Состояние, пришедшее во время правки, update не запланировал (задача еще шла)
+        if not self._closed and self._latest != text:
+            self._task = self._loop.create_task(self._flush())
+
+    def close(self):
+        """Останавливает обновления; несделанная правка отменяется"""
+        self._closed = True
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+
+# Репортер текущей задачи (задается обработчиком, читается в services)
+_current: ContextVar[Optional[ProgressReporter]] = ContextVar('progress_reporter', default=None)
+
+
+def current_progress() -> Optional[ProgressReporter]:
+    return _current.get()
+
+
+@contextmanager
+def bind_progress(reporter: ProgressReporter):
+    token = _current.set(reporter)
+    try:
+        yield reporter
+    finally:
+        _current.reset(token)
+        reporter.close()
+
+
+def format_bytes(size: Optional[float]) -> str:
+    if not size:
+        return '?'
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.0f}{unit}" if unit == 'B' else f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.2f}GB"
+
+
+def format_eta(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return '?'
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}:{seconds:02d}"
+
+
+def download_text(d: Dict) -> str:
+    """Текст статуса по событию progress_hooks yt-dlp"""
+    done = d.get('downloaded_bytes') or 0
+    total = d.get('total_bytes') or d.get('total_bytes_estimate')
+    percent = f" ({done * 100 / total:.0f}%)" if total else ''
+    return (
+        f"⬇️ Скачиваю: {format_bytes(done)} из {format_bytes(total)}{percent}\n"
+        f"⚡ {format_bytes(d.get('speed'))}/с · осталось {format_eta(d.get('eta'))}"
+    )
+
+
+def encode_text(label: str, percent: float, speed: Optional[str] = None) -> str:
+    """Текст статуса по выводу ffmpeg -progress"""
+    suffix = f" · {speed}" if speed else ''
+    return f"🎞 {label}: {min(percent, 100):.0f}%{suffix}"
+
+
+def ytdl_progress_hook() -> Optional[Callable[[Dict], None]]:
+    """
+    Хук progress_hooks для yt-dlp, передающий прогресс репортеру текущей задачи.
+    Вызывается в event loop до запуска загрузки; сам хук работает в потоке пула
+    """
+    reporter = current_progress()
+    if reporter is None:
+        return None
+    last = [0.0]
+
+    def hook(d: Dict):
+        if d.get('status') != 'downloading':
+            return
+        now = time.monotonic()
+        # Хук срабатывает на каждый блок данных - не будим loop чаще нужного
+        if now - last[0] < PROGRESS_HOOK_INTERVAL:
+            return
+        last[0] = now
+        reporter.update_threadsafe(download_text(d))
+
+    return hook
@@ -0,0 +1,132 @@
+import re
+from typing import Any, Dict, Iterable, List, Optional, Pattern, Tuple, TypedDict
+
+
+class UrlRoute(TypedDict):
+    platform: Optional[str]  # None - платформа не поддерживается
+    kind: str  # video | clip | wall | story | reel | post | tweet | playlist | unknown
+    url: str
+
+
+# Ссылки в тексте без entities (например, из пересланного текста)
+_URL_IN_TEXT_RE = re.compile(r'(?:https?://|www\.)[^\s<>"\']+', re.IGNORECASE)
+_TRAILING_PUNCT = '.,;:!?)]}»"\''
+
+# Хост ссылки (без схемы, учетных данных и порта)
+_HOST_RE = re.compile(r'^\s*(?:[a-z][a-z0-9+.-]*://)?(?:[^/@?#]*@)?([^/:?#\s]+)', re.IGNORECASE)
+
+# Домен -> платформа; поддомены (m., www., vm. ...) сводятся к родительскому домену
+HOST_PLATFORMS: Dict[str, str] = {
+    'instagram.com': 'instagram',
+    'instagr.am': 'instagram',
+    'vk.com': 'vk',
+    'vk.ru': 'vk',
+    'vkvideo.ru': 'vk',
+    'twitter.com': 'twitter',
+    'x.com': 'twitter',
+    'youtube.com': 'youtube',
+    'youtu.be': 'youtube',
+    'tiktok.com': 'tiktok',
+    'reddit.com': 'reddit',
+    'redd.it': 'reddit',
+    'dzen.ru': 'yandex_zen',
+    'zen.yandex.ru': 'yandex_zen',
+}
+
+# Правила определения типа контента: проверяются по порядку, первое совпадение выигрывает
+KIND_RULES: Dict[str, List[Tuple[str, Pattern]]] = {
+    'instagram': [
+        ('story', re.compile(r'/stories/')),
+        ('reel', re.compile(r'/reels?/')),
+        ('post', re.compile(r'/p/')),
+        ('video', re.compile(r'/tv/')),
+    ],
+    'vk': [
+        ('clip', re.compile(r'/clips?-?\d|vk\.com/clip|[?&]z=clip')),
+        ('video', re.compile(r'/video|video_ext\.php|[?&]z=video')),
+        ('wall', re.compile(r'wall-?\d')),
+    ],
+    'twitter': [
+        ('tweet', re.compile(r'/status(?:es)?/\d+')),
+    ],
+    'youtube': [
+        ('clip', re.compile(r'/shorts/')),
+        ('video', re.compile(r'[?&]v=|youtu\.be/[\w-]|/(?:embed|live)/')),
+        ('playlist', re.compile(r'/playlist|[?&]list=')),
+    ],
+    'tiktok': [('video', re.compile(r''))],
+    'reddit': [('video', re.compile(r''))],
+    'yandex_zen': [('video', re.compile(r''))],
+}
+
+
+# Обработчик ссылки по (платформа, тип); тип None - остальные типы платформы.
+# Платформы без записей скачиваются универсальным загрузчиком видео
+ROUTE_HANDLERS: Dict[Tuple[str, Optional[str]], str] = {
+    ('instagram', None): 'instagram',
+    ('vk', 'video'): 'vk_video',
+    ('vk', 'clip'): 'vk_video',
+    ('vk', 'wall'): 'vk_post',
+    ('vk', None): 'vk_hint',
+    ('twitter', None): 'twitter',
+}
+DEFAULT_HANDLER = 'video'
+
+
+def _platform_for_host(host: str) -> Optional[str]:
+    host = host.lower().rstrip('.')
+    while host:
+        platform = HOST_PLATFORMS.get(host)
+        if platform:
+            return platform
+        _, _, host = host.partition('.')
+    return None
+
+
+def classify_url(url: str) -> UrlRoute:
+    """Определяет платформу и тип контента по ссылке (один проход по таблице)"""
+    match = _HOST_RE.match(url)
+    platform = _platform_for_host(match.group(1)) if match else None
+    if platform is None:
+        return {'platform': None, 'kind': 'unknown', 'url': url}
+
+    for kind, pattern in KIND_RULES[platform]:
+        if pattern.search(url):
+            return {'platform': platform, 'kind': kind, 'url': url}
+    return {'platform': platform, 'kind': 'unknown', 'url': url}
+
+
+def handler_for(platform: Optional[str], kind: str) -> str:
+    """Имя обработчика для результата classify_url ('unsupported' - платформа не поддерживается)"""
+    if platform is None:
+        return 'unsupported'
+    handler = ROUTE_HANDLERS.get((platform, kind))
+    if handler is None:
+        handler = ROUTE_HANDLERS.get((platform, None), DEFAULT_HANDLER)
+    return handler
+
+
+def extract_urls(text: Optional[str], entities: Optional[Iterable[Any]] = None, limit: int = 10) -> List[str]:
+    """
+    Все ссылки сообщения в порядке появления, без повторов
+    :param text: Текст или подпись сообщения
+    :param entities: MessageEntity сообщения (url и text_link)
+    :param limit: Максимум ссылок
+    """
+    if not text:
+        return []
+
+    found: List[Tuple[int, str]] = []
+    for entity in entities or ():
+        if entity.type == 'url':
+            found.append((entity.offset, entity.extract_from(text)))
+        elif entity.type == 'text_link' and entity.url:
+            found.append((entity.offset, entity.url))
+    if not found:
+        found = [(m.start(), m.group(0).rstrip(_TRAILING_PUNCT)) for m in _URL_IN_TEXT_RE.finditer(text)]
+
+    urls: List[str] = []
+    for _, url in sorted(found, key=lambda item: item[0]):
+        if url not in urls:
+            urls.append(url)
+    return urls[:limit]
@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional
+
+from config import (
+    SCHEDULER_MAX_ACTIVE,
+    SCHEDULER_MAX_BACKLOG,
+    SCHEDULER_MAX_PER_USER,
+    SCHEDULER_MAX_QUEUED_PER_USER,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """Очередь переполнена - задача не принята"""
+
+
+class _Slot:
+    """Слот, занятый задачей; может быть возвращен до ее завершения"""
+
+    __slots__ = ('user_id', 'held')
+
+    def __init__(self, user_id: Hashable):
+        self.user_id = user_id
+        self.held = True
+
+
+# Слот текущей задачи (общий для ее дочерних задач)
+_slot: ContextVar[Optional[_Slot]] = ContextVar('scheduler_slot', default=None)
+
+
+class JobScheduler:
+    """
+    Очередь задач пользователей: общий и персональный лимит одновременных задач,
+    справедливая выдача слотов по кругу между пользователями и ограниченный backlog
+    """
+
+    def __init__(
+        self,
+        max_active: int = 6,
+        max_per_user: int = 2,
+        max_backlog: int = 100,
+        max_queued_per_user: int = 10
+    ):
+        self.max_active = max(1, max_active)
+        self.max_per_user = max(1, max_per_user)
+        self.max_backlog = max_backlog
+        self.max_queued_per_user = max_queued_per_user
+        self._active = 0
+        self._active_by_user: Dict[Hashable, int] = {}
+        # Порядок обхода пользователей (round-robin) и их ожидающие задачи
+        self._waiting: 'OrderedDict[Hashable, Deque[asyncio.Future]]' = OrderedDict()
+        self._queued = 0
+        self._completed = 0
+        self._rejected = 0
+        self._wait_count = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._recent_waits: Deque[float] = deque(maxlen=1000)
+
+    def _can_start(self, user_id: Hashable) -> bool:
+        return (
+            self._active < self.max_active
+            and self._active_by_user.get(user_id, 0) < self.max_per_user
+        )
+
+    def _acquire(self, user_id: Hashable):
+        self._active += 1
+        self._active_by_user[user_id] = self._active_by_user.get(user_id, 0) + 1
+
+    def _release(self, user_id: Hashable):
+        self._active -= 1
+        left = self._active_by_user.get(user_id, 1) - 1
+        if left:
+            self._active_by_user[user_id] = left
+        else:
+            self._active_by_user.pop(user_id, None)
+        self._completed += 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """Раздает свободные слоты ожидающим пользователям по кругу"""
+        progress = True
+        while progress and self._active < self.max_active:
+            progress = False
+            for user_id in list(self._waiting):
+                queue = self._waiting[user_id]
+                while queue and queue[0].done():  # отмененные ожидания
+                    queue.popleft()
+                    self._queued -= 1
+                if not queue:
+                    del self._waiting[user_id]
+                    continue
+                if not self._can_start(user_id):
+                    continue
+                future = queue.popleft()
+                self._queued -= 1
+                self._acquire(user_id)
+                future.set_result(None)
+                # Пользователь получил слот - уходит в конец круга
+                self._waiting.move_to_end(user_id)
+                if not queue:
+                    del self._waiting[user_id]
+                progress = True
+                break
+
+    def position(self, user_id: Hashable) -> int:
+        """
+        Примерная позиция последней задачи пользователя в очереди с учетом
+        выдачи слотов по кругу
+        """
+        own = len(self._waiting.get(user_id, ()))
+        if not own:
+            return 0
+        ahead = sum(
+            min(len(queue), own)
+            for other, queue in self._waiting.items()
+            if other != user_id
+        )
+        return ahead + own
+
+    def _record_wait(self, waited: float):
+        self._wait_count += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+        self._recent_waits.append(waited)
+
+    async def run(
+        self,
+        user_id: Hashable,
+        job: Callable[[], Awaitable[Any]],
+        on_queued: Optional[Callable[[int], Awaitable[Any]]] = None
+    ) -> Any:
+        """
+        Выполняет задачу, когда для пользователя освободится слот
+        :param user_id: Идентификатор пользователя (или чата)
+        :param job: Фабрика корутины с самой задачей
+        :param on_queued: Вызывается с позицией в очереди, если задача не стартовала сразу
+        :raises QueueFull: Если общий или персональный backlog заполнен
+        """
+        started = time.monotonic()
+        if not self._waiting and self._can_start(user_id):
+            self._acquire(user_id)
+        else:
+            user_queue = self._waiting.get(user_id)
+            if self._queued >= self.max_backlog or (
+                user_queue is not None and len(user_queue) >= self.max_queued_per_user
+            ):
+                self._rejected += 1
+                raise QueueFull()
+
+            future = asyncio.get_running_loop().create_future()
+            self._waiting.setdefault(user_id, deque()).append(future)
+            self._queued += 1
+            # Слот мог освободиться для этого пользователя прямо сейчас
+            self._dispatch()
+
+            if not future.done() and on_queued is not None:
+                try:
+                    await on_queued(self.position(user_id))
+                except Exception as e:
+                    logger.warning(f"Queue notification failed: {str(e)}")
+
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # Слот уже был выдан - возвращаем его
+                    self._release(user_id)
+                raise
+
+        self._record_wait(time.monotonic() - started)
+        slot = _Slot(user_id)
+        token = _slot.set(slot)
+        try:
+            return await job()
+        finally:
+            _slot.reset(token)
+            if slot.held:
+                self._release(user_id)
+
+    def release_current(self):
+        """
+        Досрочно возвращает слот текущей задачи: дальше она только ждет своей
+        очереди отправки и не должна держать слот, нужный предыдущим ссылкам
+        """
+        slot = _slot.get()
+        if slot is not None and slot.held:
+            slot.held = False
+            self._release(slot.user_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """Загрузка, очередь и время ожидания в очереди"""
+        waits = sorted(self._recent_waits)
+        return {
+            'active': self._active,
+            'max_active': self.max_active,
+            'queued': self._queued,
+            'users_waiting': len(self._waiting),
+            'completed': self._completed,
+            'rejected': self._rejected,
+            'wait_avg': self._wait_total / self._wait_count if self._wait_count else 0.0,
+            'wait_p95': waits[int(len(waits) * 0.95)] if waits else 0.0,
+            'wait_max': self._wait_max,
+        }
+
+
+job_scheduler = JobScheduler(
+    max_active=SCHEDULER_MAX_ACTIVE,
+    max_per_user=SCHEDULER_MAX_PER_USER,
+    max_backlog=SCHEDULER_MAX_BACKLOG,
+    max_queued_per_user=SCHEDULER_MAX_QUEUED_PER_USER
+)
@@ -1,85 +1,20 @@
-import os
 import asyncio
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import (TimeoutException, 
-                                      NoSuchElementException, 
-                                      WebDriverException)
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Optional, Tuple
 import logging
 import re
+import time
+from services.browser_pool import browser_pool
 
 logger = logging.getLogger(__name__)
 
 class TwitterParser:
     def __init__(self):
-        self.driver = None
         self.media_pattern = re.compile(r'https://pbs\.twimg\.com/media/[^\?]+')
 
-    async def _init_driver(self):
-        """Инициализация драйвера с ручным управлением"""
-        options = webdriver.ChromeOptions()
-        
-        # Обязательные параметры для работы под root
-        options.add_argument("--headless=new")
-        options.add_argument("--no-sandbox")
-        options.add_argument("--disable-dev-shm-usage")
-        
-        # Оптимальные настройки
-        options.add_argument("--window-size=1280,720")
-        options.add_argument("--disable-gpu")
-        options.add_argument("--disable-blink-features=AutomationControlled")
-        
-        # Указываем явные пути (проверьте актуальность!)
-        chrome_bin = "/usr/bin/google-chrome"
-        chromedriver_bin = "/usr/bin/chromedriver"
-        
-        # Проверка существования файлов
-        if not os.path.exists(chrome_bin):
-            raise FileNotFoundError(f"Chrome binary not found at {chrome_bin}")
-        if not os.path.exists(chromedriver_bin):
-            raise FileNotFoundError(f"ChromeDriver not found at {chromedriver_bin}")
-        
-        options.binary_location = chrome_bin
-        
-        try:
-            service = Service(
-                executable_path=chromedriver_bin,
-                service_args=['--verbose'],  # Для отладки
-            )
-            
-            self.driver = webdriver.Chrome(
-                service=service,
-                options=options,
-                service_log_path='/tmp/chromedriver.log'  # Логирование
-            )
-            
-            # Настройки времени ожидания
-            self.driver.set_page_load_timeout(30)
-            self.driver.set_script_timeout(20)
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"Driver init failed: {str(e)}")
-            if hasattr(self, 'driver'):
-                await self._close_driver()
-            raise
-
-    async def _close_driver(self):
-        """Корректное закрытие драйвера"""
-        if self.driver:
-            try:
-                self.driver.quit()
-            except Exception as e:
-                logger.error(f"Error closing driver: {str(e)}")
-            self.driver = None
-
-    async def _extract_media(self, container) -> dict:
+    def _extract_media(self, container) -> dict:
         """Надежное извлечение всех медиафайлов"""
         media = {"images": [], "videos": []}
         
@@ -126,28 +61,33 @@ class TwitterParser:
         media["videos"] = list(set(media["videos"]))
         
         return media
-    async def get_twitter_content(self, url: str) -> Tuple[Optional[Dict], Optional[str]]:
-        """Улучшенный метод получения контента с Twitter"""
-        if not await self._init_driver():
-            return None, "Не удалось инициализировать WebDriver"
 
-        try:
-            self.driver.get(url)
-            WebDriverWait(self.driver, 45).until(
-                EC.presence_of_element_located((By.XPATH, '//article'))
-            )
-            
-            # Дополнительная прокрутка и ожидание
-            for _ in range(3):
-                self.driver.execute_script("window.scrollBy(0, 300);")
-                await asyncio.sleep(1.5)
+    def _scrape(self, driver, url: str) -> Tuple[Optional[str], dict]:
+        """Загрузка страницы и извлечение текста и медиа (синхронно)"""
+        driver.get(url)
+        WebDriverWait(driver, 45).until(
+            EC.presence_of_element_located((By.XPATH, '//article'))
+        )
+
+        # Дополнительная прокрутка и ожидание
+        for _ in range(3):
+            driver.execute_script("window.scrollBy(0, 300);")
+            time.sleep(1.5)
 
-            # Получаем текст поста
-            text_elements = self.driver.find_elements(By.XPATH, '//div[@data-testid="tweetText"]')
-            text = "\n".join([el.text for el in text_elements if el.text]) or None
+        # Получаем текст поста
+        text_elements = driver.find_elements(By.XPATH, '//div[@data-testid="tweetText"]')
+        text = "\n".join([el.text for el in text_elements if el.text]) or None
 
-            # Получаем медиа
-            media = await self._extract_media()
+        # Получаем медиа
+        return text, self._extract_media(driver)
+
+    async def get_twitter_content(self, url: str) -> Tuple[Optional[Dict], Optional[str]]:
+        """Улучшенный метод получения контента с Twitter"""
+        try:
+            async with browser_pool.driver() as driver:
+                # Вызовы WebDriver блокирующие - выполняем в потоке, пока драйвер занят
+                loop = asyncio.get_running_loop()
+                text, media = await loop.run_in_executor(None, self._scrape, driver, url)
             
             # Определяем тип контента
             content_type = "text"
@@ -162,11 +102,12 @@ class TwitterParser:
                 'media': media
             }, None
 
+        except FileNotFoundError as e:
+            logger.error(f"Driver init failed: {str(e)}")
+            return None, "Не удалось инициализировать WebDriver"
         except Exception as e:
             logger.error(f"Twitter parsing error: {str(e)}", exc_info=True)
             return None, f"Ошибка парсинга Twitter: {str(e)}"
-        finally:
-            await self._close_driver()
 
 
 twitter_parser = TwitterParser()
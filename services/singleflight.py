@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from config import SINGLEFLIGHT_RESULT_TTL
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Реестр выполняющихся задач: одинаковые запросы не запускают работу повторно"""
+
+    def __init__(self):
+        self._flights: Dict[str, asyncio.Task] = {}
+        # Недавние результаты share(): ключ -> (время истечения, результат)
+        self._results: Dict[str, Tuple[float, Any]] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._flights
+
+    def _lead(self, key: str, factory: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        task = asyncio.ensure_future(factory())
+        self._flights[key] = task
+        self.leaders += 1
+        task.add_done_callback(lambda _: self._flights.pop(key, None))
+        return task
+
+    def _remember(self, key: str, task: asyncio.Task, ttl: float):
+        if not task.cancelled() and task.exception() is None and task.result() is not None:
+            self._results[key] = (time.monotonic() + ttl, task.result())
+
+    def _recent(self, key: str) -> Optional[Any]:
+        now = time.monotonic()
+        for stale in [k for k, (expires, _) in self._results.items() if expires <= now]:
+            del self._results[stale]
+        entry = self._results.get(key)
+        return entry[1] if entry else None
+
+    async def share(
+        self,
+        key: str,
+        factory: Callable[[], Awaitable[Any]],
+        ttl: float = SINGLEFLIGHT_RESULT_TTL
+    ) -> Any:
+        """
+        Выполняет factory один раз на все одновременные вызовы с тем же ключом;
+        все вызывающие получают один и тот же результат (или исключение).
+        Успешный результат еще ttl секунд отдается запросам, пришедшим сразу после
+        """
+        recent = self._recent(key)
+        if recent is not None:
+            self.followers += 1
+            return recent
+
+        task = self._flights.get(key)
+        if task is None:
+            task = self._lead(key, factory)
+            if ttl > 0:
+                task.add_done_callback(lambda t: self._remember(key, t, ttl))
+        else:
+            self.followers += 1
+            logger.info(f"Joined in-flight job: {key}")
+        # shield: отмена одного ожидающего не отменяет работу для остальных
+        return await asyncio.shield(task)
+
+    async def follow(
+        self,
+        key: str,
+        factory: Callable[[], Awaitable[Any]],
+        on_wait: Optional[Callable[[], Awaitable[Any]]] = None
+    ) -> Any:
+        """
+        Если задача с тем же ключом уже выполняется, дожидается ее завершения и только
+        потом запускает factory (которая к этому моменту найдет результат в кэше file_id).
+        Ожидавшие снова проходят через реестр: повторный запуск (промах кэша, ошибка
+        ведущей задачи) выполняет только один из них, остальные ждут его.
+        Если задачи нет, сама становится ведущей
+        """
+        waited = False
+        while True:
+            task = self._flights.get(key)
+            if task is None:
+                return await asyncio.shield(self._lead(key, factory))
+
+            if not waited:
+                waited = True
+                self.followers += 1
+                logger.info(f"Waiting for in-flight job: {key}")
+                if on_wait is not None:
+                    try:
+                        await on_wait()
+                    except Exception as e:
+                        logger.warning(f"In-flight notification failed: {str(e)}")
+            # Ошибка ведущей задачи уже показана ее пользователю - здесь просто пробуем сами
+            await asyncio.gather(asyncio.shield(task), return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'in_flight': len(self._flights),
+            'recent_results': len(self._results),
+            'leaders': self.leaders,
+            'followers': self.followers,
+        }
+
+
+inflight = SingleFlight()
@@ -0,0 +1,246 @@
+import asyncio
+import functools
+import itertools
+import json
+import logging
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+from config import LOG_FORMAT, TRACE_EXPORT_URL, TRACE_MAX_SPANS, TRACE_SLOW_REQUEST
+
+logger = logging.getLogger('trace')
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s"
+
+_span_ids = itertools.count(1)
+
+
+class Span:
+    """Участок работы внутри запроса: имя, родитель, длительность и атрибуты"""
+
+    __slots__ = ('name', 'span_id', 'parent_id', 'start', 'duration', 'attributes', 'error')
+
+    def __init__(self, name: str, parent_id: Optional[int], attributes: Dict[str, Any]):
+        self.name = name
+        self.span_id = next(_span_ids)
+        self.parent_id = parent_id
+        self.start = time.time()
+        self.duration: Optional[float] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start': round(self.start, 6),
+            'duration_ms': round((self.duration or 0) * 1000, 3),
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+
+class Trace:
+    """Все завершенные участки одного запроса (общий объект для его дочерних задач)"""
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.spans: List[Span] = []
+        self.dropped = 0
+
+    def add(self, span: Span):
+        if len(self.spans) < TRACE_MAX_SPANS:
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+
+    def breakdown(self) -> Dict[str, float]:
+        """Суммарное время по именам участков (мс)"""
+        totals: Dict[str, float] = {}
+        for span in self.spans:
+            totals[span.name] = totals.get(span.name, 0.0) + (span.duration or 0) * 1000
+        return {name: round(ms, 1) for name, ms in sorted(totals.items(), key=lambda item: -item[1])}
+
+
+_trace: ContextVar[Optional[Trace]] = ContextVar('trace', default=None)
+_span: ContextVar[Optional[Span]] = ContextVar('trace_span', default=None)
+
+
+def current_request_id() -> str:
+    trace = _trace.get()
+    return trace.request_id if trace else '-'
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Участок трассировки; вложенные участки (в том числе в дочерних задачах)
+    получают его как родителя. Вне запроса ничего не записывает
+    """
+    trace = _trace.get()
+    if trace is None:
+        yield None
+        return
+
+    parent = _span.get()
+    current = Span(name, parent.span_id if parent else None, attributes)
+    token = _span.set(current)
+    started = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.duration = time.perf_counter() - started
+        _span.reset(token)
+        trace.add(current)
+        logger.debug(
+            f"span {name} {current.duration * 1000:.1f}ms",
+            extra={'span': current.as_dict()}
+        )
+
+
+def traced(name: Optional[str] = None):
+    """Декоратор: вызов функции (обычной или async) записывается как участок"""
+
+    def decorator(func: Callable):
+        span_name = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__qualname__}"
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def request_trace(name: str, request_id: Optional[str] = None, **attributes):
+    """
+    Корневой участок запроса с новым request id. По завершении пишет в лог
+    разбивку времени по участкам; медленные запросы - со всем деревом участков
+    """
+    trace = Trace(request_id or uuid.uuid4().hex[:12])
+    trace_token = _trace.set(trace)
+    try:
+        with span(name, **attributes) as root:
+            yield trace
+    finally:
+        _finish(trace, root)
+        _trace.reset(trace_token)
+
+
+def _finish(trace: Trace, root: Span):
+    summary = {
+        'request_id': trace.request_id,
+        'duration_ms': round((root.duration or 0) * 1000, 1),
+        'error': root.error,
+        'breakdown_ms': trace.breakdown(),
+        'dropped_spans': trace.dropped,
+    }
+    if root.duration and root.duration >= TRACE_SLOW_REQUEST:
+        summary['spans'] = [s.as_dict() for s in trace.spans]
+        logger.warning(f"Slow request {root.name} {summary['duration_ms']:.0f}ms", extra={'trace': summary})
+    else:
+        logger.info(f"Request {root.name} {summary['duration_ms']:.0f}ms", extra={'trace': summary})
+    if TRACE_EXPORT_URL:
+        exporter.submit(trace)
+
+
+class SpanExporter:
+    """Отправляет завершенные запросы пачками в локальный коллектор (POST JSON)"""
+
+    def __init__(self, url: str, batch_size: int = 50, interval: float = 5.0):
+        self.url = url
+        self.batch_size = batch_size
+        self.interval = interval
+        self._pending: List[Dict[str, Any]] = []
+        self._task: Optional[asyncio.Task] = None
+        self.exported = 0
+        self.failed = 0
+
+    def submit(self, trace: Trace):
+        self._pending.append({
+            'request_id': trace.request_id,
+            'spans': [s.as_dict() for s in trace.spans],
+        })
+        if len(self._pending) > self.batch_size * 20:
+            # Коллектор недоступен - не копим бесконечно
+            del self._pending[:self.batch_size]
+            self.failed += self.batch_size
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.interval)
+        await self.flush()
+
+    async def flush(self):
+        from services.http_client import http_client
+
+        while self._pending:
+            batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+            try:
+                async with http_client.session.post(self.url, json={'traces': batch}) as response:
+                    if response.status >= 400:
+                        raise ValueError(f"HTTP {response.status}")
+                self.exported += len(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                logger.debug(f"Trace export failed: {str(e)}")
+                return
+
+
+exporter = SpanExporter(TRACE_EXPORT_URL)
+
+
+class RequestContextFilter(logging.Filter):
+    """Добавляет request id текущей задачи в каждую запись лога"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = current_request_id()
+        current = _span.get()
+        record.span_name = current.name if current else None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись лога - одна строка JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': round(record.created, 6),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'request_id': getattr(record, 'request_id', '-'),
+            'span': getattr(record, 'span_name', None),
+        }
+        for key in ('trace', 'span'):
+            value = getattr(record, key, None)
+            if isinstance(value, dict):
+                entry[f"{key}_data"] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging(log_format: str = LOG_FORMAT):
+    """Подключает request id (и JSON, если LOG_FORMAT=json) ко всем обработчикам корневого логгера"""
+    formatter = JsonFormatter() if log_format == 'json' else logging.Formatter(TEXT_FORMAT)
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(RequestContextFilter())
+        handler.setFormatter(formatter)
@@ -1,82 +1,21 @@
-import os
 import re
 import asyncio
 import logging
+import time
 from functools import lru_cache
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.service import Service
 from typing import Dict, Optional, Tuple
-import aiohttp
 from bs4 import BeautifulSoup
+from services.browser_pool import browser_pool
+from services.http_client import http_client
 
 logger = logging.getLogger(__name__)
 
 class TwitterService:
     def __init__(self):
         self.media_pattern = re.compile(r'https://pbs\.twimg\.com/media/[^\?]+')
-        self.driver = None
-
-    async def _init_driver(self):
-        """Инициализация драйвера с ручным управлением"""
-        options = webdriver.ChromeOptions()
-        
-        # Обязательные параметры для работы под root
-        options.add_argument("--headless=new")
-        options.add_argument("--no-sandbox")
-        options.add_argument("--disable-dev-shm-usage")
-        
-        # Оптимальные настройки
-        options.add_argument("--window-size=1280,720")
-        options.add_argument("--disable-gpu")
-        options.add_argument("--disable-blink-features=AutomationControlled")
-        
-        # Указываем явные пути (проверьте актуальность!)
-        chrome_bin = "/usr/bin/google-chrome"
-        chromedriver_bin = "/usr/bin/chromedriver"
-        
-        # Проверка существования файлов
-        if not os.path.exists(chrome_bin):
-            raise FileNotFoundError(f"Chrome binary not found at {chrome_bin}")
-        if not os.path.exists(chromedriver_bin):
-            raise FileNotFoundError(f"ChromeDriver not found at {chromedriver_bin}")
-        
-        options.binary_location = chrome_bin
-        
-        try:
-            service = Service(
-                executable_path=chromedriver_bin,
-                service_args=['--verbose'],  # Для отладки
-            )
-            
-            self.driver = webdriver.Chrome(
-                service=service,
-                options=options,
-                service_log_path='/tmp/chromedriver.log'  # Логирование
-            )
-            
-            # Настройки времени ожидания
-            self.driver.set_page_load_timeout(30)
-            self.driver.set_script_timeout(20)
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"Driver init failed: {str(e)}")
-            if hasattr(self, 'driver'):
-                await self._close_driver()
-            raise
-
-    async def _close_driver(self):
-        """Корректное закрытие драйвера"""
-        if self.driver:
-            try:
-                self.driver.quit()
-            except Exception as e:
-                logger.error(f"Error closing driver: {str(e)}")
-            self.driver = None
 
     @lru_cache(maxsize=100)
     def normalize_image_url(self, url: str) -> str:
@@ -96,15 +35,14 @@ class TwitterService:
                 return nitter_data['data'], None
 
             # Если Nitter не сработал, используем Selenium
-            if not await self._init_driver():
-                return None, "Failed to initialize browser"
-
-            return await self._parse_with_selenium(url)
+            async with browser_pool.driver() as driver:
+                return await self._parse_with_selenium(driver, url)
+        except FileNotFoundError as e:
+            logger.error(f"Driver init failed: {str(e)}")
+            return None, "Failed to initialize browser"
         except Exception as e:
             logger.error(f"Twitter error: {str(e)}", exc_info=True)
             return None, str(e)
-        finally:
-            await self._close_driver()
 
     async def _try_nitter(self, url: str) -> Dict:
         """Попытка получить данные через Nitter"""
@@ -112,51 +50,39 @@ class TwitterService:
             nitter_url = url.replace('twitter.com', 'nitter.net').replace('x.com', 'nitter.net')
             headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'}
             
-            async with aiohttp.ClientSession(headers=headers) as session:
-                async with session.get(nitter_url, timeout=10) as resp:
-                    soup = BeautifulSoup(await resp.text(), 'html.parser')
-                    
-                    tweet_text = ""
-                    if content_div := soup.find('div', class_='tweet-content'):
-                        tweet_text = content_div.get_text('\n').strip()
-                    
-                    images = []
-                    if gallery := soup.find('div', class_='attachments'):
-                        images = [
-                            f'https://nitter.net{img["src"]}' 
-                            for img in gallery.find_all('img') 
-                            if img.get('src')
-                        ]
-                    
-                    return {
-                        'success': bool(tweet_text or images),
-                        'data': {
-                            'text': tweet_text,
-                            'images': [self.normalize_image_url(img) for img in images[:4]],
-                            'videos': []
-                        }
+            async with http_client.session.get(nitter_url, headers=headers, timeout=10) as resp:
+                soup = BeautifulSoup(await resp.text(), 'html.parser')
+                
+                tweet_text = ""
+                if content_div := soup.find('div', class_='tweet-content'):
+                    tweet_text = content_div.get_text('\n').strip()
+                
+                images = []
+                if gallery := soup.find('div', class_='attachments'):
+                    images = [
+                        f'https://nitter.net{img["src"]}' 
+                        for img in gallery.find_all('img') 
+                        if img.get('src')
+                    ]
+                
+                return {
+                    'success': bool(tweet_text or images),
+                    'data': {
+                        'text': tweet_text,
+                        'images': [self.normalize_image_url(img) for img in images[:4]],
+                        'videos': []
                     }
+                }
         except Exception:
             return {'success': False}
 
-    async def _parse_with_selenium(self, url: str) -> Tuple[Optional[Dict], Optional[str]]:
+    async def _parse_with_selenium(self, driver, url: str) -> Tuple[Optional[Dict], Optional[str]]:
         """Парсинг через Selenium"""
         try:
-            self.driver.get(url)
-            WebDriverWait(self.driver, 30).until(
-                EC.presence_of_element_located((By.XPATH, '//article')))
-            
-            # Дополнительная прокрутка
-            self.driver.execute_script("window.scrollBy(0, 500);")
-            await asyncio.sleep(2)
+            # Вызовы WebDriver блокирующие - выполняем в потоке, пока драйвер занят
+            loop = asyncio.get_running_loop()
+            text, media = await loop.run_in_executor(None, self._scrape, driver, url)
 
-            # Получаем текст
-            text_elements = self.driver.find_elements(By.XPATH, '//div[@data-testid="tweetText"]')
-            text = "\n".join([el.text for el in text_elements if el.text]) or None
-
-            # Получаем медиа
-            media = await self._extract_media()
-            
             return {
                 'text': text,
                 'type': 'video' if media['videos'] else 'photo' if media['images'] else 'text',
@@ -165,18 +91,35 @@ class TwitterService:
         except Exception as e:
             return None, f"Selenium parsing error: {str(e)}"
 
-    async def _extract_media(self) -> Dict:
+    def _scrape(self, driver, url: str) -> Tuple[Optional[str], Dict]:
+        """Загрузка страницы и извлечение текста и медиа (синхронно)"""
+        driver.get(url)
+        WebDriverWait(driver, 30).until(
+            EC.presence_of_element_located((By.XPATH, '//article')))
+
+        # Дополнительная прокрутка
+        driver.execute_script("window.scrollBy(0, 500);")
+        time.sleep(2)
+
+        # Получаем текст
+        text_elements = driver.find_elements(By.XPATH, '//div[@data-testid="tweetText"]')
+        text = "\n".join([el.text for el in text_elements if el.text]) or None
+
+        # Получаем медиа
+        return text, self._extract_media(driver)
+
+    def _extract_media(self, driver) -> Dict:
         """Извлечение медиа"""
         media = {'images': [], 'videos': []}
         
         # Изображения
-        img_elements = self.driver.find_elements(By.XPATH, '//img[contains(@src, "twimg.com")]')
+        img_elements = driver.find_elements(By.XPATH, '//img[contains(@src, "twimg.com")]')
         for img in img_elements:
             if src := img.get_attribute('src'):
                 media['images'].append(self.normalize_image_url(src))
         
         # Видео
-        video_elements = self.driver.find_elements(By.XPATH, '//video | //div[@data-testid="videoPlayer"]')
+        video_elements = driver.find_elements(By.XPATH, '//video | //div[@data-testid="videoPlayer"]')
         for video in video_elements:
             if src := video.get_attribute('src') or video.get_attribute('data-video-url'):
                 media['videos'].append(src.split('?')[0])
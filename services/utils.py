@@ -1,26 +1,26 @@
-from asyncio import subprocess
 import os
-import asyncio
-from datetime import datetime
 from functools import lru_cache
-import re
 from typing import Optional, List
-import aiohttp
 import logging
-import ffmpeg
-from config import DOWNLOAD_DIR
+from services.http_client import http_client
+from services.probe import probe_media
+from services.encoder import encode_for_telegram
+from services.disk_quota import disk_manager
+from services.workdir import current_workdir
+from services.media_buffer import FetchedMedia, image_memory
+from services.metrics import count_download, stage
+from services.tracing import traced
+from config import INMEMORY_MEDIA_MAX_BYTES, MAX_FILE_SIZE, MEDIA_READ_CHUNK_SIZE
 
 logger = logging.getLogger(__name__)
 
-def clean_downloads():
-    """Очищает директорию загрузок с обработкой ошибок"""
-    for filename in os.listdir(DOWNLOAD_DIR):
-        try:
-            file_path = os.path.join(DOWNLOAD_DIR, filename)
-            if os.path.isfile(file_path):
-                os.unlink(file_path)
-        except Exception as e:
-            logger.error(f"Ошибка удаления файла {filename}: {str(e)}")
+def clean_downloads() -> int:
+    """
+    Очищает директорию загрузок: кэш сегментов и брошенные файлы.
+    Файлы выполняющихся задач не трогаются (см. disk_quota)
+    """
+    disk_manager.sweep()
+    return disk_manager.evict(disk_manager.usage())
 
 @lru_cache(maxsize=100)
 def normalize_twitter_url(url: str) -> Optional[str]:
@@ -32,95 +32,115 @@ def normalize_twitter_url(url: str) -> Optional[str]:
     return f"{base}?name=orig"
 
 async def get_video_duration(filepath: str) -> float:
-    """Асинхронно получает длительность видео в секундах"""
-    cmd = [
-        'ffprobe',
-        '-v', 'error',
-        '-show_entries', 'format=duration',
-        '-of', 'default=noprint_wrappers=1:nokey=1',
-        filepath
-    ]
-    
-    proc = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE
-    )
-    
-    stdout, _ = await proc.communicate()
-    
-    if proc.returncode != 0:
+    """Асинхронно получает длительность видео в секундах (из метаданных контейнера)"""
+    probe = await probe_media(filepath)
+    if not probe:
         raise ValueError("Не удалось определить длительность видео")
-    
-    try:
-        return float(stdout.decode().strip())
-    except (ValueError, AttributeError) as e:
-        raise ValueError(f"Некорректная длительность видео: {str(e)}")
+    if probe['duration'] <= 0:
+        raise ValueError(f"Некорректная длительность видео: {probe['duration']}")
+    return probe['duration']
 
 async def compress_video(input_path: str, output_path: str, target_size_mb: int = 45) -> bool:
-    """Улучшенное сжатие с контролем качества"""
+    """Сжатие под лимит размера; True только если результат поместился в target_size_mb"""
     try:
-        # Рассчитываем битрейт (в кбит/с)
-        duration = await get_video_duration(input_path)
-        target_bitrate = int((target_size_mb * 8192) / duration)  # 8*1024
-        
-        cmd = [
-            'ffmpeg',
-            '-i', input_path,
-            '-c:v', 'libx264',
-            '-preset', 'fast',
-            '-crf', '23',
-            '-maxrate', f'{target_bitrate}k',
-            '-bufsize', f'{target_bitrate * 2}k',
-            '-vf', 'scale=-2:720',  # 720p
-            '-c:a', 'aac',
-            '-b:a', '128k',
-            '-movflags', '+faststart',
-            '-y',
-            output_path
-        ]
-        # Запуск процесса
-        proc = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
+        with stage('encode'):
+            result = await encode_for_telegram(input_path, output_path, target_size_mb, require_output=True)
+        return result['success']
+    except Exception as e:
+        logger.error(f"Compression failed: {str(e)}", exc_info=True)
+        return False
 
-        # Ждем завершения
-        _, stderr = await proc.communicate()
+# Лимит отправки: файлы до MAX_FILE_SIZE уходят как есть, больше - сжимаются до него
+SEND_LIMIT_MB = MAX_FILE_SIZE / (1024 * 1024)
 
-        if proc.returncode != 0:
-            logger.error(f"FFmpeg error: {stderr.decode()}")
-            return False
+@traced()
+async def prepare_video(input_path: str, target_size_mb: float = SEND_LIMIT_MB, keep_original: bool = False) -> Optional[str]:
+    """
+    Готовит видео к отправке в Telegram самым дешевым способом (см. encoder.plan_encode)
+    :param input_path: Путь к скачанному видео
+    :param target_size_mb: Лимит размера
+    :param keep_original: Не удалять исходный файл, если создан новый
+    :return: Путь к файлу для отправки (может совпадать с исходным) или None
+    """
+    output_path = f"{os.path.splitext(input_path)[0]}_compressed.mp4"
+    try:
+        with stage('encode'):
+            result = await encode_for_telegram(input_path, output_path, target_size_mb)
+    except Exception as e:
+        logger.error(f"Video preparation failed: {str(e)}", exc_info=True)
+        return None
 
-        return os.path.exists(output_path)
+    if not result['success']:
+        return None
+    if result['output_path'] != input_path and not keep_original and os.path.exists(input_path):
+        os.remove(input_path)
+    return result['output_path']
 
-    except Exception as e:
-        logger.error(f"Compression failed: {str(e)}", exc_info=True)
-        return False
+async def _read_media(response, filename: str, allow_memory: bool = True) -> FetchedMedia:
+    """
+    Читает тело ответа: файлы до INMEMORY_MEDIA_MAX_BYTES остаются в памяти
+    (если хватает общего бюджета), остальные пишутся в папку задачи
+    """
+    length = response.content_length
+    reserve = 0
+    if allow_memory and (length is None or length <= INMEMORY_MEDIA_MAX_BYTES):
+        # Без Content-Length резервируем максимум и возвращаем лишнее после чтения
+        reserve = length if length is not None else INMEMORY_MEDIA_MAX_BYTES
 
-async def download_image(url: str, filename: str) -> str:
-    """Скачивание с проверкой MIME-типа"""
+    head: List[bytes] = []
+    if reserve and image_memory.try_acquire(reserve):
+        received = 0
+        try:
+            async for chunk in response.content.iter_chunked(MEDIA_READ_CHUNK_SIZE):
+                head.append(chunk)
+                received += len(chunk)
+                if received > reserve:
+                    break
+        except BaseException:
+            # Таймаут, обрыв или отмена - резерв иначе пропал бы из бюджета навсегда
+            image_memory.release(reserve)
+            raise
+        if received <= reserve:
+            image_memory.release(reserve - received)
+            count_download(received)
+            return FetchedMedia(filename, data=b''.join(head), reserved=received)
+        # Файл оказался больше ожидаемого - дописываем его на диск
+        image_memory.release(reserve)
+
+    path = os.path.join(current_workdir(), filename)
+    with open(path, 'wb') as f:
+        for chunk in head:
+            f.write(chunk)
+        async for chunk in response.content.iter_chunked(MEDIA_READ_CHUNK_SIZE):
+            f.write(chunk)
+    count_download(os.path.getsize(path))
+    return FetchedMedia(filename, path=path)
+
+@traced()
+async def fetch_image(url: str, filename: str, allow_memory: bool = True) -> FetchedMedia:
+    """
+    Скачивание изображения с проверкой MIME-типа
+    :return: FetchedMedia (в памяти или на диске); после отправки вызвать release()
+    """
     if not url.lower().endswith(('.jpg', '.jpeg', '.png')):
         raise ValueError("Неподдерживаемый формат изображения")
-    
-    path = os.path.join(DOWNLOAD_DIR, filename)
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
+
+    with stage('download'):
+        async with http_client.session.get(url, timeout=http_client.media_timeout) as response:
             if response.status != 200:
                 raise ValueError(f"HTTP Status: {response.status}")
             content_type = response.headers.get('Content-Type', '')
             if 'image' not in content_type:
                 raise ValueError(f"Неизвестный Content-Type: {content_type}")
-            with open(path, 'wb') as f:
-                async for chunk in response.content.iter_chunked(1024):
-                    f.write(chunk)
-    return path
+            return await _read_media(response, filename, allow_memory)
+
+async def download_image(url: str, filename: str) -> str:
+    """Скачивание изображения на диск (для кода, которому нужен путь к файлу)"""
+    media = await fetch_image(url, filename, allow_memory=False)
+    return media.path
 
 async def download_twitter_image(url: str, filename: str) -> str:
     """Улучшенная загрузка Twitter изображений с обходом ограничений"""
-    path = os.path.join(DOWNLOAD_DIR, filename)
-    
     # Пробуем разные варианты URL
     variants = [
         url.replace("pbs.twimg.com/media", "pbs.twimg.com/media"),
@@ -137,18 +157,16 @@ async def download_twitter_image(url: str, filename: str) -> str:
         'Accept-Language': 'en-US,en;q=0.9',
     }
     
-    async with aiohttp.ClientSession(headers=headers) as session:
-        for attempt, img_url in enumerate(variants, 1):
-            try:
-                async with session.get(img_url, timeout=10) as response:
-                    if response.status == 200:
-                        with open(path, 'wb') as f:
-                            async for chunk in response.content.iter_chunked(1024):
-                                f.write(chunk)
-                        return path
-                    logger.warning(f"Attempt {attempt}: Status {response.status} for {img_url}")
-            except Exception as e:
-                logger.warning(f"Attempt {attempt} failed: {str(e)}")
-                continue
-                
-        raise ValueError(f"Не удалось загрузить изображение после {len(variants)} попыток")
+    session = http_client.session
+    for attempt, img_url in enumerate(variants, 1):
+        try:
+            async with session.get(img_url, headers=headers, timeout=http_client.media_timeout) as response:
+                if response.status == 200:
+                    media = await _read_media(response, filename, allow_memory=False)
+                    return media.path
+                logger.warning(f"Attempt {attempt}: Status {response.status} for {img_url}")
+        except Exception as e:
+            logger.warning(f"Attempt {attempt} failed: {str(e)}")
+            continue
+            
+    raise ValueError(f"Не удалось загрузить изображение после {len(variants)} попыток")
@@ -1,7 +1,7 @@
 import re
-import aiohttp
 from typing import Dict, List
 from config import VK_ACCESS_TOKEN, VK_API_VERSION
+from services.http_client import http_client
 import logging
 
 # Настройка логгирования
@@ -33,24 +33,23 @@ async def get_vk_post(url: str) -> Dict[str, List[str]]:
         'extended': 1,
     }
     
-    async with aiohttp.ClientSession() as session:
-        async with session.get('https://api.vk.com/method/wall.getById', params=params) as resp:
-            data = await resp.json()
-            
-            if 'error' in data:
-                raise ValueError(f"VK API error: {data['error']['error_msg']}")
-            
-            post = data['response']['items'][0]
-            result = {
-                'text': post.get('text', ''),
-                'images': []
-            }
-            
-            for attachment in post.get('attachments', []):
-                if attachment['type'] == 'photo':
-                    sizes = attachment['photo'].get('sizes', [])
-                    if sizes:
-                        max_size = max(sizes, key=lambda x: x.get('width', 0))
-                        result['images'].append(max_size['url'])
-            
-            return result
\ No newline at end of file
+    async with http_client.session.get('https://api.vk.com/method/wall.getById', params=params) as resp:
+        data = await resp.json()
+        
+        if 'error' in data:
+            raise ValueError(f"VK API error: {data['error']['error_msg']}")
+        
+        post = data['response']['items'][0]
+        result = {
+            'text': post.get('text', ''),
+            'images': []
+        }
+        
+        for attachment in post.get('attachments', []):
+            if attachment['type'] == 'photo':
+                sizes = attachment['photo'].get('sizes', [])
+                if sizes:
+                    max_size = max(sizes, key=lambda x: x.get('width', 0))
+                    result['images'].append(max_size['url'])
+        
+        return result
\ No newline at end of file
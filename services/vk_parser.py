@@ -1,7 +1,9 @@
 import json
 import os
 import re
-import aiohttp
+from services.http_client import http_client
+from services.router import classify_url
+from services.tracing import traced
 import logging
 from typing import Optional, Dict
 from urllib.parse import unquote
@@ -17,17 +19,23 @@ class VKParser:
             'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7'
         }
 
-    async def parse_vk_url(self, url: str) -> Optional[Dict]:
-        """Универсальный парсер для всех типов контента VK"""
+    @traced()
+    async def parse_vk_url(self, url: str, kind: Optional[str] = None) -> Optional[Dict]:
+        """
+        Универсальный парсер для всех типов контента VK
+        :param kind: Тип контента из classify_url, если ссылка уже разобрана роутером
+        """
         try:
+            if kind is None:
+                kind = classify_url(url)['kind']
             # Нормализация URL
             url = self._normalize_url(url)
             
-            if self._is_clip(url):
+            if kind == 'clip':
                 return await self._parse_clip(url)
-            elif self._is_video(url):
+            elif kind == 'video':
                 return await self._parse_video(url)
-            elif self._is_wall_post(url):
+            elif kind == 'wall':
                 return await self._parse_wall_post(url)
                 
             raise ValueError("Неподдерживаемый тип ссылки VK")
@@ -41,15 +49,6 @@ class VKParser:
             return url.replace('vkvideo.ru', 'vk.com/video')
         return url
 
-    def _is_clip(self, url: str) -> bool:
-        return any(p in url for p in ['/clip-', 'vk.com/clip'])
-
-    def _is_video(self, url: str) -> bool:
-        return any(p in url for p in ['/video-', 'vk.com/video', 'video_ext.php'])
-
-    def _is_wall_post(self, url: str) -> bool:
-        return any(p in url for p in ['/wall', 'w=wall'])
-
     async def _parse_clip(self, url: str) -> Dict:
         """Парсинг клипов VK"""
         clip_id = self._extract_id(url, is_clip=True)
@@ -107,21 +106,20 @@ class VKParser:
         }
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get('https://api.vk.com/method/video.get', params=params) as resp:
-                    data = await resp.json()
-                    if 'error' in data:
-                        logger.warning(f"API error: {data['error']}")
-                        return None
-                    
-                    item = data['response']['items'][0]
-                    return {
-                        'type': 'video',
-                        'url': item.get('player'),
-                        'title': item.get('title'),
-                        'duration': item.get('duration'),
-                        'thumb': max(item.get('image', []), key=lambda x: x.get('width', 0))['url'] if item.get('image') else None
-                    }
+            async with http_client.session.get('https://api.vk.com/method/video.get', params=params) as resp:
+                data = await resp.json()
+                if 'error' in data:
+                    logger.warning(f"API error: {data['error']}")
+                    return None
+                
+                item = data['response']['items'][0]
+                return {
+                    'type': 'video',
+                    'url': item.get('player'),
+                    'title': item.get('title'),
+                    'duration': item.get('duration'),
+                    'thumb': max(item.get('image', []), key=lambda x: x.get('width', 0))['url'] if item.get('image') else None
+                }
         except Exception as e:
             logger.error(f"API request failed: {str(e)}")
             return None
@@ -129,31 +127,30 @@ class VKParser:
     async def _parse_via_html(self, url: str, is_clip: bool = False) -> Dict:
         """Парсинг через HTML страницу"""
         try:
-            async with aiohttp.ClientSession(headers=self.headers) as session:
-                async with session.get(url) as resp:
-                    html = await resp.text()
-                    
-                    # Ищем JSON с данными
-                    json_match = re.search(r'var\s+videoPlayer\s*=\s*({.+?});', html)
-                    if json_match:
-                        data = json.loads(unquote(json_match.group(1)))
-                        return {
-                            'type': 'video',
-                            'url': data.get('url'),
-                            'title': 'Клип VK' if is_clip else 'Видео VK',
-                            'thumb': data.get('poster')
-                        }
-                    
-                    # Альтернативный поиск
-                    url_match = re.search(r'"url":"(https:\\/\\/[^"]+\.mp4)', html)
-                    if url_match:
-                        return {
-                            'type': 'video',
-                            'url': url_match.group(1).replace('\\/', '/'),
-                            'title': 'Клип VK' if is_clip else 'Видео VK'
-                        }
-                    
-                    raise ValueError("Не найдены данные видео")
+            async with http_client.session.get(url, headers=self.headers) as resp:
+                html = await resp.text()
+                
+                # Ищем JSON с данными
+                json_match = re.search(r'var\s+videoPlayer\s*=\s*({.+?});', html)
+                if json_match:
+                    data = json.loads(unquote(json_match.group(1)))
+                    return {
+                        'type': 'video',
+                        'url': data.get('url'),
+                        'title': 'Клип VK' if is_clip else 'Видео VK',
+                        'thumb': data.get('poster')
+                    }
+                
+                # Альтернативный поиск
+                url_match = re.search(r'"url":"(https:\\/\\/[^"]+\.mp4)', html)
+                if url_match:
+                    return {
+                        'type': 'video',
+                        'url': url_match.group(1).replace('\\/', '/'),
+                        'title': 'Клип VK' if is_clip else 'Видео VK'
+                    }
+                
+                raise ValueError("Не найдены данные видео")
         except Exception as e:
             logger.error(f"HTML parsing failed: {str(e)}")
             raise ValueError("Не удалось обработать страницу")
@@ -172,36 +169,35 @@ class VKParser:
         }
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get('https://api.vk.com/method/wall.getById', params=params) as resp:
-                    data = await resp.json()
-                    if 'error' in data:
-                        logger.warning(f"API error: {data['error']}")
-                        raise ValueError(data['error']['error_msg'])
-                    
-                    post = data['response']['items'][0]
-                    attachments = []
-                    
-                    for attach in post.get('attachments', []):
-                        if attach['type'] == 'photo':
-                            sizes = attach['photo'].get('sizes', [])
-                            if sizes:
-                                attachments.append({
-                                    'type': 'photo',
-                                    'url': max(sizes, key=lambda x: x.get('width', 0))['url']
-                                })
-                        elif attach['type'] == 'video':
+            async with http_client.session.get('https://api.vk.com/method/wall.getById', params=params) as resp:
+                data = await resp.json()
+                if 'error' in data:
+                    logger.warning(f"API error: {data['error']}")
+                    raise ValueError(data['error']['error_msg'])
+                
+                post = data['response']['items'][0]
+                attachments = []
+                
+                for attach in post.get('attachments', []):
+                    if attach['type'] == 'photo':
+                        sizes = attach['photo'].get('sizes', [])
+                        if sizes:
                             attachments.append({
-                                'type': 'video',
-                                'url': f"https://vk.com/video{attach['video']['owner_id']}_{attach['video']['id']}",
-                                'title': attach['video'].get('title')
+                                'type': 'photo',
+                                'url': max(sizes, key=lambda x: x.get('width', 0))['url']
                             })
-                    
-                    return {
-                        'type': 'post',
-                        'text': post.get('text', ''),
-                        'attachments': attachments
-                    }
+                    elif attach['type'] == 'video':
+                        attachments.append({
+                            'type': 'video',
+                            'url': f"https://vk.com/video{attach['video']['owner_id']}_{attach['video']['id']}",
+                            'title': attach['video'].get('title')
+                        })
+                
+                return {
+                    'type': 'post',
+                    'text': post.get('text', ''),
+                    'attachments': attachments
+                }
         except Exception as e:
             logger.error(f"Post parsing failed: {str(e)}")
             raise ValueError("Не удалось получить данные поста")
@@ -0,0 +1,51 @@
+import logging
+import os
+import shutil
+import uuid
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from config import DOWNLOAD_DIR
+
+logger = logging.getLogger(__name__)
+
+# Рабочая папка текущей задачи (задается в process_link)
+_current: ContextVar[Optional[str]] = ContextVar('job_workdir', default=None)
+
+
+def new_workdir(prefix: str = 'job') -> str:
+    """Создает уникальную папку внутри DOWNLOAD_DIR"""
+    path = os.path.abspath(os.path.join(DOWNLOAD_DIR, f"{prefix}_{uuid.uuid4().hex[:12]}"))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def current_workdir() -> str:
+    """
+    Папка текущей задачи. Вне задачи создается отдельная папка,
+    которую потом удалит очистка диска (см. disk_quota.STALE_PATTERNS)
+    """
+    path = _current.get()
+    if path is None:
+        path = new_workdir()
+        _current.set(path)
+    return path
+
+
+@asynccontextmanager
+async def job_workdir(reservation=None):
+    """
+    Своя папка для файлов задачи; удаляется целиком по завершении,
+    поэтому параллельные задачи не видят и не удаляют чужие файлы
+    :param reservation: Резерв disk_manager, который защищает папку от очистки
+    """
+    path = new_workdir()
+    if reservation is not None:
+        reservation.protect(path)
+    token = _current.set(path)
+    try:
+        yield path
+    finally:
+        _current.reset(token)
+        shutil.rmtree(path, ignore_errors=True)
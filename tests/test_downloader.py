@@ -0,0 +1,54 @@
+import pytest
+
+yt_dlp = pytest.importorskip('yt_dlp')
+pytest.importorskip('dotenv')
+
+from services import downloader
+
+MB = 1024 * 1024
+
+
+def fmt(format_id, height, size, ext='mp4', vcodec='avc1.64001f'):
+    return {
+        'format_id': format_id,
+        'url': f"https://example.com/{format_id}.{ext}",
+        'ext': ext,
+        'vcodec': vcodec,
+        'acodec': 'mp4a.40.2',
+        'height': height,
+        'filesize': size,
+    }
+
+
+def make_info(*formats):
+    return {
+        'id': 'clip',
+        'title': 'clip',
+        'duration': 60,
+        'extractor': 'generic',
+        'extractor_key': 'Generic',
+        'webpage_url': 'https://example.com/clip',
+        'formats': list(formats),
+    }
+
+
+def test_download_within_limit_downloads_fitting_format(monkeypatch, tmp_path):
+    downloaded = []
+    opts = {'format': 'best', 'quiet': True, 'outtmpl': str(tmp_path / '%(id)s.%(ext)s')}
+    info = make_info(fmt('low', 360, 10 * MB), fmt('high', 720, 200 * MB))
+    with yt_dlp.YoutubeDL(opts) as ydl:
+        monkeypatch.setattr(ydl, 'process_info', lambda info: downloaded.append(info['format_id']))
+        downloader._download_within_limit(ydl, info)
+
+    assert downloaded == ['low']
+
+
+def test_pick_format_within_prefers_h264_and_spec_container():
+    info = make_info(
+        fmt('avc', 480, 20 * MB),
+        fmt('vp9', 720, 20 * MB, vcodec='vp09.00.40.08'),
+        fmt('mkv', 720, 20 * MB, ext='mkv'),
+    )
+
+    assert downloader.pick_format_within(info, 40 * MB) == 'mkv'
+    assert downloader.pick_format_within(info, 40 * MB, video_ext='mp4') == 'avc'